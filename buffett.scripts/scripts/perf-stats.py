@@ -1,70 +1,203 @@
 #!/usr/bin/env python3
 
-import json
+import argparse
+import http.server
 import sys
+import threading
+import time
 
-stages_data = {}
-
-if len(sys.argv) != 2:
-    print("USAGE: {} <input file>".format(sys.argv[0]))
-    sys.exit(1)
-
-with open(sys.argv[1]) as fh:
-    for line in fh.readlines():
-        if "COUNTER" in line:
-            json_part = line[line.find("{"):]
-            x = json.loads(json_part)
-            counter = x['name']
-            if not (counter in stages_data):
-                stages_data[counter] = {'first_ts': x['now'], 'last_ts': x['now'], 'last_count': 0,
-                                        'data': [], 'max_speed': 0, 'min_speed': 9999999999.0,
-                                        'count': 0,
-                                        'max_speed_ts': 0, 'min_speed_ts': 0}
-            stages_data[counter]['count'] += 1
-            count_since_last = x['counts'] - stages_data[counter]['last_count']
-            time_since_last = float(x['now'] - stages_data[counter]['last_ts'])
-            if time_since_last > 1:
-                speed = 1000.0 * (count_since_last / time_since_last)
-                stages_data[counter]['data'].append(speed)
-                if speed > stages_data[counter]['max_speed']:
-                    stages_data[counter]['max_speed'] = speed
-                    stages_data[counter]['max_speed_ts'] = x['now']
-                if speed < stages_data[counter]['min_speed']:
-                    stages_data[counter]['min_speed'] = speed
-                    stages_data[counter]['min_speed_ts'] = x['now']
-            stages_data[counter]['last_ts'] = x['now']
-            stages_data[counter]['last_count'] = x['counts']
-
-for stage in stages_data.keys():
-    stages_data[stage]['data'].sort()
-    #mean_index = stages_data[stage]['count'] / 2
-    mean = 0
-    average = 0
-    eightieth = 0
-    data_len = len(stages_data[stage]['data'])
-    mean_index = int(data_len / 2)
-    eightieth_index = int(data_len * 0.8)
-    #print("mean idx: {} data.len: {}".format(mean_index, data_len))
-    if data_len > 0:
-        mean = stages_data[stage]['data'][mean_index]
-        average = float(sum(stages_data[stage]['data'])) / data_len
-        eightieth = stages_data[stage]['data'][eightieth_index]
-    print("stage: {} max: {:,.2f} min: {:.2f} count: {} total: {} mean: {:,.2f} average: {:,.2f} 80%: {:,.2f}".format(stage,
-                                                       stages_data[stage]['max_speed'],
-                                                       stages_data[stage]['min_speed'],
-                                                       stages_data[stage]['count'],
-                                                       stages_data[stage]['last_count'],
-                                                       mean, average, eightieth))
-    num = 5
-    idx = -1
-    if data_len >= num:
-        print("    top {}: ".format(num), end='')
-        for x in range(0, num):
-            print("{:,.2f}  ".format(stages_data[stage]['data'][idx]), end='')
-            idx -= 1
-            if stages_data[stage]['data'][idx] < average:
-                break
-        print("")
-    print("    max_ts: {} min_ts: {}".format(stages_data[stage]['max_speed_ts'], stages_data[stage]['min_speed_ts']))
-    print("\n")
+import perfcounters
 
+
+def follow():
+    rates = perfcounters.RollingRates(args.rolling_window)
+    lock = threading.Lock()
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            with lock:
+                body = perfcounters.prometheus_text(rates, perfcounters.read_udp_stats(), args.rolling_window)
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    if args.listen:
+        host, _, port = args.listen.rpartition(':')
+        server = http.server.ThreadingHTTPServer((host or '127.0.0.1', int(port)), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print("serving metrics on http://{}:{}/metrics".format(*server.server_address), file=sys.stderr)
+
+    follower = perfcounters.LogFollower(args.inputs[0], from_start=args.from_start,
+                                        max_read=args.chunk_mb * 1024 * 1024)
+    next_print = time.monotonic() + args.print_interval
+    try:
+        while True:
+            text = follower.read()
+            if text:
+                with lock:
+                    rates.add(text)
+            if args.print_interval > 0 and time.monotonic() >= next_print:
+                next_print = time.monotonic() + args.print_interval
+                with lock:
+                    rows = rates.snapshot()
+                for name, rate, calls, count, _, _ in rows:
+                    if rate is not None:
+                        print("stage: {} rate/s: {:,.2f} calls/s: {:,.2f} total: {}".format(name, rate, calls, count))
+                sys.stdout.flush()
+            if not text:
+                time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        follower.close()
+
+
+def print_stats(stages_data):
+    for stage, data in stages_data.items():
+        rates = data.rates
+        median, p90, p99, p999 = rates.percentiles([0.5, 0.9, 0.99, 0.999])
+        print("stage: {} records: {} total: {} rate samples: {}".format(stage, data.records, data.last_count, rates.n))
+        if rates.n > 0:
+            print("    rate/s mean: {:,.2f} stddev: {:,.2f} min: {:,.2f} median: {:,.2f} p90: {:,.2f} p99: {:,.2f} p99.9: {:,.2f} max: {:,.2f}".format(
+                rates.mean, rates.stddev(), rates.min, median, p90, p99, p999, rates.max))
+            print("    max_ts: {} min_ts: {}".format(rates.max_ts, rates.min_ts))
+        if data.has_samples():
+            calls = data.call_rates
+            per_call = data.events_per_call
+            call_median, call_p99 = calls.percentiles([0.5, 0.99])
+            lograte = data.lograte() if data.lograte() is not None else float('nan')
+            per_call_median, per_call_p99 = per_call.percentiles([0.5, 0.99])
+            print("    calls: {} calls/s mean: {:,.2f} median: {:,.2f} p99: {:,.2f} lograte: {:,.0f} adjusted total: {:,.0f}".format(
+                int(data.total_samples), calls.mean, call_median, call_p99, lograte, data.adjusted_count()))
+            mean_per_call = data.mean_events_per_call()
+            if mean_per_call:
+                print("    events/call mean: {:,.2f} median: {:,.2f} p99: {:,.2f} samples/event: {:,.4f} logged events mean: {:,.2f}".format(
+                    mean_per_call, per_call_median, per_call_p99, 1.0 / mean_per_call, data.logged_events.mean))
+        starts, throughput = data.throughput.rates()
+        if len(throughput) > 0:
+            peak = int(throughput.argmax())
+            print("    throughput/s over {} windows of {}s: mean: {:,.2f} median: {:,.2f} peak: {:,.2f} at {}".format(
+                len(throughput), args.window, throughput.mean(), float(perfcounters.np.median(throughput)),
+                throughput[peak], starts[peak]))
+        print("\n")
+
+
+def pipeline_stages(logs, names):
+    """Returns [(label, [CounterStats])] for --pipeline, or every stage of every log by first record."""
+    if not args.pipeline:
+        stages = [("{}:{}".format(name, stage), [data]) for name, stats in zip(names, logs) for stage, data in stats.items()]
+        return sorted(stages, key=lambda item: item[1][0].first_ts)
+    stages = []
+    for ref in args.pipeline.split(','):
+        log, _, stage = ref.partition(':')
+        if log in names:
+            found = [logs[names.index(log)].get(stage)]
+        elif log.isdigit() and int(log) < len(logs):
+            found = [logs[int(log)].get(stage)]
+        else:
+            found = [stats[ref] for stats in logs if ref in stats]
+        found = [data for data in found if data is not None]
+        if not found:
+            sys.exit("no counter {} in the logs".format(ref))
+        stages.append((ref, found))
+    return stages
+
+
+def print_pipeline(logs, names, window_ms):
+    stages = pipeline_stages(logs, names)
+    if len(stages) < 2:
+        return
+    labels = [label for label, _ in stages]
+    members = [data for _, found in stages for data in found]
+    starts, table = perfcounters.aligned_throughput(members, window_ms)
+    # stages summed over several logs take the sum of their rows
+    rows = []
+    row = 0
+    for _, found in stages:
+        rows.append(table[row:row + len(found)].sum(axis=0))
+        row += len(found)
+    table = perfcounters.np.array(rows)
+
+    max_lag = max(1, int(args.max_lag * 1000 / window_ms))
+    print("pipeline over {} windows of {}s from {} to {}:".format(len(starts), args.window, starts[0], starts[-1]))
+    lags = []
+    for upstream in range(len(labels) - 1):
+        lag, corr = perfcounters.stage_lag(table[upstream], table[upstream + 1], max_lag)
+        lags.append(lag)
+        if lag is None:
+            print("    {} -> {}: no lag (a stage has constant throughput)".format(labels[upstream], labels[upstream + 1]))
+        else:
+            print("    {} -> {}: lag: {:,.0f}ms correlation: {:.2f}".format(
+                labels[upstream], labels[upstream + 1], lag * window_ms, corr))
+
+    worst, ratios = perfcounters.bottlenecks(table, args.bottleneck_threshold, lags)
+    limited = worst >= 0
+    print("bottleneck windows: {} of {}".format(int(limited.sum()), len(worst)))
+    for index, label in enumerate(labels):
+        count = int((worst == index).sum())
+        if count > 0:
+            print("    {}: {} windows ({:.1f}%)".format(label, count, 100.0 * count / len(worst)))
+    # consecutive windows with the same bottleneck are reported as one span
+    edges = perfcounters.np.flatnonzero(perfcounters.np.diff(worst)) + 1
+    for first, end in zip(perfcounters.np.concatenate(([0], edges)), perfcounters.np.concatenate((edges, [len(worst)]))):
+        if worst[first] >= 0:
+            print("    {} - {}: {} at {:.2f} of upstream".format(
+                starts[first], starts[end - 1] + window_ms, labels[worst[first]], float(ratios[first:end].mean())))
+
+
+parser = argparse.ArgumentParser(description="Per stage rate statistics of the COUNTER records in one or more logs")
+parser.add_argument("inputs", nargs='+', help="log files, e.g. of the leader and the validators of one run")
+parser.add_argument("--jobs", type=int, help="processes parsing logs in parallel (default: one per CPU)")
+parser.add_argument("--pipeline",
+                    help="comma separated stages, upstream first, for the lag and bottleneck report of several logs. "
+                         "A stage is LOG:NAME for one log (LOG being the file name or its position from 0) or NAME for "
+                         "the sum over all logs (default: every stage of every log in order of first record)")
+parser.add_argument("--max-lag", type=float, default=10.0,
+                    help="largest stage to stage lag looked for, in seconds (default: %(default)s)")
+parser.add_argument("--bottleneck-threshold", type=float, default=0.8,
+                    help="relative throughput of a stage to its upstream stage below which it is reported as the "
+                         "bottleneck of a window (default: %(default)s)")
+parser.add_argument("--follow", action="store_true",
+                    help="keep reading the log as it grows (and is rotated), serving rolling rates for Prometheus")
+parser.add_argument("--from-start", action="store_true",
+                    help="with --follow, read the existing contents of the log first instead of only new records")
+parser.add_argument("--rolling-window", type=int, default=10,
+                    help="with --follow, seconds the rates are averaged over (default: %(default)s)")
+parser.add_argument("--listen", default="127.0.0.1:9465",
+                    help="with --follow, host:port of the /metrics endpoint, empty to disable (default: %(default)s)")
+parser.add_argument("--print-interval", type=float, default=10.0,
+                    help="with --follow, seconds between rate summaries on stdout, 0 to disable (default: %(default)s)")
+parser.add_argument("--window", type=float, default=1.0,
+                    help="throughput window in seconds (default: %(default)s)")
+parser.add_argument("--chunk-mb", type=int, default=64,
+                    help="size of the pieces the log is scanned in, bounds memory use (default: %(default)s)")
+parser.add_argument("--no-cache", action="store_true",
+                    help="neither read nor write the parsed counter cache kept next to the log")
+args = parser.parse_args()
+
+if args.follow and len(args.inputs) != 1:
+    parser.error("--follow takes a single log")
+
+if args.follow:
+    follow()
+    sys.exit(0)
+
+window_ms = max(1, int(args.window * 1000))
+names = perfcounters.log_names(args.inputs)
+logs = perfcounters.analyze_many(args.inputs, window_ms=window_ms, chunk_size=args.chunk_mb * 1024 * 1024,
+                                 use_cache=not args.no_cache, jobs=args.jobs)
+for name, stages_data in zip(names, logs):
+    if len(logs) > 1:
+        print("log: {}\n".format(name))
+    print_stats(stages_data)
+if len(logs) > 1:
+    print_pipeline(logs, names, window_ms)
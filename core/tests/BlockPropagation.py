@@ -0,0 +1,161 @@
+import os
+import re
+
+from testUtils import Utils
+
+###########################################################################################
+def percentile(sortedValues, pct):
+    """Nearest rank percentile of an already sorted list."""
+    if len(sortedValues) == 0:
+        return None
+    index=int(round(pct / 100.0 * (len(sortedValues) - 1)))
+    return sortedValues[index]
+
+def distribution(values):
+    values=sorted(values)
+    if len(values) == 0:
+        return {"count": 0}
+    return {"count": len(values), "min": values[0], "p50": percentile(values, 50), "p90": percentile(values, 90),
+            "p99": percentile(values, 99), "max": values[-1], "mean": sum(values) / len(values)}
+
+###########################################################################################
+class Topology(object):
+    """p2p connection graph of a local cluster, read from the nodes' config.ini files. Connections are treated as bidirectional."""
+    listenPattern=re.compile(r'^\s*p2p-listen-endpoint\s*=\s*\S*:(\d+)\s*$', re.MULTILINE)
+    peerPattern=re.compile(r'^\s*p2p-peer-address\s*=\s*\S*:(\d+)\s*$', re.MULTILINE)
+
+    def __init__(self, exts):
+        self.neighbors={ext: set() for ext in exts}
+        ports={}
+        peers={}
+        for ext in exts:
+            fileName=Utils.getNodeConfigDir(ext, "config.ini")
+            if not os.path.exists(fileName):
+                continue
+            with open(fileName, "r") as f:
+                config=f.read()
+            m=Topology.listenPattern.search(config)
+            if m is not None:
+                ports[int(m.group(1))]=ext
+            peers[ext]=[int(port) for port in Topology.peerPattern.findall(config)]
+        for ext, peerPorts in peers.items():
+            for port in peerPorts:
+                peer=ports.get(port)
+                if peer is not None and peer != ext:
+                    self.neighbors[ext].add(peer)
+                    self.neighbors[peer].add(ext)
+
+    def hops(self, source):
+        """Breadth first hop distance of every reachable node from source."""
+        distances={source: 0}
+        frontier=[source]
+        while len(frontier) > 0:
+            nextFrontier=[]
+            for ext in frontier:
+                for peer in self.neighbors.get(ext, ()):
+                    if peer not in distances:
+                        distances[peer]=distances[ext] + 1
+                        nextFrontier.append(peer)
+            frontier=nextFrontier
+        return distances
+
+###########################################################################################
+class PropagationTracker(object):
+    """Measures how long blocks take to reach every node, from the "Produced block"/"Received block" lines in the node LogStores.
+    Blocks are keyed by (block num, id prefix as logged) so competing fork blocks are tracked separately.
+    stores: dict of node extension to LogStore; topology: optional Topology used for per hop latencies."""
+    blockPattern=re.compile(r'^(Produced|Received) block (\w+)\.\.\. #(\d+) ')
+
+    def __init__(self, stores, topology=None):
+        self.stores=stores
+        self.topology=topology
+        self.firstSeen={}   # (blockNum, id) -> {ext: timestamp}
+        self.producedBy={}  # (blockNum, id) -> ext
+        self.scannedUntil={}
+
+    def update(self):
+        """Pull in block records logged since the previous update."""
+        for ext, store in self.stores.items():
+            start=self.scannedUntil.get(ext)
+            for record in store.query(start=start, pattern=PropagationTracker.blockPattern):
+                m=PropagationTracker.blockPattern.match(record.message)
+                key=(int(m.group(3)), m.group(2))
+                seen=self.firstSeen.setdefault(key, {})
+                if ext not in seen or record.timestamp < seen[ext]:
+                    seen[ext]=record.timestamp
+                if m.group(1) == "Produced":
+                    self.producedBy[key]=ext
+                if start is None or record.timestamp > start:
+                    start=record.timestamp
+            if start is not None:
+                self.scannedUntil[ext]=start
+
+    def blockLatencies(self):
+        """(blockNum, id) -> {ext: ms after the block was produced} for every block whose producing node was seen."""
+        latencies={}
+        for key, producer in self.producedBy.items():
+            seen=self.firstSeen[key]
+            produced=seen[producer]
+            latencies[key]={ext: (timestamp - produced) * 1000 for ext, timestamp in seen.items() if ext != producer}
+        return latencies
+
+    def nodeLatencies(self):
+        """ext -> list of ms it took each produced block to reach that node."""
+        perNode={}
+        for latencies in self.blockLatencies().values():
+            for ext, ms in latencies.items():
+                perNode.setdefault(ext, []).append(ms)
+        return perNode
+
+    def hopLatencies(self):
+        """hop distance from the producer -> list of ms from the earliest neighbor one hop closer seeing the block to this node seeing it."""
+        perHop={}
+        if self.topology is None:
+            return perHop
+        hopsCache={}
+        for key, producer in self.producedBy.items():
+            seen=self.firstSeen[key]
+            hops=hopsCache.get(producer)
+            if hops is None:
+                hops=hopsCache[producer]=self.topology.hops(producer)
+            for ext, timestamp in seen.items():
+                hop=hops.get(ext)
+                if not hop:
+                    continue
+                upstream=[seen[peer] for peer in self.topology.neighbors[ext] if hops.get(peer) == hop - 1 and peer in seen]
+                if len(upstream) > 0:
+                    perHop.setdefault(hop, []).append((timestamp - min(upstream)) * 1000)
+        return perHop
+
+    def slowNodes(self, factor=2.0, minLatencyMs=50, minBlocks=10):
+        """Nodes whose median latency is at least factor times the median of all node medians (and at least minLatencyMs)."""
+        medians={ext: percentile(sorted(values), 50) for ext, values in self.nodeLatencies().items() if len(values) >= minBlocks}
+        if len(medians) < 2:
+            return []
+        clusterMedian=percentile(sorted(medians.values()), 50)
+        return sorted((ext for ext, median in medians.items() if median >= minLatencyMs and median >= factor * clusterMedian), key=str)
+
+    def report(self):
+        self.update()
+        return {
+            "blocks": len(self.producedBy),
+            "all": distribution([ms for latencies in self.blockLatencies().values() for ms in latencies.values()]),
+            "nodes": {str(ext): distribution(values) for ext, values in self.nodeLatencies().items()},
+            "hops": {hop: distribution(values) for hop, values in self.hopLatencies().items()},
+            "slowNodes": [str(ext) for ext in self.slowNodes()],
+        }
+
+    def printReport(self):
+        report=self.report()
+        def fmt(dist):
+            if dist["count"] == 0:
+                return "no samples"
+            return "count=%d p50=%.0fms p90=%.0fms p99=%.0fms max=%.0fms" % (dist["count"], dist["p50"], dist["p90"], dist["p99"], dist["max"])
+        Utils.Print("Block propagation over %d produced blocks: %s" % (report["blocks"], fmt(report["all"])))
+        for ext, dist in sorted(report["nodes"].items()):
+            Utils.Print("  node %-5s %s" % (ext, fmt(dist)))
+        for hop, dist in sorted(report["hops"].items()):
+            Utils.Print("  hop  %-5d %s" % (hop, fmt(dist)))
+        if len(report["slowNodes"]) > 0:
+            Utils.Print("Consistently slow nodes: %s" % (", ".join(report["slowNodes"])))
+        return report
@@ -18,6 +18,14 @@ from testUtils import Account
 from Node import BlockType
 from Node import Node
 from WalletMgr import WalletMgr
+from MongoClient import MongoClient
+from MongoClient import MongoError
+from KeyPool import KeyPool
+from LogStore import LogStore
+from LogStore import LogIngester
+from ResourceSampler import ResourceSampler
+from BlockPropagation import PropagationTracker
+from BlockPropagation import Topology
 
 # Protocol Feature Setup Policy
 class PFSetupPolicy:
@@ -45,6 +53,9 @@ class Cluster(object):
     __BiosPort=8788
     __LauncherCmdArr=[]
     __bootlog="bitconchio-ignition-wd/bootlog.txt"
+    __logStoreDirName="logstore"
+    __errorDumpWindow=120
+    __resourceReportFile="resource_usage.json"
 
     # pylint: disable=too-many-arguments
     # walletd [True|False] Is kbitconchd running. If not load the wallet plugin
@@ -78,11 +89,11 @@ class Cluster(object):
         self.port=port
         self.walletHost=walletHost
         self.walletPort=walletPort
-        self.mongoEndpointArgs=""
         self.mongoUri=""
+        self.mongoClient=None
         if self.enableMongo:
             self.mongoUri="mongodb://%s:%d/%s" % (mongoHost, mongoPort, mongoDb)
-            self.mongoEndpointArgs += "--host %s --port %d %s" % (mongoHost, mongoPort, mongoDb)
+            self.mongoClient=MongoClient.get(mongoHost, mongoPort, mongoDb)
         self.staging=staging
         # init accounts
         self.defProducerAccounts={}
@@ -98,6 +109,8 @@ class Cluster(object):
         self.useBiosBootFile=False
         self.filesToCleanup=[]
         self.alternateVersionLabels=Cluster.__defaultAlternateVersionLabels()
+        self.logIngesters={}
+        self.resourceSampler=None
 
 
     def setChainStrategy(self, chainSyncStrategy=Utils.SyncReplayTag):
@@ -402,6 +415,8 @@ class Cluster(object):
             return False
 
         self.nodes=nodes
+        self.startLogIngestion()
+        self.startResourceSampler()
 
         if unstartedNodes > 0:
             self.unstartedNodes=self.discoverUnstartedLocalNodes(unstartedNodes, totalNodes)
@@ -420,6 +435,10 @@ class Cluster(object):
             Utils.Print("ERROR: Cluster doesn't seem to be in sync. Some nodes missing block 1")
             return False
 
+        # mongo_db_plugin has wiped the database by now, so indexes created from here on stay
+        if self.enableMongo and not self.ensureMongoIndexes():
+            return False
+
         if PFSetupPolicy.hasPreactivateFeature(pfSetupPolicy):
             Utils.Print("Activate Preactivate Feature.")
             biosNode.activatePreactivateFeature()
@@ -597,49 +616,22 @@ class Cluster(object):
 
     @staticmethod
     def createAccountKeys(count):
+        """Returns count accounts with random names and fresh owner and active key pairs from the shared KeyPool,
+        instead of running "clbitconch create key" twice per account."""
+        pairs=KeyPool.default().take(count*2)
         accounts=[]
-        p = re.compile('Private key: (.+)\nPublic key: (.+)\n', re.MULTILINE)
-        for _ in range(0, count):
-            try:
-                cmd="%s create key --to-console" % (Utils.BitconchClientPath)
-                if Utils.Debug: Utils.Print("cmd: %s" % (cmd))
-                keyStr=Utils.checkOutput(cmd.split())
-                m=p.search(keyStr)
-                if m is None:
-                    Utils.Print("ERROR: Owner key creation regex mismatch")
-                    break
-
-                ownerPrivate=m.group(1)
-                ownerPublic=m.group(2)
-
-                cmd="%s create key --to-console" % (Utils.BitconchClientPath)
-                if Utils.Debug: Utils.Print("cmd: %s" % (cmd))
-                keyStr=Utils.checkOutput(cmd.split())
-                m=p.match(keyStr)
-                if m is None:
-                    Utils.Print("ERROR: Active key creation regex mismatch")
-                    break
-
-                activePrivate=m.group(1)
-                activePublic=m.group(2)
-
-                name=''.join(random.choice(string.ascii_lowercase) for _ in range(12))
-                account=Account(name)
-                account.ownerPrivateKey=ownerPrivate
-                account.ownerPublicKey=ownerPublic
-                account.activePrivateKey=activePrivate
-                account.activePublicKey=activePublic
-                accounts.append(account)
-                if Utils.Debug: Utils.Print("name: %s, key(owner): ['%s', '%s], key(active): ['%s', '%s']" % (name, ownerPublic, ownerPrivate, activePublic, activePrivate))
-
-            except subprocess.CalledProcessError as ex:
-                msg=ex.output.decode("utf-8")
-                Utils.Print("ERROR: Exception during key creation. %s" % (msg))
-                break
+        for i in range(0, count):
+            (ownerPrivate, ownerPublic)=pairs[2*i]
+            (activePrivate, activePublic)=pairs[2*i+1]
 
-        if count != len(accounts):
-            Utils.Print("Account keys creation failed. Expected %d, actual: %d" % (count, len(accounts)))
-            return None
+            name=''.join(random.choice(string.ascii_lowercase) for _ in range(12))
+            account=Account(name)
+            account.ownerPrivateKey=ownerPrivate
+            account.ownerPublicKey=ownerPublic
+            account.activePrivateKey=activePrivate
+            account.activePublicKey=activePublic
+            accounts.append(account)
+            if Utils.Debug: Utils.Print("name: %s, key(owner): ['%s', '%s], key(active): ['%s', '%s']" % (name, ownerPublic, ownerPrivate, activePublic, activePrivate))
 
         return accounts
 
@@ -658,22 +650,11 @@ class Cluster(object):
                 Utils.Print("Account keys creation failed.")
                 return False
 
-        Utils.Print("Importing keys for account %s into wallet %s." % (self.defproduceraAccount.name, wallet.name))
-        if not self.walletMgr.importKey(self.defproduceraAccount, wallet):
-            Utils.Print("ERROR: Failed to import key for account %s" % (self.defproduceraAccount.name))
+        allAccounts=[self.defproduceraAccount, self.defproducerbAccount] + (accounts or [])
+        if not self.walletMgr.importKeys(allAccounts, wallet):
+            Utils.Print("ERROR: Failed to import account keys into wallet %s" % (wallet.name))
             return False
 
-        Utils.Print("Importing keys for account %s into wallet %s." % (self.defproducerbAccount.name, wallet.name))
-        if not self.walletMgr.importKey(self.defproducerbAccount, wallet):
-            Utils.Print("ERROR: Failed to import key for account %s" % (self.defproducerbAccount.name))
-            return False
-
-        for account in accounts:
-            Utils.Print("Importing keys for account %s into wallet %s." % (account.name, wallet.name))
-            if not self.walletMgr.importKey(account, wallet):
-                Utils.Print("ERROR: Failed to import key for account %s" % (account.name))
-                return False
-
         self.accounts=accounts
         return True
 
@@ -1427,13 +1408,114 @@ class Cluster(object):
         files.sort()
         return files
 
-    def dumpErrorDetails(self):
+    def startLogIngestion(self):
+        """Start following the bios and node stderr logs into per node LogStores, so they can be queried while the test runs."""
+        if not self.localCluster:
+            return
+        exts=["bios"] + list(range(0, len(self.nodes)))
+        for ext in exts:
+            if ext in self.logIngesters:
+                continue
+            storeDir=Utils.getNodeDataDir(ext, Cluster.__logStoreDirName)
+            ingester=LogIngester(Utils.getNodeDataDir(ext), LogStore(storeDir))
+            ingester.start()
+            self.logIngesters[ext]=ingester
+
+    def stopLogIngestion(self):
+        for ingester in self.logIngesters.values():
+            ingester.stop()
+        self.logIngesters={}
+
+    def getLogStore(self, ext):
+        """Returns the LogStore for the node extension (node number or "bios"), after pulling in everything logged so far."""
+        ingester=self.logIngesters.get(ext)
+        if ingester is None:
+            return None
+        ingester.poll()
+        return ingester.store
+
+    def __resourceTargets(self):
+        biosNode=getattr(self, "biosNode", None)
+        targets=[]
+        if biosNode is not None:
+            targets.append(("bios", biosNode))
+        for i in range(0, len(self.nodes)):
+            node=self.nodes[i]
+            if isinstance(node, Node) and node is not biosNode:
+                targets.append((i, node))
+        return targets
+
+    def __headBlockNum(self, ext):
+        ingester=self.logIngesters.get(ext)
+        return ingester.headBlockNum if ingester is not None else None
+
+    def startResourceSampler(self, interval=1.0):
+        """Start sampling the cpu, memory, io and state file size of the local nodes every interval seconds."""
+        if not self.localCluster or self.resourceSampler is not None:
+            return
+        self.resourceSampler=ResourceSampler(self.__resourceTargets, self.__headBlockNum, interval=interval)
+        self.resourceSampler.start()
+
+    def stopResourceSampler(self):
+        if self.resourceSampler is not None:
+            self.resourceSampler.stop()
+
+    def reportResourceUsage(self, fileName=None):
+        """Print the per node resource summary and write the per node time series and summaries as json."""
+        if self.resourceSampler is None:
+            return
+        if fileName is None:
+            fileName=os.path.join(Utils.DataDir, Cluster.__resourceReportFile)
+        self.resourceSampler.sample()
+        self.resourceSampler.printSummary()
+        self.resourceSampler.writeReport(fileName)
+        Utils.Print("Node resource usage time series written to %s" % (fileName))
+
+    def createPropagationTracker(self):
+        """Returns a PropagationTracker over the captured node logs, with hop distances from the nodes' p2p configuration."""
+        if len(self.logIngesters) == 0:
+            return None
+        stores={ext: self.getLogStore(ext) for ext in self.logIngesters.keys()}
+        return PropagationTracker(stores, Topology(list(stores.keys())))
+
+    def reportBlockPropagation(self):
+        tracker=self.createPropagationTracker()
+        if tracker is None:
+            return None
+        return tracker.printReport()
+
+    def dumpLogStore(self, ext, windowSeconds):
+        """Print the last windowSeconds of the node log, preceded by any errors logged before that window."""
+        store=self.getLogStore(ext)
+        Utils.Print(Utils.FileDivider)
+        lastTimestamp=store.lastTimestamp()
+        if lastTimestamp is None:
+            Utils.Print("No log records captured for node %s." % (ext))
+            return
+        start=lastTimestamp - windowSeconds
+        errors=store.query(end=start, levels={"error"}, limit=50)
+        if len(errors) > 0:
+            Utils.Print("Errors logged by node %s before the last %d seconds:" % (ext, windowSeconds))
+            for record in errors:
+                print(record)
+        Utils.Print("Last %d seconds of logs for node %s:" % (windowSeconds, ext))
+        for record in store.query(start=start):
+            print(record)
+
+    def dumpErrorDetails(self, windowSeconds=None):
+        """Dump node configs and logs. When the logs were captured into LogStores only the last windowSeconds
+        (default Cluster.__errorDumpWindow) of each node are shown, instead of the whole files."""
+        if windowSeconds is None:
+            windowSeconds=Cluster.__errorDumpWindow
         fileName=Utils.getNodeConfigDir("bios", "config.ini")
         Cluster.dumpErrorDetailImpl(fileName)
-        path=Utils.getNodeDataDir("bios")
-        fileNames=Cluster.__findFiles(path)
-        for fileName in fileNames:
-            Cluster.dumpErrorDetailImpl(fileName)
+        if "bios" in self.logIngesters:
+            self.dumpLogStore("bios", windowSeconds)
+        else:
+            path=Utils.getNodeDataDir("bios")
+            fileNames=Cluster.__findFiles(path)
+            for fileName in fileNames:
+                Cluster.dumpErrorDetailImpl(fileName)
 
         for i in range(0, len(self.nodes)):
             configLocation=Utils.getNodeConfigDir(i)
@@ -1441,6 +1523,9 @@ class Cluster(object):
             Cluster.dumpErrorDetailImpl(fileName)
             fileName=os.path.join(configLocation, "genesis.json")
             Cluster.dumpErrorDetailImpl(fileName)
+            if i in self.logIngesters:
+                self.dumpLogStore(i, windowSeconds)
+                continue
             path=Utils.getNodeDataDir(i)
             fileNames=Cluster.__findFiles(path)
             for fileName in fileNames:
@@ -1497,15 +1582,29 @@ class Cluster(object):
             return False
         return True
 
+    # (collection, field) indexes Node's history lookups rely on; action_traces is queried by receiver and by the
+    # from/to of transfers in getActionsMdb
+    __mongoIndexes=[("transactions", "trx_id"), ("transaction_traces", "id"), ("blocks", "block_num"), ("blocks", "block_id"),
+                    ("action_traces", "receiver"), ("action_traces", "act.data.from"), ("action_traces", "act.data.to")]
+
+    def ensureMongoIndexes(self):
+        """Creates the indexes of the mongo_db_plugin collections the harness queries, unless they already exist."""
+        for collection, key in Cluster.__mongoIndexes:
+            try:
+                created=self.mongoClient.ensureIndex(collection, key)
+            except MongoError as ex:
+                Utils.Print("ERROR: Failed to create mongodb index %s.%s: %s" % (collection, key, ex))
+                return False
+            if Utils.Debug: Utils.Print("mongodb index %s.%s %s" % (collection, key, "created" if created else "already exists"))
+        return True
+
     def isMongodDbRunning(self):
-        cmd="%s %s" % (Utils.MongoPath, self.mongoEndpointArgs)
-        subcommand="db.version()"
-        if Utils.Debug: Utils.Print("echo %s | %s" % (subcommand, cmd))
-        ret,outs,errs=Node.stdinAndCheckOutput(cmd.split(), subcommand)
-        if ret is not 0:
-            Utils.Print("ERROR: Failed to check database version: %s" % (Node.byteArrToStr(errs)) )
+        try:
+            buildInfo=self.mongoClient.command({"buildInfo": 1})
+        except MongoError as ex:
+            Utils.Print("ERROR: Failed to check database version: %s" % (ex))
             return False
-        if Utils.Debug: Utils.Print("MongoDb response: %s" % (outs))
+        if Utils.Debug: Utils.Print("MongoDb version: %s" % (buildInfo.get("version")))
         return True
 
     def waitForNextBlock(self, timeout=None):
@@ -1515,6 +1614,8 @@ class Cluster(object):
         return node.waitForNextBlock(timeout)
 
     def cleanup(self):
+        self.stopResourceSampler()
+        self.stopLogIngestion()
         for f in glob.glob(Utils.DataDir + "node_*"):
             shutil.rmtree(f)
         for f in glob.glob(Utils.ConfigDir + "node_*"):
@@ -1524,12 +1625,11 @@ class Cluster(object):
             os.remove(f)
 
         if self.enableMongo:
-            cmd="%s %s" % (Utils.MongoPath, self.mongoEndpointArgs)
-            subcommand="db.dropDatabase()"
-            if Utils.Debug: Utils.Print("echo %s | %s" % (subcommand, cmd))
-            ret,_,errs=Node.stdinAndCheckOutput(cmd.split(), subcommand)
-            if ret is not 0:
-                Utils.Print("ERROR: Failed to drop database: %s" % (Node.byteArrToStr(errs)) )
+            try:
+                self.mongoClient.command({"dropDatabase": 1})
+            except MongoError as ex:
+                Utils.Print("ERROR: Failed to drop database: %s" % (ex))
+            self.mongoClient.close()
 
 
     # Create accounts and validates that the last transaction is received on root node
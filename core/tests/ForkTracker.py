@@ -0,0 +1,162 @@
+import time
+
+from collections import namedtuple
+
+from testUtils import Utils
+
+###########################################################################################
+class BlockNode(object):
+    """A block in the ForkTracker tree. seenBy maps node name to the time that node first reported the block."""
+    __slots__=("num", "id", "previous", "producer", "seenBy")
+
+    def __init__(self, num, blockId, previous, producer):
+        self.num=num
+        self.id=blockId
+        self.previous=previous
+        self.producer=producer
+        self.seenBy={}
+
+ForkEvent=namedtuple("ForkEvent", "kind nodes forkPoint blockNum time lengths duration")
+
+###########################################################################################
+class ForkTracker(object):
+    """Consumes the block ids reported by several nodes incrementally and keeps them in a block id tree, reporting
+    forks between nodes, switch overs of a node to another branch and fork resolutions as they are observed.
+    Only blocks at or above lib are kept (see prune), so memory follows the reversible window, not the chain length.
+
+    Events (also printed as they happen):
+    fork:     two nodes reported different blocks for the same block num. forkPoint is the first block num that differs.
+    switch:   a node replaced the block it had reported for a block num, i.e. it switched branches.
+    resolved: two nodes that had forked agree again. lengths are the longest branch lengths seen for each node
+              past the fork point and duration is the seconds since the fork was detected."""
+
+    def __init__(self, lib=0, verbose=True):
+        self.lib=lib
+        self.verbose=verbose
+        self.blocks={}      # block id -> BlockNode
+        self.chains={}      # node name -> {block num: block id}
+        self.heads={}       # node name -> highest block num reported
+        self.forks={}       # (name, name) -> [forkPoint, detected time, {name: longest branch length}]
+        self.switching={}   # node name -> id of the last block replaced while switching branches
+        self.events=[]
+
+    def __event(self, kind, nodes, forkPoint, blockNum, now, lengths=None, duration=None):
+        event=ForkEvent(kind, nodes, forkPoint, blockNum, now, lengths, duration)
+        self.events.append(event)
+        if self.verbose:
+            msg="Fork tracker: %s between %s at block %s, fork point %s" % (kind, ", ".join(str(n) for n in nodes), blockNum, forkPoint)
+            if lengths is not None:
+                msg+=", branch lengths %s" % (", ".join("%s=%d" % (n, l) for n, l in sorted(lengths.items(), key=lambda item: str(item[0]))))
+            if duration is not None:
+                msg+=", after %.1f seconds" % (duration)
+            Utils.Print(msg)
+        return event
+
+    def addBlock(self, name, num, blockId, previous, producer=None, now=None):
+        """Record that node name has blockId (with parent previous) at block num."""
+        if num < self.lib:
+            return
+        if now is None:
+            now=time.time()
+        block=self.blocks.get(blockId)
+        if block is None:
+            block=self.blocks[blockId]=BlockNode(num, blockId, previous, producer)
+        block.seenBy.setdefault(name, now)
+
+        chain=self.chains.setdefault(name, {})
+        old=chain.get(num)
+        chain[num]=blockId
+        if num > self.heads.get(name, -1):
+            self.heads[name]=num
+        if old is not None and old != blockId:
+            # only report the first block of a switch, not every block replaced on the way to the new head
+            if self.switching.get(name) is None or self.switching[name] != previous:
+                self.__event("switch", (name,), self.commonAncestorNum(old, blockId) + 1, num, now)
+            self.switching[name]=blockId
+        else:
+            self.switching.pop(name, None)
+
+        for other, otherChain in self.chains.items():
+            if other == name:
+                continue
+            otherId=otherChain.get(num)
+            if otherId is None:
+                continue
+            pair=(name, other) if str(name) < str(other) else (other, name)
+            fork=self.forks.get(pair)
+            if otherId != blockId:
+                if fork is None:
+                    forkPoint=self.commonAncestorNum(otherId, blockId) + 1
+                    self.forks[pair]=[forkPoint, now, {n: self.heads[n] - forkPoint + 1 for n in pair}]
+                    self.__event("fork", pair, forkPoint, num, now)
+            elif fork is not None and num >= fork[0]:
+                # same block at or past the fork point means the whole history below it is shared again
+                del self.forks[pair]
+                self.__event("resolved", pair, fork[0], num, now, lengths=fork[2], duration=now - fork[1])
+
+        for pair, fork in self.forks.items():
+            if name in pair:
+                fork[2][name]=max(fork[2].get(name, 0), self.heads[name] - fork[0] + 1)
+
+    def addBlocks(self, name, blocks, now=None):
+        """Record a list of block dicts (as returned by Node.getBlock/getBlockRange) reported by node name."""
+        for block in blocks:
+            if block is not None:
+                self.addBlock(name, int(block["block_num"]), block["id"], block.get("previous"), block.get("producer"), now=now)
+
+    def commonAncestorNum(self, id0, id1):
+        """Block num of the most recent block shared by the branches ending in id0 and id1, as far as the tree knows them."""
+        block0=self.blocks.get(id0)
+        block1=self.blocks.get(id1)
+        while block0 is not None and block1 is not None and block0.id != block1.id:
+            if block0.num >= block1.num:
+                block0=self.blocks.get(block0.previous)
+            else:
+                block1=self.blocks.get(block1.previous)
+        if block0 is not None and block1 is not None:
+            return block0.num
+        # walked out of the known window, so all that is known is that the branches differ from there up
+        lowest=min(b.num for b in (self.blocks.get(id0), self.blocks.get(id1)) if b is not None)
+        return max(self.lib, lowest) - 1
+
+    def prune(self, lib):
+        """Drop everything below lib, which can no longer fork."""
+        if lib <= self.lib:
+            return
+        self.lib=lib
+        for blockId in [blockId for blockId, block in self.blocks.items() if block.num < lib]:
+            del self.blocks[blockId]
+        for chain in self.chains.values():
+            for num in [num for num in chain if num < lib]:
+                del chain[num]
+
+    def producer(self, name, num):
+        blockId=self.chains.get(name, {}).get(num)
+        return self.blocks[blockId].producer if blockId is not None else None
+
+    def compare(self, name0, name1, start, end):
+        """Compare the blocks the two nodes reported for start..end (exclusive end).
+        Returns (first block num that differs, first block num after that which matches again), using None for not found."""
+        chain0=self.chains.get(name0, {})
+        chain1=self.chains.get(name1, {})
+        firstDivergence=None
+        for num in range(start, end):
+            same=chain0.get(num) == chain1.get(num)
+            if firstDivergence is None:
+                if not same:
+                    firstDivergence=num
+            elif same:
+                return (firstDivergence, num)
+        return (firstDivergence, None)
+
+    def describe(self, name, start, end, other=None):
+        """"num->producer" list of what node name reported for start..end, marking the blocks that differ from node other with *."""
+        chain=self.chains.get(name, {})
+        otherChain=self.chains.get(other, {}) if other is not None else None
+        items=[]
+        for num in range(start, end):
+            blockId=chain.get(num)
+            producer=self.blocks[blockId].producer if blockId is not None else None
+            diff="*" if otherChain is not None and otherChain.get(num) != blockId else ""
+            items.append("%d->%s%s" % (num, producer, diff))
+        return ", ".join(items)
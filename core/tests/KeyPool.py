@@ -0,0 +1,349 @@
+import fcntl
+import hashlib
+import os
+import secrets
+import stat
+import struct
+import threading
+
+from testUtils import Utils
+
+###########################################################################################
+# secp256k1 key pairs in the formats clbitconch prints: private keys in WIF and public keys as
+# BCC + base58(compressed point + first 4 bytes of its ripemd160), see fc/crypto/public_key.cpp
+
+P=2**256 - 2**32 - 977
+N=0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G=(0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798, 0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+
+PublicKeyPrefix="BCC"
+Base58Alphabet="123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+def base58Encode(data):
+    num=int.from_bytes(data, "big")
+    chars=[]
+    while num > 0:
+        num, rem=divmod(num, 58)
+        chars.append(Base58Alphabet[rem])
+    pad=len(data) - len(data.lstrip(b"\0"))
+    return "1"*pad + "".join(reversed(chars))
+
+def base58Decode(text):
+    num=0
+    for c in text:
+        num=num*58 + Base58Alphabet.index(c)
+    pad=len(text) - len(text.lstrip("1"))
+    body=num.to_bytes((num.bit_length() + 7) // 8, "big") if num > 0 else b""
+    return b"\0"*pad + body
+
+def _ripemd160Fallback(data):
+    """Pure python RIPEMD-160, for OpenSSL builds that no longer provide it through hashlib."""
+    def rol(x, n):
+        return ((x << n) | (x >> (32 - n))) & 0xffffffff
+    fs=(lambda x, y, z: x ^ y ^ z,
+        lambda x, y, z: (x & y) | (~x & z),
+        lambda x, y, z: (x | ~y) ^ z,
+        lambda x, y, z: (x & z) | (y & ~z),
+        lambda x, y, z: x ^ (y | ~z))
+    kl=(0x00000000, 0x5A827999, 0x6ED9EBA1, 0x8F1BBCDC, 0xA953FD4E)
+    kr=(0x50A28BE6, 0x5C4DD124, 0x6D703EF3, 0x7A6D76E9, 0x00000000)
+    rl=(0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 7, 4, 13, 1, 10, 6, 15, 3, 12, 0, 9, 5, 2, 14, 11, 8,
+        3, 10, 14, 4, 9, 15, 8, 1, 2, 7, 0, 6, 13, 11, 5, 12, 1, 9, 11, 10, 0, 8, 12, 4, 13, 3, 7, 15, 14, 5, 6, 2,
+        4, 0, 5, 9, 7, 12, 2, 10, 14, 1, 3, 8, 11, 6, 15, 13)
+    rr=(5, 14, 7, 0, 9, 2, 11, 4, 13, 6, 15, 8, 1, 10, 3, 12, 6, 11, 3, 7, 0, 13, 5, 10, 14, 15, 8, 12, 4, 9, 1, 2,
+        15, 5, 1, 3, 7, 14, 6, 9, 11, 8, 12, 2, 10, 0, 4, 13, 8, 6, 4, 1, 3, 11, 15, 0, 5, 12, 2, 13, 9, 7, 10, 14,
+        12, 15, 10, 4, 1, 5, 8, 7, 6, 2, 13, 14, 0, 3, 9, 11)
+    sl=(11, 14, 15, 12, 5, 8, 7, 9, 11, 13, 14, 15, 6, 7, 9, 8, 7, 6, 8, 13, 11, 9, 7, 15, 7, 12, 15, 9, 11, 7, 13, 12,
+        11, 13, 6, 7, 14, 9, 13, 15, 14, 8, 13, 6, 5, 12, 7, 5, 11, 12, 14, 15, 14, 15, 9, 8, 9, 14, 5, 6, 8, 6, 5, 12,
+        9, 15, 5, 11, 6, 8, 13, 12, 5, 12, 13, 14, 11, 8, 5, 6)
+    sr=(8, 9, 9, 11, 13, 15, 15, 5, 7, 7, 8, 11, 14, 14, 12, 6, 9, 13, 15, 7, 12, 8, 9, 11, 7, 7, 12, 7, 6, 15, 13, 11,
+        9, 7, 15, 11, 8, 6, 6, 14, 12, 13, 5, 14, 13, 13, 7, 5, 15, 5, 8, 11, 14, 14, 6, 14, 6, 9, 12, 9, 12, 5, 15, 8,
+        8, 5, 12, 9, 12, 5, 14, 6, 8, 13, 6, 5, 15, 13, 11, 11)
+    h=[0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476, 0xC3D2E1F0]
+    msg=data + b"\x80" + b"\0"*((55 - len(data)) % 64) + struct.pack("<Q", 8*len(data))
+    for offset in range(0, len(msg), 64):
+        x=struct.unpack("<16I", msg[offset:offset + 64])
+        al, bl, cl, dl, el=h
+        ar, br, cr, dr, er=h
+        for j in range(80):
+            r=j // 16
+            t=(rol((al + fs[r](bl, cl, dl) + x[rl[j]] + kl[r]) & 0xffffffff, sl[j]) + el) & 0xffffffff
+            al, el, dl, cl, bl=el, dl, rol(cl, 10), bl, t
+            t=(rol((ar + fs[4 - r](br, cr, dr) + x[rr[j]] + kr[r]) & 0xffffffff, sr[j]) + er) & 0xffffffff
+            ar, er, dr, cr, br=er, dr, rol(cr, 10), br, t
+        t=(h[1] + cl + dr) & 0xffffffff
+        h[1]=(h[2] + dl + er) & 0xffffffff
+        h[2]=(h[3] + el + ar) & 0xffffffff
+        h[3]=(h[4] + al + br) & 0xffffffff
+        h[4]=(h[0] + bl + cr) & 0xffffffff
+        h[0]=t
+    return struct.pack("<5I", *h)
+
+def ripemd160(data):
+    try:
+        return hashlib.new("ripemd160", data).digest()
+    except ValueError:
+        return _ripemd160Fallback(data)
+
+def _affineAdd(p1, p2):
+    if p1 == p2:
+        slope=3*p1[0]*p1[0]*pow(2*p1[1], P - 2, P) % P
+    else:
+        slope=(p2[1] - p1[1])*pow(p2[0] - p1[0], P - 2, P) % P
+    x=(slope*slope - p1[0] - p2[0]) % P
+    return (x, (slope*(p1[0] - x) - p1[1]) % P)
+
+_combTable=None
+
+def _comb():
+    """table[i][j] is j*256^i*G, so a private key is turned into its public key with one addition per byte."""
+    global _combTable
+    if _combTable is None:
+        table=[]
+        base=G
+        for _ in range(32):
+            row=[None, base]
+            for _ in range(2, 256):
+                row.append(_affineAdd(row[-1], base))
+            table.append(row)
+            base=_affineAdd(row[-1], base)
+        _combTable=table
+    return _combTable
+
+def publicKeyPoint(secret):
+    table=_comb()
+    x=y=z=None
+    for i, byte in enumerate(secret.to_bytes(32, "little")):
+        if byte == 0:
+            continue
+        (x2, y2)=table[i][byte]
+        if z is None:
+            (x, y, z)=(x2, y2, 1)
+            continue
+        # mixed jacobian + affine addition. The sum so far is below 256^i, and the point added is byte*256^i with
+        # the whole secret below N, so the two are never the same point or each other's negation
+        zz=z*z % P
+        h=(x2*zz - x) % P
+        r=(y2*zz*z - y) % P
+        hh=h*h % P
+        hhh=h*hh % P
+        v=x*hh % P
+        x=(r*r - hhh - 2*v) % P
+        y=(r*(v - x) - y*hhh) % P
+        z=z*h % P
+    zInv=pow(z, P - 2, P)
+    zInv2=zInv*zInv % P
+    return (x*zInv2 % P, y*zInv2*zInv % P)
+
+def privateKeyToWif(secret):
+    data=b"\x80" + secret.to_bytes(32, "big")
+    return base58Encode(data + hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4])
+
+def wifToSecret(wif):
+    data=base58Decode(wif)
+    assert len(data) == 37 and data[0] == 0x80, "not a WIF private key: %s" % (wif)
+    assert hashlib.sha256(hashlib.sha256(data[:33]).digest()).digest()[:4] == data[33:], "bad checksum in WIF private key: %s" % (wif)
+    return int.from_bytes(data[1:33], "big")
+
+def publicKeyToStr(point, prefix=PublicKeyPrefix):
+    compressed=(b"\x03" if point[1] & 1 else b"\x02") + point[0].to_bytes(32, "big")
+    return prefix + base58Encode(compressed + ripemd160(compressed)[:4])
+
+def wifToPublicKey(wif, prefix=PublicKeyPrefix):
+    return publicKeyToStr(publicKeyPoint(wifToSecret(wif)), prefix)
+
+def createKeyPair(prefix=PublicKeyPrefix):
+    """Returns a new (private key, public key) pair as strings, like "clbitconch create key --to-console" prints them."""
+    secret=secrets.randbelow(N - 1) + 1
+    return (privateKeyToWif(secret), publicKeyToStr(publicKeyPoint(secret), prefix))
+
+def isCanonical(compact):
+    """The check nodebitconch applies to the r and s of a compact signature (fc::crypto is_canonical)."""
+    return (not (compact[1] & 0x80) and not (compact[1] == 0 and not (compact[2] & 0x80))
+            and not (compact[33] & 0x80) and not (compact[33] == 0 and not (compact[34] & 0x80)))
+
+def signDigest(secret, digest):
+    """Returns the canonical, recoverable signature of the 32 byte digest as a SIG_K1_ string."""
+    z=int.from_bytes(digest, "big")
+    while True:
+        k=secrets.randbelow(N - 1) + 1
+        (rx, ry)=publicKeyPoint(k)
+        r=rx % N
+        if r == 0:
+            continue
+        s=pow(k, N - 2, N)*(z + r*secret) % N
+        if s == 0:
+            continue
+        recId=(ry & 1) | (2 if rx >= N else 0)
+        if s > N // 2:
+            s=N - s
+            recId^=1
+        # 27 + 4 marks a compressed public key, the way libsecp256k1's compact signatures are stored by fc
+        compact=bytes([27 + 4 + recId]) + r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        if isCanonical(compact):
+            return "SIG_K1_" + base58Encode(compact + ripemd160(compact + b"K1")[:4])
+
+def _pointAdd(p1, p2):
+    if p1 is None:
+        return p2
+    if p2 is None:
+        return p1
+    if p1[0] == p2[0] and (p1[1] + p2[1]) % P == 0:
+        return None
+    return _affineAdd(p1, p2)
+
+def _pointMultiply(point, k):
+    result=None
+    while k:
+        if k & 1:
+            result=_pointAdd(result, point)
+        point=_pointAdd(point, point)
+        k>>=1
+    return result
+
+def recoverPublicKey(digest, signature, prefix=PublicKeyPrefix):
+    """The public key whose private key made signature, a SIG_K1_ string, of the 32 byte digest."""
+    data=base58Decode(signature[len("SIG_K1_"):])
+    assert signature.startswith("SIG_K1_") and len(data) == 69, "not a K1 signature: %s" % (signature)
+    assert ripemd160(data[:65] + b"K1")[:4] == data[65:], "bad checksum in signature: %s" % (signature)
+    recId=data[0] - 27 - 4
+    r=int.from_bytes(data[1:33], "big")
+    s=int.from_bytes(data[33:65], "big")
+    x=r + (recId >> 1)*N
+    y=pow((x*x*x + 7) % P, (P + 1) // 4, P)
+    if (y & 1) != (recId & 1):
+        y=P - y
+    rInv=pow(r, N - 2, N)
+    z=int.from_bytes(digest, "big")
+    point=_pointAdd(_pointMultiply((x, y), s*rInv % N), _pointMultiply(G, -z*rInv % N))
+    return publicKeyToStr(point, prefix)
+
+###########################################################################################
+class KeyPool(object):
+    """Key pairs generated ahead of time and kept in a file shared by the test processes, one "private public" pair
+    per line. A pair is removed from the file when it is handed out so every caller gets fresh keys. When the pool
+    drops below lowWatermark a background thread refills it up to highWatermark. The pool holds private keys, so it
+    lives in a directory only its user can enter and a pool, lock or directory owned by someone else is refused."""
+    DefaultPath=os.environ.get("BITCONCH_TEST_KEY_POOL", os.path.join(os.path.expanduser("~/.cache"), "bitconch", "test-key-pool", "keys.txt"))
+    BatchSize=50
+    __default=None
+
+    def __init__(self, path=DefaultPath, lowWatermark=200, highWatermark=1000, prefix=PublicKeyPrefix):
+        self.path=path
+        self.lockPath=path + ".lock"
+        self.lowWatermark=lowWatermark
+        self.highWatermark=highWatermark
+        self.prefix=prefix
+        self.refillThread=None
+        self.threadLock=threading.Lock()
+
+    @staticmethod
+    def default():
+        if KeyPool.__default is None:
+            KeyPool.__default=KeyPool()
+        return KeyPool.__default
+
+    @staticmethod
+    def __checkOwner(path, st):
+        if st.st_uid != os.getuid():
+            raise PermissionError("%s is owned by uid %d, not by the current user" % (path, st.st_uid))
+
+    def __open(self, path, flags):
+        """Opens path for the current user only, refusing a symlink or a file another user owns or can access."""
+        directory=os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st=os.stat(directory)
+        KeyPool.__checkOwner(directory, st)
+        if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise PermissionError("%s is writable by other users" % (directory))
+        fd=os.open(path, flags | os.O_NOFOLLOW | os.O_CLOEXEC, 0o600)
+        try:
+            st=os.fstat(fd)
+            KeyPool.__checkOwner(path, st)
+            if st.st_mode & 0o077:
+                raise PermissionError("%s is accessible by other users (mode %o)" % (path, stat.S_IMODE(st.st_mode)))
+        except OSError:
+            os.close(fd)
+            raise
+        return os.fdopen(fd, "r" if flags & os.O_ACCMODE == os.O_RDONLY else "a")
+
+    def __locked(self):
+        lockFile=self.__open(self.lockPath, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        return lockFile
+
+    def __read(self):
+        pairs=[]
+        try:
+            with self.__open(self.path, os.O_RDONLY) as f:
+                for line in f:
+                    parts=line.split()
+                    # drops what is left of a line a killed process was writing
+                    if len(parts) == 2 and parts[1].startswith(self.prefix):
+                        pairs.append((parts[0], parts[1]))
+        except FileNotFoundError:
+            pass
+        return pairs
+
+    def __write(self, pairs):
+        tempPath="%s.%d.tmp" % (self.path, os.getpid())
+        with self.__open(tempPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC) as f:
+            f.writelines("%s %s\n" % pair for pair in pairs)
+        os.replace(tempPath, self.path)
+
+    def size(self):
+        with self.__locked():
+            return len(self.__read())
+
+    def take(self, count):
+        """Returns count (private key, public key) pairs that have not been handed out before."""
+        try:
+            with self.__locked():
+                pairs=self.__read()
+                taken=pairs[:count]
+                self.__write(pairs[count:])
+                remaining=len(pairs) - len(taken)
+        except OSError as ex:
+            Utils.Print("WARNING: key pool %s is not usable, generating keys in memory. %s" % (self.path, ex))
+            taken=[]
+            remaining=None
+        if len(taken) < count:
+            if Utils.Debug: Utils.Print("Key pool %s had %d of %d key pairs, generating the rest" % (self.path, len(taken), count))
+            taken+=[createKeyPair(self.prefix) for _ in range(count - len(taken))]
+        if remaining is not None and remaining < self.lowWatermark:
+            self.refillInBackground()
+        return taken
+
+    def refill(self, target=None):
+        """Generates key pairs until the pool holds target (highWatermark by default) of them."""
+        if target is None:
+            target=self.highWatermark
+        while True:
+            with self.__locked():
+                missing=target - len(self.__read())
+            if missing <= 0:
+                return
+            batch=[createKeyPair(self.prefix) for _ in range(min(missing, KeyPool.BatchSize))]
+            with self.__locked():
+                with self.__open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND) as f:
+                    f.write("".join("%s %s\n" % pair for pair in batch))
+
+    def refillInBackground(self):
+        with self.threadLock:
+            if self.refillThread is not None and self.refillThread.is_alive():
+                return
+            self.refillThread=threading.Thread(target=self.__refillQuietly, name="KeyPool refill", daemon=True)
+            self.refillThread.start()
+
+    def __refillQuietly(self):
+        try:
+            self.refill()
+        except OSError as ex:
+            Utils.Print("WARNING: could not refill key pool %s. %s" % (self.path, ex))
+
+    def join(self):
+        """Waits for a background refill to finish."""
+        with self.threadLock:
+            thread=self.refillThread
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,302 @@
+import calendar
+import hashlib
+import http.server
+import json
+import secrets
+import struct
+import threading
+import time
+
+import KeyPool
+from testUtils import Utils
+
+###########################################################################################
+# transaction serialization, enough to compute the digest kbitconchd signs for the JSON form clbitconch sends it
+
+NameChars=".12345abcdefghijklmnopqrstuvwxyz"
+
+def nameToInt(name):
+    value=0
+    for i in range(13):
+        c=NameChars.index(name[i]) if i < len(name) else 0
+        if i < 12:
+            value|=(c & 0x1f) << (64 - 5*(i + 1))
+        else:
+            value|=c & 0x0f
+    return value
+
+def packVarUint32(value):
+    out=bytearray()
+    while True:
+        byte=value & 0x7f
+        value>>=7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+def packBytes(data):
+    return packVarUint32(len(data)) + data
+
+def packTimePointSec(text):
+    text=text.split(".")[0].rstrip("Z")
+    return struct.pack("<I", calendar.timegm(time.strptime(text, "%Y-%m-%dT%H:%M:%S")))
+
+def packAction(action):
+    data=action.get("hex_data", action["data"])
+    out=struct.pack("<QQ", nameToInt(action["account"]), nameToInt(action["name"]))
+    out+=packVarUint32(len(action["authorization"]))
+    for auth in action["authorization"]:
+        out+=struct.pack("<QQ", nameToInt(auth["actor"]), nameToInt(auth["permission"]))
+    return out + packBytes(bytes.fromhex(data))
+
+def packExtensions(extensions):
+    out=packVarUint32(len(extensions))
+    for extension in extensions:
+        (extType, data)=(extension["type"], extension["data"]) if isinstance(extension, dict) else extension
+        out+=struct.pack("<H", extType) + packBytes(bytes.fromhex(data))
+    return out
+
+def packTransaction(trx):
+    """The binary form of the transaction part of a signed transaction in its JSON form (action data as hex)."""
+    out=packTimePointSec(trx["expiration"])
+    out+=struct.pack("<HI", trx["ref_block_num"], trx["ref_block_prefix"])
+    out+=packVarUint32(trx.get("max_net_usage_words", 0)) + struct.pack("<B", trx.get("max_cpu_usage_ms", 0))
+    out+=packVarUint32(trx.get("delay_sec", 0))
+    for actions in (trx.get("context_free_actions", []), trx["actions"]):
+        out+=packVarUint32(len(actions)) + b"".join(packAction(action) for action in actions)
+    return out + packExtensions(trx.get("transaction_extensions", []))
+
+def signingDigest(chainId, trx):
+    contextFreeData=trx.get("context_free_data", [])
+    if contextFreeData:
+        packed=packVarUint32(len(contextFreeData)) + b"".join(packBytes(bytes.fromhex(data)) for data in contextFreeData)
+        cfdDigest=hashlib.sha256(packed).digest()
+    else:
+        cfdDigest=bytes(32)
+    return hashlib.sha256(bytes.fromhex(chainId) + packTransaction(trx) + cfdDigest).digest()
+
+###########################################################################################
+class KeystoreError(Exception):
+    """A failure reported the way kbitconchd reports it, so clbitconch prints the same messages."""
+    def __init__(self, code, name, what, detail):
+        Exception.__init__(self, detail)
+        self.code=code
+        self.name=name
+        self.what=what
+        self.detail=detail
+
+    def toJson(self):
+        return {"code": 500, "message": "Internal Service Error",
+                "error": {"code": self.code, "name": self.name, "what": self.what,
+                          "details": [{"message": self.detail, "file": "", "line_number": 0, "method": ""}]}}
+
+class LocalWallet(object):
+    __slots__=("name", "password", "locked", "keys")
+
+    def __init__(self, name, password):
+        self.name=name
+        self.password=password
+        self.locked=False
+        self.keys={}      # public key -> private key
+
+###########################################################################################
+class LocalKeystore(object):
+    """In memory stand in for kbitconchd holding the keys of the test accounts. It serves the /v1/wallet API so
+    clbitconch signs through it unchanged with --wallet-url, and the harness imports keys with plain method calls
+    instead of a clbitconch process per key."""
+
+    def __init__(self):
+        self.wallets={}
+        self.lock=threading.Lock()
+        self.server=None
+        self.thread=None
+
+    def __wallet(self, name, unlocked=True):
+        wallet=self.wallets.get(name)
+        if wallet is None:
+            raise KeystoreError(3120006, "wallet_nonexistent_exception", "Nonexistent wallet", "Wallet not found: %s" % (name))
+        if unlocked and wallet.locked:
+            raise KeystoreError(3120003, "wallet_locked_exception", "Locked wallet", "Wallet is locked: %s" % (name))
+        return wallet
+
+    def create(self, name):
+        with self.lock:
+            if name in self.wallets:
+                raise KeystoreError(3120001, "wallet_exist_exception", "Wallet already exists", "Wallet with name: '%s' already exists" % (name))
+            password="PW" + KeyPool.privateKeyToWif(secrets.randbelow(KeyPool.N - 1) + 1)
+            self.wallets[name]=LocalWallet(name, password)
+            return password
+
+    def importKeys(self, name, privateKeys, ignoreExisting=False):
+        """Imports the WIF privateKeys, returns the public keys of those that were already in the wallet."""
+        pairs=[(KeyPool.wifToPublicKey(privateKey), privateKey) for privateKey in privateKeys]
+        existing=[]
+        with self.lock:
+            wallet=self.__wallet(name)
+            for publicKey, privateKey in pairs:
+                if publicKey in wallet.keys:
+                    if not ignoreExisting:
+                        raise KeystoreError(3120002, "key_exist", "Key already exists", "Key already in wallet")
+                    existing.append(publicKey)
+                wallet.keys[publicKey]=privateKey
+        return existing
+
+    def createKey(self, name):
+        (privateKey, publicKey)=KeyPool.createKeyPair()
+        with self.lock:
+            self.__wallet(name).keys[publicKey]=privateKey
+        return publicKey
+
+    def removeKey(self, name, password, publicKey):
+        with self.lock:
+            wallet=self.__checkPassword(name, password)
+            if wallet.keys.pop(publicKey, None) is None:
+                raise KeystoreError(3120004, "key_nonexistent_exception", "Nonexistent key", "Key not in wallet")
+
+    def __checkPassword(self, name, password):
+        wallet=self.__wallet(name, unlocked=False)
+        if wallet.password != password:
+            raise KeystoreError(3120005, "wallet_invalid_password_exception", "Invalid wallet password", "Invalid password for wallet: \"%s\"" % (name))
+        return wallet
+
+    def lockWallet(self, name):
+        with self.lock:
+            self.__wallet(name, unlocked=False).locked=True
+
+    def lockAll(self):
+        with self.lock:
+            for wallet in self.wallets.values():
+                wallet.locked=True
+
+    def unlock(self, name, password):
+        with self.lock:
+            wallet=self.__checkPassword(name, password)
+            if not wallet.locked:
+                raise KeystoreError(3120007, "wallet_unlocked_exception", "Already unlocked", "Wallet is already unlocked: %s" % (name))
+            wallet.locked=False
+
+    def listWallets(self):
+        with self.lock:
+            return [name if wallet.locked else name + " *" for name, wallet in self.wallets.items()]
+
+    def listKeys(self, name, password):
+        with self.lock:
+            wallet=self.__checkPassword(name, password)
+            if wallet.locked:
+                raise KeystoreError(3120003, "wallet_locked_exception", "Locked wallet", "Wallet is locked: %s" % (name))
+            return [[publicKey, privateKey] for publicKey, privateKey in wallet.keys.items()]
+
+    def __unlockedKeys(self):
+        keys={}
+        for wallet in self.wallets.values():
+            if not wallet.locked:
+                keys.update(wallet.keys)
+        return keys
+
+    def getPublicKeys(self):
+        with self.lock:
+            if all(wallet.locked for wallet in self.wallets.values()):
+                raise KeystoreError(3120011, "wallet_not_available_exception", "No available wallet", "You don't have any unlocked wallet!")
+            return list(self.__unlockedKeys())
+
+    def __privateKey(self, publicKey):
+        with self.lock:
+            privateKey=self.__unlockedKeys().get(publicKey)
+        if privateKey is None:
+            raise KeystoreError(3120004, "key_nonexistent_exception", "Nonexistent key", "Public key not found in unlocked wallets %s" % (publicKey))
+        return KeyPool.wifToSecret(privateKey)
+
+    def signTransaction(self, trx, publicKeys, chainId):
+        """Adds the signatures of publicKeys to trx, the JSON form of a signed transaction, and returns it."""
+        digest=signingDigest(chainId, trx)
+        keys=[self.__privateKey(publicKey) for publicKey in publicKeys]
+        trx["signatures"]=list(trx.get("signatures", [])) + [KeyPool.signDigest(secret, digest) for secret in keys]
+        return trx
+
+    def signDigest(self, digest, publicKey):
+        return KeyPool.signDigest(self.__privateKey(publicKey), bytes.fromhex(digest))
+
+    def call(self, api, params):
+        """Handles one /v1/wallet/<api> request with its JSON params, returns the JSON result."""
+        if api == "create":
+            return self.create(params)
+        if api == "open":
+            self.__wallet(params, unlocked=False)
+            return {}
+        if api == "lock":
+            self.lockWallet(params)
+            return {}
+        if api == "lock_all":
+            self.lockAll()
+            return {}
+        if api == "unlock":
+            self.unlock(params[0], params[1])
+            return {}
+        if api == "import_key":
+            self.importKeys(params[0], [params[1]])
+            return {}
+        if api == "remove_key":
+            self.removeKey(params[0], params[1], params[2])
+            return {}
+        if api == "create_key":
+            return self.createKey(params[0])
+        if api == "list_wallets":
+            return self.listWallets()
+        if api == "list_keys":
+            return self.listKeys(params[0], params[1])
+        if api == "get_public_keys":
+            return self.getPublicKeys()
+        if api == "set_timeout":
+            return {}
+        if api == "sign_transaction":
+            return self.signTransaction(params[0], params[1], params[2])
+        if api == "sign_digest":
+            return self.signDigest(params[0], params[1])
+        return None
+
+    def start(self, host, port):
+        keystore=self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version="HTTP/1.1"
+
+            def do_POST(self):
+                length=int(self.headers.get("Content-Length", 0))
+                body=self.rfile.read(length) if length > 0 else b""
+                prefix="/v1/wallet/"
+                status=200
+                try:
+                    params=json.loads(body.decode("utf-8")) if body.strip() else None
+                    result=keystore.call(self.path[len(prefix):], params) if self.path.startswith(prefix) else None
+                    if result is None:
+                        status=404
+                        result={"code": 404, "message": "Not Found", "error": {"code": 0, "name": "exception", "what": "unspecified", "details": [{"message": "Unknown Endpoint"}]}}
+                except KeystoreError as ex:
+                    status=500
+                    result=ex.toJson()
+                except (ValueError, KeyError, IndexError, TypeError) as ex:
+                    status=500
+                    result=KeystoreError(3, "parse_error_exception", "Parse Error", "%s: %s" % (type(ex).__name__, ex)).toJson()
+                out=json.dumps(result).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            do_GET=do_POST
+
+            def log_message(self, format, *args):
+                if Utils.Debug: Utils.Print("local keystore: " + format % args)
+
+        self.server=http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads=True
+        self.thread=threading.Thread(target=self.server.serve_forever, name="LocalKeystore", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server=None
+            self.thread=None
@@ -0,0 +1,270 @@
+import bisect
+import calendar
+import glob
+import gzip
+import json
+import os
+import re
+import threading
+import time
+
+from testUtils import Utils
+
+###########################################################################################
+class LogRecord(object):
+    """One parsed nodebitconch log line. timestamp is UTC epoch seconds, blockNum is None when the message has no block."""
+    __slots__=("timestamp", "level", "thread", "source", "method", "message", "blockNum")
+
+    def __init__(self, timestamp, level, thread, source, method, message, blockNum=None):
+        self.timestamp=timestamp
+        self.level=level
+        self.thread=thread
+        self.source=source
+        self.method=method
+        self.message=message
+        self.blockNum=blockNum
+
+    def toArr(self):
+        return [self.timestamp, self.level, self.thread, self.source, self.method, self.blockNum, self.message]
+
+    @staticmethod
+    def fromArr(arr):
+        return LogRecord(arr[0], arr[1], arr[2], arr[3], arr[4], arr[6], arr[5])
+
+    def __str__(self):
+        return "%-5s %s %-9s %-29s %-20s ] %s" % (self.level, LogRecord.timestampToStr(self.timestamp), self.thread, self.source, self.method, self.message)
+
+    @staticmethod
+    def timestampToStr(timestamp):
+        millis=int(round(timestamp*1000))
+        return "%s.%03d" % (time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(millis // 1000)), millis % 1000)
+
+###########################################################################################
+class LogParser(object):
+    """Parses the fc console appender format: "<level> <timestamp> <thread> <file>:<line> <method> ] <message>"."""
+    linePattern=re.compile(r'^(\w+)\s+(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)\.(\d{3})\s+(\S+)\s+(\S+?:\s*\d+)\s+(?:(\S+)\s+)?\]\s?(.*)$')
+    blockNumPattern=re.compile(r'#(\d+)')
+
+    def __init__(self):
+        self.last=None
+
+    def parse(self, line):
+        """Returns a new LogRecord, or None if the line was a continuation of the previous record."""
+        m=LogParser.linePattern.match(line)
+        if m is None:
+            if self.last is not None:
+                self.last.message+="\n" + line
+            return None
+
+        (level, year, month, day, hour, minute, second, millis, thread, source, method, message)=m.groups()
+        timestamp=calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second), 0, 0, 0)) + int(millis)/1000.0
+        source=source.replace(" ", "")
+        blockNum=None
+        bm=LogParser.blockNumPattern.search(message)
+        if bm is not None:
+            blockNum=int(bm.group(1))
+        self.last=LogRecord(timestamp, level, thread, source, method or "", message, blockNum)
+        return self.last
+
+###########################################################################################
+class LogStore(object):
+    """Stores LogRecords in gzip compressed, time-indexed segment files under storeDir and answers range/grep queries.
+    Records that have not been rolled into a segment yet are kept in memory and are included in queries."""
+    __indexFile="index.json"
+
+    def __init__(self, storeDir, segmentRecords=10000, segmentSeconds=60):
+        self.storeDir=storeDir
+        self.segmentRecords=segmentRecords
+        self.segmentSeconds=segmentSeconds
+        self.segments=[]    # dicts ordered by "first": path, first, last, minBlock, maxBlock, count
+        self.segmentFirsts=[]
+        self.pending=[]
+        self.lock=threading.Lock()
+        if not os.path.exists(self.storeDir):
+            os.makedirs(self.storeDir)
+        self.__loadIndex()
+
+    def __loadIndex(self):
+        indexPath=os.path.join(self.storeDir, LogStore.__indexFile)
+        if not os.path.exists(indexPath):
+            return
+        with open(indexPath, "r") as f:
+            self.segments=json.load(f)
+        self.segmentFirsts=[seg["first"] for seg in self.segments]
+
+    def __writeIndex(self):
+        indexPath=os.path.join(self.storeDir, LogStore.__indexFile)
+        tmpPath=indexPath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(self.segments, f)
+        os.replace(tmpPath, indexPath)
+
+    def add(self, record):
+        with self.lock:
+            # roll before appending, so the newest record stays in memory and can still pick up continuation lines
+            if len(self.pending) > 0 and (len(self.pending) >= self.segmentRecords or record.timestamp - self.pending[0].timestamp >= self.segmentSeconds):
+                self.__roll()
+            self.pending.append(record)
+
+    def flush(self):
+        with self.lock:
+            self.__roll()
+
+    def __roll(self):
+        if len(self.pending) == 0:
+            return
+        records=self.pending
+        self.pending=[]
+        path=os.path.join(self.storeDir, "segment.%06d.jsonl.gz" % (len(self.segments)))
+        with gzip.open(path, "wt", compresslevel=6) as f:
+            for record in records:
+                f.write(json.dumps(record.toArr(), separators=(",", ":")))
+                f.write("\n")
+        blockNums=[r.blockNum for r in records if r.blockNum is not None]
+        segment={"path": path, "first": records[0].timestamp, "last": max(r.timestamp for r in records),
+                 "minBlock": min(blockNums) if blockNums else None, "maxBlock": max(blockNums) if blockNums else None,
+                 "count": len(records)}
+        self.segments.append(segment)
+        self.segmentFirsts.append(segment["first"])
+        self.__writeIndex()
+
+    @staticmethod
+    def __readSegment(segment):
+        with gzip.open(segment["path"], "rt") as f:
+            for line in f:
+                yield LogRecord.fromArr(json.loads(line))
+
+    def lastTimestamp(self):
+        with self.lock:
+            if len(self.pending) > 0:
+                return self.pending[-1].timestamp
+            if len(self.segments) > 0:
+                return self.segments[-1]["last"]
+        return None
+
+    def query(self, start=None, end=None, pattern=None, levels=None, blockRange=None, limit=None):
+        """Returns the records with start <= timestamp <= end that match all the provided filters.
+        pattern: regex (str or compiled) searched in the message
+        levels: collection of level strings (e.g. {"error", "warn"})
+        blockRange: (first, last) inclusive block numbers, records without a block number are excluded
+        limit: only return the last limit matching records"""
+        if isinstance(pattern, str):
+            pattern=re.compile(pattern)
+
+        def matches(record):
+            if start is not None and record.timestamp < start:
+                return False
+            if end is not None and record.timestamp > end:
+                return False
+            if levels is not None and record.level not in levels:
+                return False
+            if blockRange is not None and (record.blockNum is None or not (blockRange[0] <= record.blockNum <= blockRange[1])):
+                return False
+            if pattern is not None and pattern.search(record.message) is None:
+                return False
+            return True
+
+        with self.lock:
+            # segments are appended in time order, so only a suffix of them can hold records at or after start
+            first=0
+            if start is not None:
+                first=max(bisect.bisect_right(self.segmentFirsts, start) - 1, 0)
+            segments=self.segments[first:]
+            pending=list(self.pending)
+
+        results=[]
+        for segment in segments:
+            if start is not None and segment["last"] < start:
+                continue
+            if end is not None and segment["first"] > end:
+                break
+            if blockRange is not None and (segment["minBlock"] is None or segment["maxBlock"] < blockRange[0] or segment["minBlock"] > blockRange[1]):
+                continue
+            results.extend(record for record in LogStore.__readSegment(segment) if matches(record))
+        results.extend(record for record in pending if matches(record))
+        if limit is not None:
+            results=results[-limit:]
+        return results
+
+###########################################################################################
+class LogIngester(object):
+    """Follows the stderr.<date>.txt files nodebitconch writes into a node data directory and feeds them into a LogStore.
+    New files (e.g. from a relaunch) are picked up as they appear.
+    headBlockNum tracks the highest block number the node reported producing or receiving."""
+    filePattern="stderr.*.txt"
+    blockMessagePattern=re.compile(r'^(?:Produced|Received) block ')
+
+    def __init__(self, dataDir, store, pollInterval=0.5):
+        self.dataDir=dataDir
+        self.store=store
+        self.pollInterval=pollInterval
+        self.offsets={}
+        self.remainders={}
+        self.parsers={}
+        self.headBlockNum=None
+        self.pollLock=threading.Lock()
+        self.stopEvent=threading.Event()
+        self.thread=None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopEvent.clear()
+        self.thread=threading.Thread(target=self.__run, name="LogIngester(%s)" % (self.dataDir))
+        self.thread.daemon=True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopEvent.set()
+        self.thread.join()
+        self.thread=None
+        self.poll()
+        self.store.flush()
+
+    def __run(self):
+        while not self.stopEvent.wait(self.pollInterval):
+            try:
+                self.poll()
+            except OSError as ex:
+                # the data directory can disappear during cleanup
+                if Utils.Debug: Utils.Print("LogIngester for %s failed to read logs: %s" % (self.dataDir, ex))
+
+    def files(self):
+        return sorted(glob.glob(os.path.join(self.dataDir, LogIngester.filePattern)))
+
+    def poll(self):
+        """Reads whatever was appended to the log files since the last poll. Returns the number of new records."""
+        with self.pollLock:
+            count=0
+            for fileName in self.files():
+                count+=self.__readNew(fileName)
+            return count
+
+    def __readNew(self, fileName):
+        offset=self.offsets.get(fileName, 0)
+        if os.path.getsize(fileName) <= offset:
+            return 0
+        with open(fileName, "rb") as f:
+            f.seek(offset)
+            data=f.read()
+        self.offsets[fileName]=offset + len(data)
+        text=self.remainders.pop(fileName, "") + data.decode("utf-8", errors="replace")
+        lines=text.split("\n")
+        # hold on to a partially written last line until the rest of it shows up
+        if lines[-1]:
+            self.remainders[fileName]=lines[-1]
+        lines=lines[:-1]
+
+        parser=self.parsers.setdefault(fileName, LogParser())
+        count=0
+        for line in lines:
+            record=parser.parse(line)
+            if record is not None:
+                self.store.add(record)
+                count+=1
+                if record.blockNum is not None and (self.headBlockNum is None or record.blockNum > self.headBlockNum) and \
+                   LogIngester.blockMessagePattern.match(record.message):
+                    self.headBlockNum=record.blockNum
+        return count
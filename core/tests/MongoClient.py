@@ -0,0 +1,329 @@
+import base64
+import datetime
+import decimal
+import itertools
+import json
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from testUtils import Utils
+
+###########################################################################################
+# typed values for the BSON types that have no plain python/JSON equivalent. ObjectId, Int64 and IsoDate subclass
+# str/int so the decoded documents still go through json.dumps unchanged; extendedJson() gives their typed form.
+
+class ObjectId(str):
+    """24 hex digit object id."""
+    def __repr__(self):
+        return "ObjectId(\"%s\")" % (str(self))
+
+    def generationTime(self):
+        return datetime.datetime.fromtimestamp(int(self[:8], 16), datetime.timezone.utc)
+
+class Int64(int):
+    """A BSON int64 (NumberLong), encoded back as int64 even when it would fit an int32."""
+    def __repr__(self):
+        return "NumberLong(%d)" % (self)
+
+class IsoDate(str):
+    """A BSON UTC datetime, as its ISO 8601 string with millisecond precision."""
+    def __new__(cls, millis):
+        when=datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(milliseconds=millis)
+        value=str.__new__(cls, when.strftime("%Y-%m-%dT%H:%M:%S.") + "%03dZ" % (when.microsecond // 1000))
+        value.millis=millis
+        return value
+
+    def __repr__(self):
+        return "ISODate(\"%s\")" % (str(self))
+
+    def datetime(self):
+        return datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(milliseconds=self.millis)
+
+Timestamp=namedtuple("Timestamp", "time inc")
+
+class MongoError(Exception):
+    def __init__(self, message, code=None):
+        Exception.__init__(self, message)
+        self.code=code        # the server's error code, None for connection and protocol errors
+
+###########################################################################################
+# BSON
+
+def decodeDecimal128(data):
+    (low, high)=struct.unpack("<QQ", data)
+    sign=high >> 63
+    if (high >> 58) & 0x1f == 0x1e:
+        return decimal.Decimal("-Infinity" if sign else "Infinity")
+    if (high >> 58) & 0x1f == 0x1f:
+        return decimal.Decimal("NaN")
+    if (high >> 61) & 0x3 == 0x3:
+        # a significand this large exceeds the 34 digit maximum, which the spec treats as zero
+        exponent=(high >> 47) & 0x3fff
+        coefficient=0
+    else:
+        exponent=(high >> 49) & 0x3fff
+        coefficient=((high & 0x1ffffffffffff) << 64) | low
+    return decimal.Decimal((sign, tuple(int(digit) for digit in str(coefficient)), exponent - 6176))
+
+def encodeDecimal128(value):
+    if value.is_nan():
+        (low, high)=(0, 0x7c00000000000000)
+    elif value.is_infinite():
+        (low, high)=(0, 0x7800000000000000 | (0x8000000000000000 if value.is_signed() else 0))
+    else:
+        (sign, digits, exponent)=value.as_tuple()
+        coefficient=int("".join(str(digit) for digit in digits))
+        if coefficient >= 10**34 or not 0 <= exponent + 6176 <= 0x2fff:
+            raise MongoError("%s does not fit a BSON Decimal128" % (value))
+        high=(sign << 63) | ((exponent + 6176) << 49) | (coefficient >> 64)
+        low=coefficient & 0xffffffffffffffff
+    return struct.pack("<QQ", low, high)
+
+def decodeDocument(data, start=0, asArray=False):
+    """Decodes the BSON document at data[start:], returns (dict or list, offset after the document)."""
+    (length,)=struct.unpack_from("<i", data, start)
+    end=start + length - 1
+    pos=start + 4
+    doc=[] if asArray else {}
+    while pos < end:
+        elementType=data[pos]
+        nameEnd=data.index(b"\x00", pos + 1)
+        name=data[pos + 1:nameEnd].decode("utf-8")
+        pos=nameEnd + 1
+        if elementType == 0x01:
+            (value,)=struct.unpack_from("<d", data, pos)
+            pos+=8
+        elif elementType == 0x02 or elementType == 0x0D or elementType == 0x0E:
+            (size,)=struct.unpack_from("<i", data, pos)
+            value=data[pos + 4:pos + 3 + size].decode("utf-8")
+            pos+=4 + size
+        elif elementType == 0x03 or elementType == 0x04:
+            (value, pos)=decodeDocument(data, pos, asArray=elementType == 0x04)
+        elif elementType == 0x05:
+            (size,)=struct.unpack_from("<i", data, pos)
+            value=bytes(data[pos + 5:pos + 5 + size])
+            pos+=5 + size
+        elif elementType == 0x07:
+            value=ObjectId(data[pos:pos + 12].hex())
+            pos+=12
+        elif elementType == 0x08:
+            value=data[pos] != 0
+            pos+=1
+        elif elementType == 0x09:
+            (millis,)=struct.unpack_from("<q", data, pos)
+            value=IsoDate(millis)
+            pos+=8
+        elif elementType == 0x0A or elementType == 0x06:
+            value=None
+        elif elementType == 0x10:
+            (value,)=struct.unpack_from("<i", data, pos)
+            pos+=4
+        elif elementType == 0x11:
+            (inc, seconds)=struct.unpack_from("<II", data, pos)
+            value=Timestamp(seconds, inc)
+            pos+=8
+        elif elementType == 0x12:
+            (value,)=struct.unpack_from("<q", data, pos)
+            value=Int64(value)
+            pos+=8
+        elif elementType == 0x13:
+            value=decodeDecimal128(data[pos:pos + 16])
+            pos+=16
+        else:
+            raise MongoError("unsupported BSON type 0x%02x for field \"%s\"" % (elementType, name))
+        if asArray:
+            doc.append(value)
+        else:
+            doc[name]=value
+    return (doc, end + 1)
+
+def encodeElement(name, value):
+    key=name.encode("utf-8") + b"\x00"
+    if isinstance(value, bool):
+        return b"\x08" + key + (b"\x01" if value else b"\x00")
+    if isinstance(value, Int64):
+        return b"\x12" + key + struct.pack("<q", value)
+    if isinstance(value, int):
+        if -2**31 <= value < 2**31:
+            return b"\x10" + key + struct.pack("<i", value)
+        return b"\x12" + key + struct.pack("<q", value)
+    if isinstance(value, float):
+        return b"\x01" + key + struct.pack("<d", value)
+    if isinstance(value, ObjectId):
+        return b"\x07" + key + bytes.fromhex(value)
+    if isinstance(value, IsoDate):
+        return b"\x09" + key + struct.pack("<q", value.millis)
+    if isinstance(value, datetime.datetime):
+        millis=int((value - datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)).total_seconds()*1000)
+        return b"\x09" + key + struct.pack("<q", millis)
+    if isinstance(value, str):
+        data=value.encode("utf-8") + b"\x00"
+        return b"\x02" + key + struct.pack("<i", len(data)) + data
+    if isinstance(value, decimal.Decimal):
+        return b"\x13" + key + encodeDecimal128(value)
+    if isinstance(value, Timestamp):
+        return b"\x11" + key + struct.pack("<II", value.inc, value.time)
+    if isinstance(value, dict):
+        return b"\x03" + key + encodeDocument(value)
+    if isinstance(value, (list, tuple)):
+        return b"\x04" + key + encodeDocument({str(i): item for i, item in enumerate(value)})
+    if isinstance(value, bytes):
+        return b"\x05" + key + struct.pack("<i", len(value)) + b"\x00" + value
+    if value is None:
+        return b"\x0A" + key
+    raise MongoError("cannot encode %s for field \"%s\" as BSON" % (type(value).__name__, name))
+
+def encodeDocument(doc):
+    body=b"".join(encodeElement(name, value) for name, value in doc.items())
+    return struct.pack("<i", len(body) + 5) + body + b"\x00"
+
+def extendedJsonValue(value):
+    """value with its BSON specific types in MongoDB relaxed extended JSON form."""
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, IsoDate):
+        return {"$date": str(value)}
+    if isinstance(value, Int64):
+        return {"$numberLong": str(int(value))}
+    if isinstance(value, Timestamp):
+        return {"$timestamp": {"t": value.time, "i": value.inc}}
+    if isinstance(value, decimal.Decimal):
+        return {"$numberDecimal": str(value)}
+    if isinstance(value, bytes):
+        return {"$binary": {"base64": base64.b64encode(value).decode("ascii"), "subType": "00"}}
+    if isinstance(value, dict):
+        return {name: extendedJsonValue(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [extendedJsonValue(item) for item in value]
+    return value
+
+def extendedJson(value, indent=None):
+    return json.dumps(extendedJsonValue(value), indent=indent)
+
+###########################################################################################
+class MongoClient(object):
+    """Minimal MongoDB client speaking OP_MSG over a small pool of kept alive connections, for the harness's queries of
+    the collections mongo_db_plugin fills. Clients are shared per host, port and database, see MongoClient.get."""
+    __OpMsg=2013
+    __clients={}
+    __clientsLock=threading.Lock()
+
+    def __init__(self, host, port, db, maxIdle=4, timeout=30):
+        self.host=host
+        self.port=port
+        self.db=db
+        self.maxIdle=maxIdle
+        self.timeout=timeout
+        self.idle=[]
+        self.lock=threading.Lock()
+        self.requestIds=itertools.count(1)
+
+    @staticmethod
+    def get(host, port, db):
+        key=(host, port, db)
+        with MongoClient.__clientsLock:
+            client=MongoClient.__clients.get(key)
+            if client is None:
+                client=MongoClient(host, port, db)
+                MongoClient.__clients[key]=client
+            return client
+
+    def close(self):
+        with self.lock:
+            idle, self.idle=self.idle, []
+        for sock in idle:
+            sock.close()
+
+    def __acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        sock=socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def __release(self, sock):
+        with self.lock:
+            if len(self.idle) < self.maxIdle:
+                self.idle.append(sock)
+                return
+        sock.close()
+
+    @staticmethod
+    def __recvExactly(sock, size):
+        data=bytearray()
+        while len(data) < size:
+            chunk=sock.recv(size - len(data))
+            if not chunk:
+                raise MongoError("connection closed by mongod")
+            data+=chunk
+        return data
+
+    def command(self, cmd):
+        """Runs cmd (a dict whose first key is the command name) against the database and returns the reply document."""
+        body=dict(cmd)
+        body["$db"]=self.db
+        payload=struct.pack("<I", 0) + b"\x00" + encodeDocument(body)
+        requestId=next(self.requestIds) & 0x7fffffff
+        message=struct.pack("<iiii", 16 + len(payload), requestId, 0, MongoClient.__OpMsg) + payload
+        sock=None
+        try:
+            sock=self.__acquire()
+            sock.sendall(message)
+            (length, _, responseTo, opCode)=struct.unpack("<iiii", self.__recvExactly(sock, 16))
+            if opCode != MongoClient.__OpMsg or responseTo != requestId or length < 21:
+                raise MongoError("unexpected reply: opCode %d, responseTo %d, length %d" % (opCode, responseTo, length))
+            data=self.__recvExactly(sock, length - 16)
+            if data[4] != 0:
+                raise MongoError("unexpected reply: section kind %d" % (data[4]))
+        except (OSError, MongoError) as ex:
+            # the connection may still hold (part of) a reply, it is never put back into the pool then
+            if sock is not None:
+                sock.close()
+            raise MongoError("%s on %s:%d failed: %s" % (next(iter(cmd)), self.host, self.port, ex))
+        self.__release(sock)
+
+        (reply, _)=decodeDocument(data, 5)
+        if not reply.get("ok"):
+            raise MongoError("%s failed: %s (code %s)" % (next(iter(cmd)), reply.get("errmsg"), reply.get("code")), reply.get("code"))
+        return reply
+
+    def find(self, collection, filter=None, sort=None, limit=0, projection=None):
+        """Returns the list of documents of collection matching filter."""
+        cmd={"find": collection, "filter": filter or {}}
+        if projection:
+            cmd["projection"]=projection
+        if sort:
+            cmd["sort"]=sort
+        if limit:
+            cmd["limit"]=limit
+            cmd["singleBatch"]=True
+        if Utils.Debug: Utils.Print("mongodb find %s: %s" % (collection, extendedJson(cmd)))
+        start=time.perf_counter()
+        cursor=self.command(cmd)["cursor"]
+        docs=cursor["firstBatch"]
+        while cursor.get("id"):
+            cursor=self.command({"getMore": Int64(cursor["id"]), "collection": collection})["cursor"]
+            docs.extend(cursor["nextBatch"])
+        if Utils.Debug: Utils.Print("mongodb find returned %d documents in %.3f sec" % (len(docs), time.perf_counter() - start))
+        return docs
+
+    def findOne(self, collection, filter=None, sort=None, projection=None):
+        docs=self.find(collection, filter, sort=sort, limit=1, projection=projection)
+        return docs[0] if docs else None
+
+    def ensureIndex(self, collection, key):
+        """Creates the ascending index on the key field of collection, unless an index on it already exists.
+        Returns True if the index was created."""
+        name="%s_1" % (key)
+        try:
+            reply=self.command({"createIndexes": collection, "indexes": [{"key": {key: 1}, "name": name}]})
+        except MongoError as ex:
+            # 85/86: an index on key exists already, created by mongo_db_plugin under other options or another name
+            if ex.code in (85, 86):
+                return False
+            raise
+        return reply.get("numIndexesAfter", 0) > reply.get("numIndexesBefore", 0)
@@ -7,9 +7,17 @@ import re
 import datetime
 import json
 import signal
+import itertools
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 from core_symbol import CORE_SYMBOL
+from MongoClient import MongoClient
+from MongoClient import MongoError
+from TransactionCache import TransactionCache
 from testUtils import Utils
+from testUtils import Log
 from testUtils import Account
 from testUtils import EnumType
 from testUtils import addEnum
@@ -27,8 +35,58 @@ class BlockType(EnumType):
 addEnum(BlockType, "head")
 addEnum(BlockType, "lib")
 
+class ProducerTimeline(object):
+    """block num -> (producer, timestamp, id, previous, irreversible) for the blocks retrieved from a node, filled in incrementally.
+    irreversible records whether the block was at or below the node's last known LIB when it was retrieved; other entries can
+    be replaced by a fork, so get refetches them unless refresh is False."""
+    Entry=namedtuple("Entry", "producer timestamp id previous irreversible")
+
+    def __init__(self, fetchFn, fetchAhead=12):
+        self.fetchFn=fetchFn
+        self.fetchAhead=fetchAhead
+        self.entries={}
+
+    def add(self, block, lib):
+        blockNum=int(block["block_num"])
+        irreversible=lib is not None and blockNum <= lib
+        self.entries[blockNum]=ProducerTimeline.Entry(block["producer"], block.get("timestamp"), block.get("id"), block.get("previous"), irreversible)
+
+    def get(self, blockNum, refresh=True):
+        """Returns the Entry for blockNum, fetching it and the following fetchAhead-1 blocks in one sweep if it was not retrieved yet.
+        With refresh an entry that was not irreversible is fetched again, like Node.getBlockProducerByNum does."""
+        entry=self.entries.get(blockNum)
+        if entry is None:
+            self.fetchFn(blockNum, blockNum + self.fetchAhead - 1)
+        elif refresh and not entry.irreversible:
+            self.fetchFn(blockNum, blockNum)
+        else:
+            return entry
+        return self.entries.get(blockNum)
+
+    def producer(self, blockNum, refresh=True):
+        entry=self.get(blockNum, refresh)
+        return entry.producer if entry is not None else None
+
+    def runs(self, start, end):
+        """Run length encoding of the producers for blocks start..end (inclusive): list of (producer, first block num, count)."""
+        runs=[]
+        for blockNum in range(start, end+1):
+            producer=self.producer(blockNum)
+            if len(runs) > 0 and runs[-1][0] == producer:
+                runs[-1]=(producer, runs[-1][1], runs[-1][2] + 1)
+            else:
+                runs.append((producer, blockNum, 1))
+        return runs
+
+    def prune(self, belowBlockNum):
+        for blockNum in [num for num in self.entries if num < belowBlockNum]:
+            del self.entries[blockNum]
+
 # pylint: disable=too-many-public-methods
 class Node(object):
+    TransCacheSize=10000        # transactions whose compact record each Node keeps, see TransactionCache
+    TransSpillDir=os.environ.get("BITCONCH_TEST_TRANS_SPILL_DIR")   # where full transaction traces are appended, None to drop them
+    __spillFileIds=itertools.count()
 
     # pylint: disable=too-many-instance-attributes
     # pylint: disable=too-many-arguments
@@ -45,17 +103,19 @@ class Node(object):
         self.mongoDb=mongoDb
         self.endpointHttp="http://%s:%d" % (self.host, self.port)
         self.endpointArgs="--url %s" % (self.endpointHttp)
-        self.mongoEndpointArgs=""
         self.infoValid=None
         self.lastRetrievedHeadBlockNum=None
         self.lastRetrievedLIB=None
         self.lastRetrievedHeadBlockProducer=""
-        self.transCache={}
+        self.producerTimeline=ProducerTimeline(self.getBlockRange)
+        spillPath=None
+        if Node.TransSpillDir is not None:
+            spillPath=os.path.join(Node.TransSpillDir, "transactions_%s_%d_%d.jsonl" % (host, port, next(Node.__spillFileIds)))
+        self.transCache=TransactionCache("%s:%d" % (host, port), Node.TransCacheSize, spillPath)
         self.walletMgr=walletMgr
         self.missingTransaction=False
         self.popenProc=None           # initial process is started by launcher, this will only be set on relaunch
-        if self.enableMongo:
-            self.mongoEndpointArgs += "--host %s --port %d %s" % (mongoHost, mongoPort, mongoDb)
+        self.mongoClient=MongoClient.get(mongoHost, mongoPort, mongoDb) if self.enableMongo else None
 
     def bitconchClientArgs(self):
         walletArgs=" " + self.walletMgr.getWalletEndpointArgs() if self.walletMgr is not None else ""
@@ -165,49 +225,22 @@ class Node(object):
 
         return (ret, outs, errs)
 
-    @staticmethod
-    def normalizeJsonObject(extJStr):
-        tmpStr=extJStr
-        tmpStr=re.sub(r'ObjectId\("(\w+)"\)', r'"ObjectId-\1"', tmpStr)
-        tmpStr=re.sub(r'ISODate\("([\w|\-|\:|\.]+)"\)', r'"ISODate-\1"', tmpStr)
-        tmpStr=re.sub(r'NumberLong\("(\w+)"\)', r'"NumberLong-\1"', tmpStr)
-        return tmpStr
-
-    @staticmethod
-    def runMongoCmdReturnJson(cmd, subcommand, trace=False, exitOnError=False):
-        """Run mongodb subcommand and return response."""
-        assert(cmd)
-        assert(isinstance(cmd, list))
-        assert(subcommand)
-        assert(isinstance(subcommand, str))
-        retId,outs,errs=Node.stdinAndCheckOutput(cmd, subcommand)
-        if retId is not 0:
-            errorMsg="mongodb call failed. cmd=[ %s ] subcommand=\"%s\" - %s" % (", ".join(cmd), subcommand, errs)
+    def mongoFind(self, collection, filter, sort=None, limit=0, projection=None, errorDesc="mongodb find", silentErrors=False, exitOnError=False):
+        """Queries the node's mongodb, returns the list of decoded documents or None on error."""
+        try:
+            return self.mongoClient.find(collection, filter, sort=sort, limit=limit, projection=projection)
+        except MongoError as ex:
+            errorMsg="Exception during %s. %s" % (errorDesc, ex)
             if exitOnError:
                 Utils.cmdError(errorMsg)
                 Utils.errorExit(errorMsg)
-
-            Utils.Print("ERROR: %s" % (errMsg))
-            return None
-        outStr=Node.byteArrToStr(outs)
-        if not outStr:
-            return None
-        extJStr=Utils.filterJsonObjectOrArray(outStr)
-        if not extJStr:
-            return None
-        jStr=Node.normalizeJsonObject(extJStr)
-        if not jStr:
+            if not silentErrors:
+                Utils.Print("ERROR: %s" % (errorMsg))
             return None
-        if trace: Utils.Print ("RAW > %s"% (outStr))
-        if trace: Utils.Print ("JSON> %s"% jStr)
-        try:
-            jsonData=json.loads(jStr)
-        except json.decoder.JSONDecodeError as _:
-            Utils.Print ("ERROR: JSONDecodeError")
-            Utils.Print ("Raw MongoDB response: > %s"% (outStr))
-            Utils.Print ("Normalized MongoDB response: > %s"% (jStr))
-            raise
-        return jsonData
+
+    def mongoFindOne(self, collection, filter, sort=None, projection=None, errorDesc="mongodb find", silentErrors=False, exitOnError=False):
+        docs=self.mongoFind(collection, filter, sort=sort, limit=1, projection=projection, errorDesc=errorDesc, silentErrors=silentErrors, exitOnError=exitOnError)
+        return docs[0] if docs else None
 
     @staticmethod
     def getTransId(trans):
@@ -259,52 +292,10 @@ class Node(object):
             msg="(block number=%s)" % (blockNum);
             return self.processClbitconchCmd(cmd, cmdDesc, silentErrors=silentErrors, exitOnError=exitOnError, exitMsg=msg)
         else:
-            cmd="%s %s" % (Utils.MongoPath, self.mongoEndpointArgs)
-            subcommand='db.blocks.findOne( { "block_num": %d } )' % (blockNum)
-            if Utils.Debug: Utils.Print("cmd: echo '%s' | %s" % (subcommand, cmd))
-            start=time.perf_counter()
-            try:
-                block=Node.runMongoCmdReturnJson(cmd.split(), subcommand, exitOnError=exitOnError)
-                if Utils.Debug:
-                    end=time.perf_counter()
-                    Utils.Print("cmd Duration: %.3f sec" % (end-start))
-
-                if block is not None:
-                    return block
-            except subprocess.CalledProcessError as ex:
-                if not silentErrors:
-                    end=time.perf_counter()
-                    msg=ex.output.decode("utf-8")
-                    errorMsg="Exception during get db node get block.  cmd Duration: %.3f sec. %s" % (end-start, msg)
-                    if exitOnError:
-                        Utils.cmdError(errorMsg)
-                        Utils.errorExit(errorMsg)
-                    else:
-                        Utils.Print("ERROR: %s" % (errorMsg))
-                return None
-
-        return None
+            return self.mongoFindOne("blocks", {"block_num": blockNum}, errorDesc="get db node get block", silentErrors=silentErrors, exitOnError=exitOnError)
 
     def getBlockByIdMdb(self, blockId, silentErrors=False):
-        cmd="%s %s" % (Utils.MongoPath, self.mongoEndpointArgs)
-        subcommand='db.blocks.findOne( { "block_id": "%s" } )' % (blockId)
-        if Utils.Debug: Utils.Print("cmd: echo '%s' | %s" % (subcommand, cmd))
-        start=time.perf_counter()
-        try:
-            trans=Node.runMongoCmdReturnJson(cmd.split(), subcommand)
-            if Utils.Debug:
-                end=time.perf_counter()
-                Utils.Print("cmd Duration: %.3f sec" % (end-start))
-            if trans is not None:
-                return trans
-        except subprocess.CalledProcessError as ex:
-            if not silentErrors:
-                end=time.perf_counter()
-                msg=ex.output.decode("utf-8")
-                Utils.Print("ERROR: Exception during db get block by id.  cmd Duration: %.3f sec. %s" % (end-start, msg))
-            return None
-
-        return None
+        return self.mongoFindOne("blocks", {"block_id": blockId}, errorDesc="db get block by id", silentErrors=silentErrors)
 
     def isBlockPresent(self, blockNum, blockType=BlockType.head):
         """Does node have head_block_num/last_irreversible_block_num >= blockNum"""
@@ -370,28 +361,8 @@ class Node(object):
 
     def getTransactionMdb(self, transId, silentErrors=False, exitOnError=False):
         """Get transaction from MongoDB. Since DB only contains finalized blocks, transactions can take a while to appear in DB."""
-        cmd="%s %s" % (Utils.MongoPath, self.mongoEndpointArgs)
-        #subcommand='db.Transactions.findOne( { $and : [ { "trx_id": "%s" }, {"irreversible":true} ] } )' % (transId)
-        subcommand='db.transactions.findOne( { "trx_id": "%s" } )' % (transId)
-        if Utils.Debug: Utils.Print("cmd: echo '%s' | %s" % (subcommand, cmd))
-        start=time.perf_counter()
-        try:
-            trans=Node.runMongoCmdReturnJson(cmd.split(), subcommand, exitOnError=exitOnError)
-            if Utils.Debug:
-                end=time.perf_counter()
-                Utils.Print("cmd Duration: %.3f sec" % (end-start))
-            if trans is not None:
-                return trans
-        except subprocess.CalledProcessError as ex:
-            end=time.perf_counter()
-            msg=ex.output.decode("utf-8")
-            errorMsg="Exception during get db node get trans in mongodb with transaction id=%s.  cmd Duration: %.3f sec.  %s" % (transId, end-start, msg)
-            if exitOnError:
-                Utils.cmdError("" % (errorMsg))
-                Utils.errorExit("Failed to retrieve transaction in mongodb for transaction id=%s" % (transId))
-            elif not silentErrors:
-                Utils.Print("ERROR: %s" % (errorMsg))
-            return None
+        return self.mongoFindOne("transactions", {"trx_id": transId}, errorDesc="get db node get trans in mongodb with transaction id=%s" % (transId),
+                                 silentErrors=silentErrors, exitOnError=exitOnError)
 
     def isTransInBlock(self, transId, blockId):
         """Check if transId is within block identified by blockId"""
@@ -432,16 +403,13 @@ class Node(object):
         assert(transId)
         assert(isinstance(transId, str))
         trans=self.getTransaction(transId, exitOnError=True, delayedRetry=delayedRetry)
+        if self.enableMongo:
+            return self.getBlockIdByTransIdMdb(transId)
 
         refBlockNum=None
-        key=""
+        key="[trx][trx][ref_block_num]"
         try:
-            if not self.enableMongo:
-                key="[trx][trx][ref_block_num]"
-                refBlockNum=trans["trx"]["trx"]["ref_block_num"]
-            else:
-                key="[ref_block_num]"
-                refBlockNum=trans["ref_block_num"]
+            refBlockNum=trans["trx"]["trx"]["ref_block_num"]
             refBlockNum=int(refBlockNum)+1
         except (TypeError, ValueError, KeyError) as _:
             Utils.Print("transaction%s not found. Transaction: %s" % (key, trans))
@@ -464,33 +432,21 @@ class Node(object):
         return None
 
     def getBlockIdByTransIdMdb(self, transId):
-        """Given a transaction Id (string), will return block id (int) containing the transaction. This is specific to MongoDB."""
+        """Given a transaction Id (string), will return block id (int) containing the transaction. This is specific to MongoDB.
+        Takes the block number recorded in the transaction's trace, an indexed lookup of transaction_traces.id."""
         assert(transId)
         assert(isinstance(transId, str))
-        trans=self.getTransactionMdb(transId)
-        if not trans: return None
+        trace=self.mongoFindOne("transaction_traces", {"id": transId}, projection={"block_num": 1},
+                                errorDesc="get db transaction trace with transaction id=%s" % (transId))
+        if trace is None:
+            return None
 
-        refBlockNum=None
         try:
-            refBlockNum=trans["ref_block_num"]
-            refBlockNum=int(refBlockNum)+1
+            return int(trace["block_num"])
         except (TypeError, ValueError, KeyError) as _:
-            Utils.Print("transaction[ref_block_num] not found. Transaction: %s" % (trans))
+            Utils.Print("transaction trace[block_num] not found. Trace: %s" % (trace))
             return None
 
-        headBlockNum=self.getHeadBlockNum()
-        assert(headBlockNum)
-        try:
-            headBlockNum=int(headBlockNum)
-        except(ValueError) as _:
-            Utils.Print("Info parsing failed. %s" % (headBlockNum))
-
-        for blockNum in range(refBlockNum, headBlockNum+1):
-            if self.isTransInBlock(str(transId), blockNum):
-                return blockNum
-
-        return None
-
     def isTransInAnyBlock(self, transId):
         """Check if transaction (transId) is in a block."""
         assert(transId)
@@ -563,30 +519,13 @@ class Node(object):
             return self.getBitconchAccountFromDb(name, exitOnError=exitOnError)
 
     def getBitconchAccountFromDb(self, name, exitOnError=False):
-        cmd="%s %s" % (Utils.MongoPath, self.mongoEndpointArgs)
-        subcommand='db.accounts.findOne({"name" : "%s"})' % (name)
-        if Utils.Debug: Utils.Print("cmd: echo '%s' | %s" % (subcommand, cmd))
-        try:
-            timeout = 3
-            for i in range(0,(int(60/timeout) - 1)):
-                start=time.perf_counter()
-                trans=Node.runMongoCmdReturnJson(cmd.split(), subcommand, exitOnError=exitOnError)
-                if trans is not None:
-                    if Utils.Debug:
-                        end=time.perf_counter()
-                        Utils.Print("cmd Duration: %.3f sec" % (end-start))
-                    return trans
-                time.sleep(timeout)
-            return trans
-        except subprocess.CalledProcessError as ex:
-            msg=ex.output.decode("utf-8")
-            if exitOnError:
-                end=time.perf_counter()
-                Utils.cmdError("Exception during get account from db for %s.  cmd Duration: %.3f sec.  %s" % (name, end-start, msg))
-                Utils.errorExit("Failed during get account from db for %s. %s" % (name, msg))
-
-            Utils.Print("ERROR: Exception during get account from db for %s. %s" % (name, msg))
-            return None
+        timeout = 3
+        for i in range(0,(int(60/timeout) - 1)):
+            account=self.mongoFindOne("accounts", {"name": name}, errorDesc="get account from db for %s" % (name), exitOnError=exitOnError)
+            if account is not None:
+                return account
+            time.sleep(timeout)
+        return None
 
     def getTable(self, contract, scope, table, exitOnError=False):
         cmdDesc = "get table"
@@ -824,31 +763,16 @@ class Node(object):
             return self.getActionsMdb(account, pos, offset, exitOnError=exitOnError)
 
     def getActionsMdb(self, account, pos=-1, offset=-1, exitOnError=False):
+        """The action_traces document of account's latest (pos -1) or first (pos 1) transfer when abs(offset) is 1, like the
+        mongo shell query returned it, otherwise the list of the abs(offset) documents. None if there is none or on error."""
         assert(isinstance(account, Account))
         assert(isinstance(pos, int))
         assert(isinstance(offset, int))
 
-        cmd="%s %s" % (Utils.MongoPath, self.mongoEndpointArgs)
-        subcommand='db.action_traces.find({$or: [{"act.data.from":"%s"},{"act.data.to":"%s"}]}).sort({"_id":%d}).limit(%d)' % (account.name, account.name, pos, abs(offset))
-        if Utils.Debug: Utils.Print("cmd: echo '%s' | %s" % (subcommand, cmd))
-        start=time.perf_counter()
-        try:
-            actions=Node.runMongoCmdReturnJson(cmd.split(), subcommand, exitOnError=exitOnError)
-            if Utils.Debug:
-                end=time.perf_counter()
-                Utils.Print("cmd Duration: %.3f sec" % (end-start))
-            if actions is not None:
-                return actions
-        except subprocess.CalledProcessError as ex:
-            end=time.perf_counter()
-            msg=ex.output.decode("utf-8")
-            errorMsg="Exception during get db actions.  cmd Duration: %.3f sec.  %s" % (end-start, msg)
-            if exitOnError:
-                Utils.cmdError(errorMsg)
-                Utils.errorExit(errorMsg)
-            else:
-                Utils.Print("ERROR: %s" % (errorMsg))
-        return None
+        accountFilter={"$or": [{"act.data.from": account.name}, {"act.data.to": account.name}]}
+        if abs(offset) == 1:
+            return self.mongoFindOne("action_traces", accountFilter, sort={"_id": pos}, errorDesc="get db actions", exitOnError=exitOnError)
+        return self.mongoFind("action_traces", accountFilter, sort={"_id": pos}, limit=abs(offset), errorDesc="get db actions", exitOnError=exitOnError)
 
     # Gets accounts mapped to key. Returns array
     def getAccountsArrByKey(self, key):
@@ -1178,21 +1102,7 @@ class Node(object):
         return info
 
     def getBlockFromDb(self, idx):
-        cmd="%s %s" % (Utils.MongoPath, self.mongoEndpointArgs)
-        subcommand="db.blocks.find().sort({\"_id\":%d}).limit(1).pretty()" % (idx)
-        if Utils.Debug: Utils.Print("cmd: echo \"%s\" | %s" % (subcommand, cmd))
-        start=time.perf_counter()
-        try:
-            trans=Node.runMongoCmdReturnJson(cmd.split(), subcommand)
-            if Utils.Debug:
-                end=time.perf_counter()
-                Utils.Print("cmd Duration: %.3f sec" % (end-start))
-            return trans
-        except subprocess.CalledProcessError as ex:
-            end=time.perf_counter()
-            msg=ex.output.decode("utf-8")
-            Utils.Print("ERROR: Exception during get db block.  cmd Duration: %.3f sec.  %s" % (end-start, msg))
-            return None
+        return self.mongoFindOne("blocks", {}, sort={"_id": idx}, errorDesc="get db block")
 
     def checkPulse(self, exitOnError=False):
         info=self.getInfo(True, exitOnError=exitOnError)
@@ -1298,7 +1208,30 @@ class Node(object):
 
         return True
 
+    def getBlockRange(self, start, end, timeout=None, waitForBlock=True, exitOnError=True, maxWorkers=8):
+        """Retrieve blocks start..end (inclusive) with concurrent requests, returned in block number order.
+        Waits once for the end block instead of per block, and refreshes producerTimeline with the results."""
+        assert(isinstance(start, int))
+        assert(isinstance(end, int))
+        assert(start <= end)
+        if waitForBlock:
+            if timeout is None:
+                # blocks are produced every half second
+                timeout=Utils.systemWaitTimeout + (end - start) / 2
+            self.waitForBlock(end, timeout=timeout, blockType=BlockType.head)
+        blockNums=range(start, end+1)
+        with ThreadPoolExecutor(max_workers=min(maxWorkers, len(blockNums))) as executor:
+            blocks=list(executor.map(lambda blockNum: self.getBlock(blockNum, exitOnError=exitOnError), blockNums))
+        lib=self.lastRetrievedLIB
+        for block in blocks:
+            if block is not None:
+                self.producerTimeline.add(block, lib)
+        return blocks
+
     def getBlockProducerByNum(self, blockNum, timeout=None, waitForBlock=True, exitOnError=True):
+        entry=self.producerTimeline.entries.get(blockNum)
+        if entry is not None and entry.irreversible:
+            return entry.producer
         if waitForBlock:
             self.waitForBlock(blockNum, timeout=timeout, blockType=BlockType.head)
         block=self.getBlock(blockNum, exitOnError=exitOnError)
@@ -1306,6 +1239,7 @@ class Node(object):
         if blockProducer is None and exitOnError:
             Utils.cmdError("could not get producer for block number %s" % (blockNum))
             Utils.errorExit("Failed to get block's producer")
+        self.producerTimeline.add(block, self.lastRetrievedLIB)
         return blockProducer
 
     def getBlockProducer(self, timeout=None, waitForBlock=True, exitOnError=True, blockType=BlockType.head):
@@ -1335,13 +1269,15 @@ class Node(object):
 
         blockNum=self.getHeadBlockNum()
         Utils.Print("Searching for clean production cycle blockNum=%s ibn=%s  transId=%s  promoted bn=%s  ibn for schedule active=%s" % (blockNum,irreversibleBlockNum,transId,promotedBlockNum,ibnSchedActive))
-        blockProducer=self.getBlockProducerByNum(blockNum)
+        # a producer produces at most 12 blocks in a row, so one sweep normally covers the next producer change
+        self.getBlockRange(blockNum, blockNum+12)
+        timeline=self.producerTimeline
+        blockProducer=timeline.producer(blockNum, refresh=False)
         blockNum+=1
         Utils.Print("Advance until the next block producer is retrieved")
-        while blockProducer == self.getBlockProducerByNum(blockNum):
+        while blockProducer == timeline.producer(blockNum, refresh=False):
             blockNum+=1
 
-        blockProducer=self.getBlockProducerByNum(blockNum)
         return blockNum
 
 
@@ -1365,7 +1301,7 @@ class Node(object):
             skip=False
             swapValue=None
             for i in splittedCmd:
-                Utils.Print("\"%s\"" % (i))
+                Log.debug('"' + i + '"')
                 if skip:
                     skip=False
                     continue
@@ -1450,15 +1386,27 @@ class Node(object):
             return
 
         transId=Node.getTransId(trans)
+        # looked up without Node.Context, whose asserts are meant for transactions known to be complete
+        status=None
+        blockNum=None
+        try:
+            processed=trans["processed"]
+            status=processed["receipt"]["status"]
+            blockNum=processed["action_traces"][0]["block_num"]
+        except (TypeError, KeyError, IndexError) as _:
+            pass
+        previous=self.transCache.add(transId, status, blockNum, trans)
         if Utils.Debug:
-            status=Node.getTransStatus(trans)
-            blockNum=Node.getTransBlockNum(trans)
-            if transId in self.transCache.keys():
-                replaceMsg="replacing previous trans=\n%s" % json.dumps(self.transCache[transId], indent=2, sort_keys=True)
-            else:
-                replaceMsg=""
+            replaceMsg="replacing previous %s" % (previous) if previous is not None else ""
             Utils.Print("  cmd returned transaction id: %s, status: %s, (possible) block num: %s %s" % (transId, status, blockNum, replaceMsg))
-        self.transCache[transId]=trans
+
+    def getTrackedTransaction(self, transId):
+        """The TransactionRecord of a transaction returned by one of this node's commands, None if unknown or evicted."""
+        return self.transCache.get(transId)
+
+    def getTrackedTransactionTrace(self, transId):
+        """The full trace a command returned for transId, only kept when Node.TransSpillDir is set."""
+        return self.transCache.getTrace(transId)
 
     def reportStatus(self):
         Utils.Print("Node State:")
@@ -1471,6 +1419,7 @@ class Node(object):
         status="last getInfo returned None" if not self.infoValid else "at last call to getInfo"
         Utils.Print(" hbn   : %s (%s)" % (self.lastRetrievedHeadBlockNum, status))
         Utils.Print(" lib   : %s (%s)" % (self.lastRetrievedLIB, status))
+        Utils.Print(" trans : %s" % (self.transCache.describe()))
 
     # Require producer_api_plugin
     def scheduleProtocolFeatureActivations(self, featureDigests=[]):
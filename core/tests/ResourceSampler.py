@@ -0,0 +1,192 @@
+import array
+import json
+import os
+import threading
+import time
+
+from testUtils import Utils
+
+###########################################################################################
+class RingBuffer(object):
+    """Fixed capacity columnar buffer of float samples; once full the oldest samples are overwritten."""
+
+    def __init__(self, columns, capacity):
+        self.columns=columns
+        self.capacity=capacity
+        self.data=[array.array("d", bytes(8*capacity)) for _ in columns]
+        self.next=0
+        self.size=0
+
+    def append(self, row):
+        assert(len(row) == len(self.columns))
+        for col, value in zip(self.data, row):
+            col[self.next]=value
+        self.next=(self.next + 1) % self.capacity
+        self.size=min(self.size + 1, self.capacity)
+
+    def column(self, name):
+        """Returns the samples of the named column, oldest first."""
+        col=self.data[self.columns.index(name)]
+        if self.size < self.capacity:
+            return col[:self.size].tolist()
+        return col[self.next:].tolist() + col[:self.next].tolist()
+
+    def __len__(self):
+        return self.size
+
+###########################################################################################
+class ResourceSampler(object):
+    """Samples /proc/<pid>/stat, status and io plus the chainbase state file size of every node at a fixed cadence.
+    targetsFn returns the (ext, node) pairs to sample, headBlockFn(ext) returns the last known head block num or None.
+    Values that could not be read (e.g. /proc/<pid>/io without permissions, or a killed node) are stored as -1."""
+    columns=("time", "cpuSeconds", "rssBytes", "rssShmemBytes", "readBytes", "writeBytes", "stateBytes", "headBlockNum")
+    __clockTicks=os.sysconf("SC_CLK_TCK")
+
+    def __init__(self, targetsFn, headBlockFn=None, interval=1.0, capacity=3600):
+        self.targetsFn=targetsFn
+        self.headBlockFn=headBlockFn
+        self.interval=interval
+        self.capacity=capacity
+        self.buffers={}
+        self.lock=threading.Lock()
+        self.stopEvent=threading.Event()
+        self.thread=None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopEvent.clear()
+        self.thread=threading.Thread(target=self.__run, name="ResourceSampler")
+        self.thread.daemon=True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopEvent.set()
+        self.thread.join()
+        self.thread=None
+
+    def __run(self):
+        while not self.stopEvent.is_set():
+            self.sample()
+            self.stopEvent.wait(self.interval)
+
+    @staticmethod
+    def __readStat(pid):
+        with open("/proc/%d/stat" % (pid), "r") as f:
+            stat=f.read()
+        # the command name can contain spaces, so split after its closing parenthesis. utime and stime are fields 14 and 15.
+        fields=stat[stat.rindex(")") + 2:].split()
+        return (int(fields[11]) + int(fields[12])) / ResourceSampler.__clockTicks
+
+    @staticmethod
+    def __readKeyValues(fileName, keys):
+        values={}
+        with open(fileName, "r") as f:
+            for line in f:
+                key, _, value=line.partition(":")
+                if key in keys:
+                    values[key]=value.split()[0]
+        return values
+
+    @staticmethod
+    def sampleNode(ext, pid):
+        """Returns the row of columns[1:-1] for the node process, using -1 for anything that could not be read."""
+        cpuSeconds=rss=rssShmem=readBytes=writeBytes=stateBytes=-1
+        if pid is not None:
+            try:
+                cpuSeconds=ResourceSampler.__readStat(pid)
+                status=ResourceSampler.__readKeyValues("/proc/%d/status" % (pid), ("VmRSS", "RssShmem"))
+                rss=int(status.get("VmRSS", -1024)) * 1024
+                rssShmem=int(status.get("RssShmem", -1024)) * 1024
+            except (OSError, ValueError):
+                pass
+            try:
+                io=ResourceSampler.__readKeyValues("/proc/%d/io" % (pid), ("read_bytes", "write_bytes"))
+                readBytes=int(io["read_bytes"])
+                writeBytes=int(io["write_bytes"])
+            except (OSError, KeyError, ValueError):
+                pass
+        try:
+            # the state file is sparse, so report the space actually allocated for it
+            st=os.stat(Utils.getNodeDataDir(ext, os.path.join("state", "shared_memory.bin")))
+            stateBytes=st.st_blocks * 512
+        except OSError:
+            pass
+        return (cpuSeconds, rss, rssShmem, readBytes, writeBytes, stateBytes)
+
+    def sample(self):
+        now=time.time()
+        for ext, node in self.targetsFn():
+            headBlockNum=None
+            if self.headBlockFn is not None:
+                headBlockNum=self.headBlockFn(ext)
+            row=(now,) + ResourceSampler.sampleNode(ext, node.pid) + (headBlockNum if headBlockNum is not None else -1,)
+            with self.lock:
+                buffer=self.buffers.get(ext)
+                if buffer is None:
+                    buffer=self.buffers[ext]=RingBuffer(ResourceSampler.columns, self.capacity)
+                buffer.append(row)
+
+    def series(self, ext):
+        """Returns a dict of column name to list of samples for the node."""
+        with self.lock:
+            buffer=self.buffers.get(ext)
+            if buffer is None:
+                return None
+            return {name: buffer.column(name) for name in ResourceSampler.columns}
+
+    @staticmethod
+    def __delta(values):
+        valid=[v for v in values if v >= 0]
+        if len(valid) < 2:
+            return None
+        return valid[-1] - valid[0]
+
+    def summary(self, ext):
+        """Summary stats for the node over the sampled window: peaks, totals and per block costs."""
+        series=self.series(ext)
+        if series is None:
+            return None
+        summary={
+            "samples": len(series["time"]),
+            "seconds": series["time"][-1] - series["time"][0],
+            "peakRssBytes": max(series["rssBytes"]),
+            "peakRssShmemBytes": max(series["rssShmemBytes"]),
+            "peakStateBytes": max(series["stateBytes"]),
+            "cpuSeconds": ResourceSampler.__delta(series["cpuSeconds"]),
+            "writeBytes": ResourceSampler.__delta(series["writeBytes"]),
+            "blocks": ResourceSampler.__delta(series["headBlockNum"]),
+        }
+        blocks=summary["blocks"]
+        summary["cpuSecondsPerBlock"]=summary["cpuSeconds"] / blocks if blocks and summary["cpuSeconds"] is not None else None
+        summary["writeBytesPerBlock"]=summary["writeBytes"] / blocks if blocks and summary["writeBytes"] is not None else None
+        return summary
+
+    def report(self, includeSeries=True):
+        with self.lock:
+            exts=list(self.buffers.keys())
+        report={}
+        for ext in exts:
+            entry={"summary": self.summary(ext)}
+            if includeSeries:
+                entry["series"]=self.series(ext)
+            report[str(ext)]=entry
+        return report
+
+    def writeReport(self, fileName):
+        with open(fileName, "w") as f:
+            json.dump(self.report(), f)
+
+    def printSummary(self):
+        Utils.Print("Node resource usage:")
+        Utils.Print("%6s %8s %12s %12s %12s %10s %12s %8s %12s %14s" % ("node", "seconds", "peakRSS(MB)", "peakShm(MB)", "state(MB)", "cpu(s)", "written(MB)", "blocks", "cpu(ms)/blk", "written(KB)/blk"))
+        def fmt(value, scale=1.0, precision=1):
+            return "n/a" if value is None or value < 0 else "%.*f" % (precision, value / scale)
+        MB=1024*1024
+        for ext, entry in self.report(includeSeries=False).items():
+            s=entry["summary"]
+            Utils.Print("%6s %8s %12s %12s %12s %10s %12s %8s %12s %14s" % (ext, fmt(s["seconds"]), fmt(s["peakRssBytes"], MB), fmt(s["peakRssShmemBytes"], MB),
+                        fmt(s["peakStateBytes"], MB), fmt(s["cpuSeconds"], precision=2), fmt(s["writeBytes"], MB), fmt(s["blocks"], precision=0),
+                        fmt(s["cpuSecondsPerBlock"], 0.001, 2), fmt(s["writeBytesPerBlock"], 1024)))
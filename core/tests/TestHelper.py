@@ -166,8 +166,16 @@ class TestHelper(object):
                     Utils.Print("cerr={%s}\n" % (err))
                 Utils.Print("== cmd/cout/cerr pairs done. ==")
 
+        # the reports need the nodes still up and their logs in place, but must not keep the cluster from being shut down
+        for report in (cluster.reportResourceUsage, cluster.reportBlockPropagation):
+            try:
+                report()
+            except Exception as ex: # pylint: disable=broad-except
+                Utils.Print("WARNING: %s failed: %s" % (report.__name__, ex))
+
         if killBitconchInstances:
             Utils.Print("Shut down the cluster.")
+            cluster.stopResourceSampler()
             cluster.killall(allInstances=cleanRun)
             if testSuccessful and not keepLogs:
                 Utils.Print("Cleanup cluster data.")
@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from testUtils import Utils
+
+###########################################################################################
+class TransactionRecord(object):
+    """What is kept in memory of a transaction returned by a command."""
+    __slots__=("id", "status", "blockNum", "submitTime", "node")
+
+    def __init__(self, id, status, blockNum, submitTime, node):
+        self.id=id
+        self.status=status
+        self.blockNum=blockNum
+        self.submitTime=submitTime
+        self.node=node
+
+    def __repr__(self):
+        return "TransactionRecord(id=%s, status=%s, blockNum=%s, submitTime=%.3f, node=%s)" % (
+            self.id, self.status, self.blockNum, self.submitTime, self.node)
+
+###########################################################################################
+class TransactionCache(object):
+    """Bounded, least recently used store of the transactions a Node's commands returned. Only the compact
+    TransactionRecord of the newest maxEntries transactions stays in memory. With a spillPath every full trace is
+    appended to that file as one JSON line, and getTrace finds it again through an offset index by transaction id,
+    so traces stay available for post-mortem lookup after their records were evicted."""
+
+    def __init__(self, node, maxEntries=10000, spillPath=None):
+        self.node=node
+        self.maxEntries=maxEntries
+        self.records=OrderedDict()
+        self.evicted=0
+        self.spillPath=spillPath
+        self.spillFile=None
+        self.spillOffsets={}
+        self.lock=threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, transId):
+        return transId in self.records
+
+    def add(self, transId, status, blockNum, trans=None):
+        """Records the transaction, replacing an earlier record of the same id. Returns the replaced record or None."""
+        record=TransactionRecord(transId, status, blockNum, time.time(), self.node)
+        with self.lock:
+            previous=self.records.pop(transId, None)
+            self.records[transId]=record
+            if len(self.records) > self.maxEntries:
+                self.records.popitem(last=False)
+                self.evicted+=1
+            if trans is not None and self.spillPath is not None:
+                self.__spill(transId, trans)
+        return previous
+
+    def __spill(self, transId, trans):
+        if self.spillFile is None:
+            self.spillFile=open(self.spillPath, "ab")
+            if Utils.Debug: Utils.Print("spilling transaction traces of %s to %s" % (self.node, self.spillPath))
+        self.spillOffsets[transId]=self.spillFile.tell()
+        self.spillFile.write(json.dumps(trans, separators=(',', ':')).encode("utf-8") + b"\n")
+
+    def get(self, transId):
+        """The TransactionRecord of transId, None if it was never recorded or has been evicted."""
+        with self.lock:
+            record=self.records.get(transId)
+            if record is not None:
+                self.records.move_to_end(transId)
+            return record
+
+    def getTrace(self, transId):
+        """The full trace last recorded for transId, read back from the spill file, None without one."""
+        with self.lock:
+            offset=self.spillOffsets.get(transId)
+            if offset is None:
+                return None
+            if self.spillFile is not None:
+                self.spillFile.flush()
+        with open(self.spillPath, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline().decode("utf-8"))
+
+    def close(self):
+        """Closes the spill file, getTrace keeps working from it."""
+        with self.lock:
+            if self.spillFile is not None:
+                self.spillFile.close()
+                self.spillFile=None
+
+    def describe(self):
+        spill=", traces spilled to %s" % (self.spillPath) if self.spillOffsets else ""
+        return "%d tracked, %d evicted%s" % (len(self.records), self.evicted, spill)
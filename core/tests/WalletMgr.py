@@ -1,3 +1,5 @@
+import http.client
+import json
 import subprocess
 import time
 import shutil
@@ -8,6 +10,7 @@ import re
 import sys
 
 from testUtils import Utils
+from Keystore import LocalKeystore, KeystoreError
 
 Wallet=namedtuple("Wallet", "name password host port")
 # pylint: disable=too-many-instance-attributes
@@ -16,10 +19,14 @@ class WalletMgr(object):
     __walletLogErrFile="test_kbitconchd_err.log"
     __walletDataDir="test_wallet_0"
     __MaxPort=9999
+    __keyAlreadyInWalletMsg="Key already in wallet"
+    __walletRequestTimeout=30
 
     # pylint: disable=too-many-arguments
     # walletd [True|False] True=Launch wallet(kbitconchd) process; False=Manage launch process externally.
-    def __init__(self, walletd, nodebitconchPort=8888, nodebitconchHost="localhost", port=9899, host="localhost"):
+    # localKeystore [True|False] True=launch() serves the wallet API from an in process keystore instead of kbitconchd,
+    #   defaults to the BITCONCH_TEST_LOCAL_KEYSTORE environment variable being set
+    def __init__(self, walletd, nodebitconchPort=8888, nodebitconchHost="localhost", port=9899, host="localhost", localKeystore=None):
         self.walletd=walletd
         self.nodebitconchPort=nodebitconchPort
         self.nodebitconchHost=nodebitconchHost
@@ -27,6 +34,9 @@ class WalletMgr(object):
         self.host=host
         self.wallets={}
         self.__walletPid=None
+        self.localKeystore=localKeystore if localKeystore is not None else bool(os.environ.get("BITCONCH_TEST_LOCAL_KEYSTORE"))
+        self.keystore=None
+        self.__walletConnection=None
 
     def getWalletEndpointArgs(self):
         if not self.walletd or not self.isLaunched():
@@ -38,7 +48,7 @@ class WalletMgr(object):
         return " --url http://%s:%d%s %s" % (self.nodebitconchHost, self.nodebitconchPort, self.getWalletEndpointArgs(), Utils.MiscBitconchClientArgs)
 
     def isLaunched(self):
-        return self.__walletPid is not None
+        return self.__walletPid is not None or self.keystore is not None
 
     def isLocal(self):
         return self.host=="localhost" or self.host=="127.0.0.1"
@@ -65,6 +75,12 @@ class WalletMgr(object):
         if self.isLocal():
             self.port=self.findAvailablePort()
 
+        if self.localKeystore:
+            Utils.Print("Serving the wallet API from a local keystore on %s:%d" % (self.host, self.port))
+            self.keystore=LocalKeystore()
+            self.keystore.start(self.host, self.port)
+            return True
+
         pgrepCmd=Utils.pgrepCmd(Utils.BitconchWalletName)
         if Utils.Debug:
             portTaken=False
@@ -104,6 +120,17 @@ class WalletMgr(object):
         if wallet is not None:
             if Utils.Debug: Utils.Print("Wallet \"%s\" already exists. Returning same." % name)
             return wallet
+        if self.keystore is not None:
+            try:
+                password=self.keystore.create(name)
+            except KeystoreError as ex:
+                errorMsg="ERROR: Failed to create wallet - %s. %s" % (name, ex.detail)
+                if exitOnError:
+                    Utils.errorExit("%s" % (errorMsg))
+                Utils.Print("%s" % (errorMsg))
+                return None
+            return self.__addWallet(name, password, accounts)
+
         p = re.compile(r'\n\"(\w+)\"\n', re.MULTILINE)
         cmdDesc="wallet create"
         cmd="%s %s %s --name %s --to-console" % (Utils.BitconchClientPath, self.getArgs(), cmdDesc, name)
@@ -146,8 +173,10 @@ class WalletMgr(object):
 
             Utils.Print("ERROR: wallet password parser failure")
             return None
-        p=m.group(1)
-        wallet=Wallet(name, p, self.host, self.port)
+        return self.__addWallet(name, m.group(1), accounts)
+
+    def __addWallet(self, name, password, accounts):
+        wallet=Wallet(name, password, self.host, self.port)
         self.wallets[name] = wallet
 
         if accounts:
@@ -156,48 +185,87 @@ class WalletMgr(object):
         return wallet
 
     def importKeys(self, accounts, wallet, ignoreDupKeyWarning=False):
-        for account in accounts:
-            Utils.Print("Importing keys for account %s into wallet %s." % (account.name, wallet.name))
-            if not self.importKey(account, wallet, ignoreDupKeyWarning):
-                Utils.Print("ERROR: Failed to import key for account %s" % (account.name))
-                return False
+        """Imports the owner and active keys of all accounts. With a launched kbitconchd they all go over one kept
+        alive connection, with the local keystore straight into memory, otherwise through a clbitconch call per key."""
+        Utils.Print("Importing keys for %d accounts into wallet %s." % (len(accounts), wallet.name))
+        return self.__importAccountKeys(accounts, wallet, ignoreDupKeyWarning)
 
     def importKey(self, account, wallet, ignoreDupKeyWarning=False):
-        warningMsg="Key already in wallet"
-        cmd="%s %s wallet import --name %s --private-key %s" % (
-            Utils.BitconchClientPath, self.getArgs(), wallet.name, account.ownerPrivateKey)
-        if Utils.Debug: Utils.Print("cmd: %s" % (cmd))
-        try:
-            Utils.checkOutput(cmd.split())
-        except subprocess.CalledProcessError as ex:
-            msg=ex.output.decode("utf-8")
-            if warningMsg in msg:
-                if not ignoreDupKeyWarning:
-                    Utils.Print("WARNING: This key is already imported into the wallet.")
-            else:
-                Utils.Print("ERROR: Failed to import account owner key %s. %s" % (account.ownerPrivateKey, msg))
-                return False
+        return self.__importAccountKeys([account], wallet, ignoreDupKeyWarning)
 
-        if account.activePrivateKey is None:
-            Utils.Print("WARNING: Active private key is not defined for account \"%s\"" % (account.name))
+    def __importAccountKeys(self, accounts, wallet, ignoreDupKeyWarning):
+        if self.keystore is not None:
+            importPrivateKey=self.__importKeyLocally
+        elif self.walletd and self.isLaunched():
+            importPrivateKey=self.__importKeyOverHttp
         else:
-            cmd="%s %s wallet import --name %s  --private-key %s" % (
-                Utils.BitconchClientPath, self.getArgs(), wallet.name, account.activePrivateKey)
-            if Utils.Debug: Utils.Print("cmd: %s" % (cmd))
-            try:
-                Utils.checkOutput(cmd.split())
-            except subprocess.CalledProcessError as ex:
-                msg=ex.output.decode("utf-8")
-                if warningMsg in msg:
+            importPrivateKey=self.__importKeyWithClient
+
+        for account in accounts:
+            keys=[("owner", account.ownerPrivateKey)]
+            if account.activePrivateKey is None:
+                Utils.Print("WARNING: Active private key is not defined for account \"%s\"" % (account.name))
+            else:
+                keys.append(("active", account.activePrivateKey))
+
+            for role, privateKey in keys:
+                msg=importPrivateKey(wallet, privateKey)
+                if msg is None:
+                    continue
+                if WalletMgr.__keyAlreadyInWalletMsg in msg:
                     if not ignoreDupKeyWarning:
                         Utils.Print("WARNING: This key is already imported into the wallet.")
                 else:
-                    Utils.Print("ERROR: Failed to import account active key %s. %s" %
-                                (account.activePrivateKey, msg))
+                    Utils.Print("ERROR: Failed to import account %s key %s. %s" % (role, privateKey, msg))
+                    Utils.Print("ERROR: Failed to import key for account %s" % (account.name))
                     return False
 
         return True
 
+    # the __importKey* functions return None on success, the error message otherwise
+    def __importKeyLocally(self, wallet, privateKey):
+        try:
+            self.keystore.importKeys(wallet.name, [privateKey])
+        except KeystoreError as ex:
+            return ex.detail
+        return None
+
+    def __importKeyOverHttp(self, wallet, privateKey):
+        (status, body)=self.__walletRequest("import_key", [wallet.name, privateKey])
+        return None if status in (200, 201) else body
+
+    def __importKeyWithClient(self, wallet, privateKey):
+        cmd="%s %s wallet import --name %s --private-key %s" % (
+            Utils.BitconchClientPath, self.getArgs(), wallet.name, privateKey)
+        if Utils.Debug: Utils.Print("cmd: %s" % (cmd))
+        try:
+            Utils.checkOutput(cmd.split())
+        except subprocess.CalledProcessError as ex:
+            return ex.output.decode("utf-8")
+        return None
+
+    def __walletRequest(self, api, params):
+        """Posts params to kbitconchd's /v1/wallet/<api> over the kept alive connection, reconnecting once if kbitconchd
+        closed it. Returns (HTTP status, response body), the status is None if kbitconchd couldn't be reached."""
+        body=json.dumps(params)
+        for attempt in range(2):
+            if self.__walletConnection is None:
+                self.__walletConnection=http.client.HTTPConnection(self.host, self.port, timeout=WalletMgr.__walletRequestTimeout)
+            try:
+                self.__walletConnection.request("POST", "/v1/wallet/%s" % (api), body=body, headers={"Content-Type": "application/json"})
+                response=self.__walletConnection.getresponse()
+                return (response.status, response.read().decode("utf-8"))
+            except (http.client.HTTPException, OSError) as ex:
+                self.__closeWalletConnection()
+                if Utils.Debug: Utils.Print("wallet request %s failed: %s" % (api, ex))
+                if attempt > 0:
+                    return (None, "%s: %s" % (type(ex).__name__, ex))
+
+    def __closeWalletConnection(self):
+        if self.__walletConnection is not None:
+            self.__walletConnection.close()
+            self.__walletConnection=None
+
     def lockWallet(self, wallet):
         cmd="%s %s wallet lock --name %s" % (Utils.BitconchClientPath, self.getArgs(), wallet.name)
         if Utils.Debug: Utils.Print("cmd: %s" % (cmd))
@@ -273,6 +341,8 @@ class WalletMgr(object):
 
     def dumpErrorDetails(self):
         Utils.Print("=================================================================")
+        if self.keystore is not None:
+            Utils.Print("Wallets in the local keystore: %s" % (", ".join(self.keystore.listWallets())))
         if self.__walletPid is not None:
             Utils.Print("Contents of %s:" % (WalletMgr.__walletLogOutFile))
             Utils.Print("=================================================================")
@@ -285,6 +355,12 @@ class WalletMgr(object):
 
     def killall(self, allInstances=False):
         """Kill kbitconch instances. allInstances will kill all kbitconch instances running on the system."""
+        self.__closeWalletConnection()
+        if self.keystore is not None:
+            Utils.Print("Stopping the local keystore")
+            self.keystore.stop()
+            self.keystore=None
+
         if self.__walletPid:
             Utils.Print("Killing wallet manager process %d" % (self.__walletPid))
             os.kill(self.__walletPid, signal.SIGKILL)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+from LogStore import LogRecord
+from LogStore import LogStore
+import BlockPropagation
+from BlockPropagation import Topology
+from BlockPropagation import PropagationTracker
+
+import calendar
+import os
+import shutil
+import tempfile
+
+###############################################################
+# block_propagation_test
+#  Checks the topology read from node configs and the block latencies PropagationTracker derives from node LogStores,
+#  without a running chain.
+###############################################################
+
+Start=calendar.timegm((2018, 6, 1, 0, 0, 0, 0, 0, 0))
+
+def check(condition, msg):
+    if not condition:
+        Utils.errorExit(msg)
+
+def checkDistribution():
+    Utils.Print("Checking percentiles and distributions")
+    values=list(range(1, 101))
+    check(BlockPropagation.percentile(values, 50) == 51 and BlockPropagation.percentile(values, 99) == 99, "percentiles of 1..100 are %s and %s" %
+          (BlockPropagation.percentile(values, 50), BlockPropagation.percentile(values, 99)))
+    check(BlockPropagation.percentile([], 50) is None, "percentile of no values is %s" % (BlockPropagation.percentile([], 50)))
+    dist=BlockPropagation.distribution([30, 10, 20])
+    check(dist == {"count": 3, "min": 10, "p50": 20, "p90": 30, "p99": 30, "max": 30, "mean": 20}, "distribution of 30, 10, 20 is %s" % (dist))
+    check(BlockPropagation.distribution([]) == {"count": 0}, "distribution of no values is %s" % (BlockPropagation.distribution([])))
+
+def writeConfig(ext, listenPort, peerPorts):
+    os.makedirs(Utils.getNodeConfigDir(ext))
+    with open(Utils.getNodeConfigDir(ext, "config.ini"), "w") as f:
+        f.write("http-server-address = 127.0.0.1:%d\n" % (8888 + ext))
+        f.write("p2p-listen-endpoint = 0.0.0.0:%d\n" % (listenPort))
+        for port in peerPorts:
+            f.write("p2p-peer-address = localhost:%d\n" % (port))
+
+def checkTopology():
+    Utils.Print("Checking the topology read from the node configs")
+    # a line 0 - 1 - 2 with node 3 hanging off 1, connections listed on one side only; node 4 has no config
+    writeConfig(0, 9876, [9877])
+    writeConfig(1, 9877, [])
+    writeConfig(2, 9878, [9877, 9999])
+    writeConfig(3, 9879, [9877, 9879])
+    topology=Topology([0, 1, 2, 3, 4])
+    check(topology.neighbors == {0: {1}, 1: {0, 2, 3}, 2: {1}, 3: {1}, 4: set()}, "neighbors are %s" % (topology.neighbors))
+    check(topology.hops(0) == {0: 0, 1: 1, 2: 2, 3: 2}, "hops from node 0 are %s" % (topology.hops(0)))
+    check(topology.hops(4) == {4: 0}, "hops from node 4 are %s" % (topology.hops(4)))
+    return topology
+
+def blockRecord(seconds, verb, blockNum, blockId):
+    return LogRecord(Start + seconds, "info", "thread-0", "producer_plugin.cpp:1", "on_block",
+                     "%s block %s... #%d @ 2018-06-01T00:00:00.000 signed by defproducera" % (verb, blockId, blockNum), blockNum)
+
+def checkTracker(testDir, topology):
+    Utils.Print("Checking the block latencies")
+    stores={ext: LogStore(os.path.join(testDir, "store%d" % (ext))) for ext in range(4)}
+    tracker=PropagationTracker(stores, topology)
+    # block 5 produced by node 0 reaches 1 after 100ms, then 2 and 3 another 50 and 150ms later
+    stores[0].add(blockRecord(10, "Produced", 5, "00000005aa"))
+    stores[1].add(blockRecord(10.1, "Received", 5, "00000005aa"))
+    stores[2].add(blockRecord(10.15, "Received", 5, "00000005aa"))
+    stores[3].add(blockRecord(10.25, "Received", 5, "00000005aa"))
+    tracker.update()
+
+    def rounded(latencies):
+        return {ext: round(ms) for ext, ms in latencies.items()}
+
+    latencies=tracker.blockLatencies()
+    check(list(latencies.keys()) == [(5, "00000005aa")] and rounded(latencies[(5, "00000005aa")]) == {1: 100, 2: 150, 3: 250},
+          "latencies of block 5 are %s" % (latencies))
+    hops={hop: sorted(round(ms) for ms in values) for hop, values in tracker.hopLatencies().items()}
+    check(hops == {1: [100], 2: [50, 150]}, "per hop latencies are %s" % (hops))
+
+    # a competing block 6 of node 2 and block 6 of node 0, both seen by node 1, are told apart by their id. A block seen
+    # again later, and a block whose producer's log was not captured, do not count.
+    stores[2].add(blockRecord(11, "Produced", 6, "00000006bb"))
+    stores[0].add(blockRecord(11.01, "Produced", 6, "00000006cc"))
+    stores[1].add(blockRecord(11.03, "Received", 6, "00000006cc"))
+    stores[1].add(blockRecord(11.04, "Received", 6, "00000006bb"))
+    stores[1].add(blockRecord(12, "Received", 5, "00000005aa"))
+    stores[1].add(blockRecord(12, "Received", 7, "00000007dd"))
+    tracker.update()
+    latencies=tracker.blockLatencies()
+    check(sorted(latencies.keys()) == [(5, "00000005aa"), (6, "00000006bb"), (6, "00000006cc")], "tracked blocks are %s" % (sorted(latencies.keys())))
+    check(rounded(latencies[(5, "00000005aa")]) == {1: 100, 2: 150, 3: 250}, "a block seen again changed its latencies to %s" % (latencies[(5, "00000005aa")]))
+    check(rounded(latencies[(6, "00000006bb")]) == {1: 40} and rounded(latencies[(6, "00000006cc")]) == {1: 20},
+          "latencies of the competing blocks are %s and %s" % (latencies[(6, "00000006bb")], latencies[(6, "00000006cc")]))
+    perNode={ext: sorted(round(ms) for ms in values) for ext, values in tracker.nodeLatencies().items()}
+    check(perNode == {1: [20, 40, 100], 2: [150], 3: [250]}, "per node latencies are %s" % (perNode))
+
+    report=tracker.printReport()
+    check(report["blocks"] == 3 and report["all"]["count"] == 5 and round(report["all"]["max"]) == 250, "report is %s" % (report))
+
+def checkSlowNodes(testDir):
+    Utils.Print("Checking slow node detection")
+    stores={ext: LogStore(os.path.join(testDir, "slow%d" % (ext))) for ext in range(4)}
+    tracker=PropagationTracker(stores)
+    for blockNum in range(1, 21):
+        produced=blockNum * 0.5
+        blockId="%08xee" % (blockNum)
+        stores[0].add(blockRecord(produced, "Produced", blockNum, blockId))
+        stores[1].add(blockRecord(produced + 0.05, "Received", blockNum, blockId))
+        stores[2].add(blockRecord(produced + 0.06, "Received", blockNum, blockId))
+        stores[3].add(blockRecord(produced + 0.3, "Received", blockNum, blockId))
+    tracker.update()
+    check(tracker.slowNodes() == [3], "slow nodes are %s, expected [3]" % (tracker.slowNodes()))
+    check(tracker.slowNodes(minLatencyMs=500) == [], "a node under minLatencyMs was reported slow")
+    check(tracker.slowNodes(minBlocks=21) == [], "nodes with fewer than minBlocks blocks were judged")
+    check(tracker.hopLatencies() == {}, "a tracker without topology has hop latencies")
+
+testDir=tempfile.mkdtemp(prefix="block_propagation_test.")
+Utils.ConfigDir=os.path.join(testDir, "config")
+try:
+    checkDistribution()
+    topology=checkTopology()
+    checkTracker(testDir, topology)
+    checkSlowNodes(testDir)
+finally:
+    shutil.rmtree(testDir, ignore_errors=True)
+
+Utils.Print("block_propagation_test passed")
+exit(0)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+import KeyPool
+
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+
+###############################################################
+# key_pool_test
+#  Checks the key formats, signatures and pool file of KeyPool against known values, without a running chain.
+###############################################################
+
+DevPrivateKey="5KQwrPbwdL6PhXujxW37FSSQZ1JiwsST4cqQzDeyXtP79zkvFD3"
+DevPublicKey="BCC6MRyAjQq8ud7hVNYcfnVPJqcVpscN5So8BhtHuGYqET5GDW5CV"
+
+def check(condition, msg):
+    if not condition:
+        Utils.errorExit(msg)
+
+def checkKeyFormats():
+    Utils.Print("Checking key derivation and formats")
+    publicKey=KeyPool.wifToPublicKey(DevPrivateKey)
+    check(publicKey == DevPublicKey, "dev key derived to %s, expected %s" % (publicKey, DevPublicKey))
+    check(KeyPool.privateKeyToWif(KeyPool.wifToSecret(DevPrivateKey)) == DevPrivateKey, "dev key did not survive a WIF round trip")
+    check(KeyPool.publicKeyPoint(1) == KeyPool.G, "1*G is not G")
+    check(KeyPool.publicKeyPoint(KeyPool.N - 1) == (KeyPool.G[0], KeyPool.P - KeyPool.G[1]), "(N-1)*G is not -G")
+    for _ in range(20):
+        (privateKey, publicKey)=KeyPool.createKeyPair()
+        check(KeyPool.wifToPublicKey(privateKey) == publicKey, "created pair %s %s does not match" % (privateKey, publicKey))
+
+def checkSignatures():
+    Utils.Print("Checking signatures")
+    secret=KeyPool.wifToSecret(DevPrivateKey)
+    for i in range(20):
+        digest=hashlib.sha256(b"key pool test %d" % (i)).digest()
+        signature=KeyPool.signDigest(secret, digest)
+        compact=KeyPool.base58Decode(signature[len("SIG_K1_"):])[:65]
+        check(KeyPool.isCanonical(compact), "signature %s is not canonical" % (signature))
+        check(int.from_bytes(compact[33:], "big") <= KeyPool.N // 2, "signature %s is not low-S" % (signature))
+        recovered=KeyPool.recoverPublicKey(digest, signature)
+        check(recovered == DevPublicKey, "signature %s recovered to %s, expected %s" % (signature, recovered, DevPublicKey))
+        otherDigest=hashlib.sha256(digest).digest()
+        check(KeyPool.recoverPublicKey(otherDigest, signature) != DevPublicKey, "signature %s also verifies another digest" % (signature))
+
+def checkPool(testDir):
+    Utils.Print("Checking the key pool file")
+    pool=KeyPool.KeyPool(os.path.join(testDir, "pool", "keys.txt"), lowWatermark=0, highWatermark=10)
+    pool.refill()
+    check(pool.size() == 10, "refilled pool holds %d key pairs, expected 10" % (pool.size()))
+    for path in (pool.path, pool.lockPath):
+        mode=stat.S_IMODE(os.stat(path).st_mode)
+        check(mode == 0o600, "%s was created with mode %o" % (path, mode))
+    mode=stat.S_IMODE(os.stat(os.path.dirname(pool.path)).st_mode)
+    check(mode & 0o077 == 0, "pool directory was created with mode %o" % (mode))
+
+    taken=pool.take(4)
+    check(pool.size() == 6, "pool holds %d key pairs after taking 4 of 10" % (pool.size()))
+    taken+=pool.take(10)
+    check(len(taken) == 14 and pool.size() == 0, "took %d key pairs, %d left in the pool" % (len(taken), pool.size()))
+    check(len(set(taken)) == len(taken), "the pool handed out a key pair twice")
+    for privateKey, publicKey in taken:
+        check(KeyPool.wifToPublicKey(privateKey) == publicKey, "pooled pair %s %s does not match" % (privateKey, publicKey))
+
+    os.chmod(pool.path, 0o644)
+    check(len(pool.take(2)) == 2, "a refused pool did not fall back to generating keys")
+    os.chmod(pool.path, 0o600)
+
+testDir=tempfile.mkdtemp(prefix="key_pool_test.")
+try:
+    checkKeyFormats()
+    checkSignatures()
+    checkPool(testDir)
+finally:
+    shutil.rmtree(testDir, ignore_errors=True)
+
+Utils.Print("key_pool_test passed")
+exit(0)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+import KeyPool
+from Keystore import LocalKeystore
+from Keystore import KeystoreError
+import Keystore
+
+import copy
+import hashlib
+import http.client
+import json
+
+###############################################################
+# keystore_test
+#  Checks the transaction serialization and the signatures of the in process LocalKeystore, without a running chain.
+###############################################################
+
+DevPrivateKey="5KQwrPbwdL6PhXujxW37FSSQZ1JiwsST4cqQzDeyXtP79zkvFD3"
+DevPublicKey="BCC6MRyAjQq8ud7hVNYcfnVPJqcVpscN5So8BhtHuGYqET5GDW5CV"
+ChainId="cf057bbfb72640471fd910bcb67639c22df9f92470936cddc1ade0e2f2e7dc4f"
+
+Transaction={
+    "expiration": "2018-06-01T00:00:00",
+    "ref_block_num": 1,
+    "ref_block_prefix": 2,
+    "max_net_usage_words": 0,
+    "max_cpu_usage_ms": 0,
+    "delay_sec": 0,
+    "context_free_actions": [],
+    "actions": [{"account": "eosio", "name": "transfer", "authorization": [{"actor": "eosio", "permission": "active"}], "data": "0102"}],
+    "transaction_extensions": [],
+    "signatures": [],
+    "context_free_data": []
+}
+
+# the same transaction serialized by hand: expiration, ref block num and prefix, net, cpu, delay, no context free
+# actions, one action eosio::transfer authorized by eosio@active with 2 bytes of data, no extensions
+PackedTransaction=("808c105b" "0100" "02000000" "00" "00" "00" "00"
+                   "01" "0000000000ea3055" "000000572d3ccdcd" "01" "0000000000ea3055" "00000000a8ed3232" "020102"
+                   "00")
+
+def check(condition, msg):
+    if not condition:
+        Utils.errorExit(msg)
+
+def checkSerialization():
+    Utils.Print("Checking transaction serialization")
+    for name, value in (("eosio", 6138663577826885632), ("active", 3617214756542218240), ("transfer", 14829575313431724032)):
+        check(Keystore.nameToInt(name) == value, "name %s encoded to %d, expected %d" % (name, Keystore.nameToInt(name), value))
+    packed=Keystore.packTransaction(Transaction).hex()
+    check(packed == PackedTransaction, "transaction packed to %s, expected %s" % (packed, PackedTransaction))
+    digest=Keystore.signingDigest(ChainId, Transaction)
+    expected=hashlib.sha256(bytes.fromhex(ChainId + PackedTransaction) + bytes(32)).digest()
+    check(digest == expected, "signing digest %s, expected %s" % (digest.hex(), expected.hex()))
+
+    withData=dict(Transaction, context_free_data=["abcd"])
+    expected=hashlib.sha256(bytes.fromhex(ChainId + PackedTransaction) + hashlib.sha256(bytes.fromhex("0102abcd")).digest()).digest()
+    check(Keystore.signingDigest(ChainId, withData) == expected, "signing digest does not cover the context free data")
+
+def checkSigning():
+    Utils.Print("Checking signatures of the local keystore")
+    keystore=LocalKeystore()
+    keystore.create("test")
+    check(keystore.importKeys("test", [DevPrivateKey]) == [], "importing into an empty wallet reported existing keys")
+    check(keystore.importKeys("test", [DevPrivateKey], ignoreExisting=True) == [DevPublicKey], "a repeated import was not reported")
+    check(keystore.getPublicKeys() == [DevPublicKey], "wallet holds %s" % (keystore.getPublicKeys()))
+
+    trx=keystore.signTransaction(copy.deepcopy(Transaction), [DevPublicKey], ChainId)
+    check(len(trx["signatures"]) == 1, "signed transaction has %d signatures" % (len(trx["signatures"])))
+    digest=hashlib.sha256(bytes.fromhex(ChainId + PackedTransaction) + bytes(32)).digest()
+    recovered=KeyPool.recoverPublicKey(digest, trx["signatures"][0])
+    check(recovered == DevPublicKey, "transaction signature recovered to %s, expected %s" % (recovered, DevPublicKey))
+
+    signature=keystore.signDigest(digest.hex(), DevPublicKey)
+    check(KeyPool.recoverPublicKey(digest, signature) == DevPublicKey, "digest signature does not verify")
+
+    keystore.lockWallet("test")
+    try:
+        keystore.signTransaction(copy.deepcopy(Transaction), [DevPublicKey], ChainId)
+        Utils.errorExit("a locked wallet signed a transaction")
+    except KeystoreError as ex:
+        check(ex.code == 3120004, "locked wallet failed signing with %d, expected 3120004" % (ex.code))
+
+def checkWalletApi():
+    Utils.Print("Checking the wallet API of the local keystore")
+    keystore=LocalKeystore()
+    keystore.start("127.0.0.1", 0)
+    try:
+        connection=http.client.HTTPConnection("127.0.0.1", keystore.server.server_address[1], timeout=10)
+
+        def post(api, params):
+            connection.request("POST", "/v1/wallet/" + api, json.dumps(params))
+            response=connection.getresponse()
+            return (response.status, json.loads(response.read().decode("utf-8")))
+
+        (status, password)=post("create", "default")
+        check(status == 200 and password.startswith("PW"), "create returned %d %s" % (status, password))
+        (status, _)=post("import_key", ["default", DevPrivateKey])
+        check(status == 200, "import_key returned %d" % (status))
+        (status, result)=post("import_key", ["default", DevPrivateKey])
+        check(status == 500 and result["error"]["code"] == 3120002, "a repeated import_key returned %d %s" % (status, result))
+        (status, trx)=post("sign_transaction", [Transaction, [DevPublicKey], ChainId])
+        check(status == 200, "sign_transaction returned %d %s" % (status, trx))
+        digest=Keystore.signingDigest(ChainId, Transaction)
+        check(KeyPool.recoverPublicKey(digest, trx["signatures"][0]) == DevPublicKey, "signature from the wallet API does not verify")
+        (status, _)=post("no_such_api", None)
+        check(status == 404, "an unknown endpoint returned %d" % (status))
+        connection.close()
+    finally:
+        keystore.stop()
+
+checkSerialization()
+checkSigning()
+checkWalletApi()
+
+Utils.Print("keystore_test passed")
+exit(0)
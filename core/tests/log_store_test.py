@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+from LogStore import LogRecord
+from LogStore import LogParser
+from LogStore import LogStore
+from LogStore import LogIngester
+
+import calendar
+import os
+import shutil
+import tempfile
+
+###############################################################
+# log_store_test
+#  Checks the log line parsing, the segment files and queries of LogStore and the log file following of LogIngester,
+#  without a running chain.
+###############################################################
+
+Start=calendar.timegm((2018, 6, 1, 0, 0, 0, 0, 0, 0))
+
+def check(condition, msg):
+    if not condition:
+        Utils.errorExit(msg)
+
+def logLine(seconds, level, message):
+    return "%-5s %s thread-0  producer_plugin.cpp:1234        produce_block        ] %s" % (level, LogRecord.timestampToStr(Start + seconds), message)
+
+def checkParser():
+    Utils.Print("Checking log line parsing")
+    parser=LogParser()
+    record=parser.parse(logLine(1.25, "info", "Produced block 00000005b9ad0e3f... #5 @ 2018-06-01T00:00:01.000"))
+    check(record is not None, "a log line was taken for a continuation")
+    check(record.timestamp == Start + 1.25, "timestamp parsed to %s" % (record.timestamp))
+    check((record.level, record.thread, record.source, record.method) == ("info", "thread-0", "producer_plugin.cpp:1234", "produce_block"),
+          "fields parsed to %s" % (record.toArr()))
+    check(record.blockNum == 5, "block num parsed to %s" % (record.blockNum))
+    check(parser.parse("    at some continuation") is None, "a continuation line was taken for a record")
+    check(record.message.endswith("\n    at some continuation"), "continuation was not appended: %s" % (record.message))
+
+    record=parser.parse("warn  2018-06-01T00:00:02.000 thread-1  net_plugin.cpp: 42 ] no method here")
+    check(record is not None and record.method == "" and record.source == "net_plugin.cpp:42" and record.blockNum is None,
+          "a line without method parsed to %s" % (record.toArr() if record else None))
+    check(LogParser().parse("not a log line") is None, "a leading non log line was parsed")
+
+def records(count, first=0):
+    # one record a second, every third one an error and every other one with a block num
+    return [LogRecord(Start + i, "error" if i % 3 == 0 else "info", "thread-0", "x.cpp:1", "m",
+                      "block #%d" % (i) if i % 2 == 0 else "message %d" % (i), i if i % 2 == 0 else None) for i in range(first, first + count)]
+
+def checkStore(testDir):
+    Utils.Print("Checking LogStore segments and queries")
+    storeDir=os.path.join(testDir, "store")
+    store=LogStore(storeDir, segmentRecords=10, segmentSeconds=1000)
+    for record in records(35):
+        store.add(record)
+    check(len(store.segments) == 3 and len(store.pending) == 5, "%d segments and %d pending records, expected 3 and 5" % (len(store.segments), len(store.pending)))
+    check(store.lastTimestamp() == Start + 34, "last timestamp is %s" % (store.lastTimestamp()))
+
+    def seconds(found):
+        return [int(record.timestamp - Start) for record in found]
+
+    check(seconds(store.query()) == list(range(35)), "a full query returned %s" % (seconds(store.query())))
+    check(seconds(store.query(start=Start + 12, end=Start + 31)) == list(range(12, 32)), "a time range returned %s" % (seconds(store.query(start=Start + 12, end=Start + 31))))
+    check(seconds(store.query(levels={"error"}, start=Start + 20)) == [21, 24, 27, 30, 33], "a level query returned %s" % (seconds(store.query(levels={"error"}, start=Start + 20))))
+    check(seconds(store.query(pattern=r"^message 1\d$")) == [11, 13, 15, 17, 19], "a pattern query returned %s" % (seconds(store.query(pattern=r"^message 1\d$"))))
+    check(seconds(store.query(blockRange=(9, 14))) == [10, 12, 14], "a block range query returned %s" % (seconds(store.query(blockRange=(9, 14)))))
+    check(seconds(store.query(limit=3)) == [32, 33, 34], "a limited query returned %s" % (seconds(store.query(limit=3))))
+    check(str(store.query(start=Start + 3, end=Start + 3)[0]).startswith("error 2018-06-01T00:00:03.000"), "record printed as %s" % (store.query(start=Start + 3)[0]))
+
+    # a reopened store only has the rolled segments, the records that were still pending are gone
+    store=LogStore(storeDir, segmentRecords=10, segmentSeconds=10)
+    check(len(store.segments) == 3, "a reopened store has %d segments, expected 3" % (len(store.segments)))
+    check(seconds(store.query()) == list(range(30)), "a reopened store returned %s" % (seconds(store.query())))
+    for record in records(3, 100) + records(1, 200):
+        store.add(record)
+    check(len(store.segments) == 4 and len(store.pending) == 1, "a record more than segmentSeconds later did not roll the pending ones")
+    check(store.segments[-1]["minBlock"] == 100 and store.segments[-1]["maxBlock"] == 102, "rolled segment is %s" % (store.segments[-1]))
+    store.flush()
+    check(len(store.pending) == 0 and len(store.segments) == 5, "flush left %d records pending" % (len(store.pending)))
+
+def checkIngester(testDir):
+    Utils.Print("Checking LogIngester")
+    dataDir=os.path.join(testDir, "node_00")
+    os.makedirs(dataDir)
+    store=LogStore(os.path.join(testDir, "ingested"))
+    ingester=LogIngester(dataDir, store)
+    check(ingester.poll() == 0, "an empty data dir gave records")
+
+    firstFile=os.path.join(dataDir, "stderr.2018_06_01_00_00_00.txt")
+    with open(firstFile, "w") as f:
+        f.write(logLine(1, "info", "Produced block 00000005b9ad0e3f... #5 @ 2018-06-01T00:00:01.000") + "\n")
+        f.write(logLine(2, "info", "Received block 00000006b9ad0e3f... #6 @ 2018-06-01T00:00:02.000") + "\n")
+        f.write(logLine(3, "info", "Received block 00000007b9a"))
+    check(ingester.poll() == 2, "the partially written last line was ingested")
+    check(ingester.headBlockNum == 6, "head block num is %s, expected 6" % (ingester.headBlockNum))
+    with open(firstFile, "a") as f:
+        f.write("d0e3f... #7 @ 2018-06-01T00:00:03.000\n")
+        f.write(logLine(4, "info", "syncing to #100") + "\n")
+    check(ingester.poll() == 2, "the rest of the log file was not ingested")
+    check(ingester.headBlockNum == 7, "head block num is %s, expected 7, block nums of other messages do not count" % (ingester.headBlockNum))
+
+    with open(os.path.join(dataDir, "stderr.2018_06_01_00_01_00.txt"), "w") as f:
+        f.write(logLine(60, "error", "relaunched") + "\n")
+    check(ingester.poll() == 1, "the log file of a relaunch was not picked up")
+    messages=[record.message for record in store.query()]
+    check(messages[2] == "Received block 00000007b9ad0e3f... #7 @ 2018-06-01T00:00:03.000" and messages[-1] == "relaunched",
+          "ingested messages are %s" % (messages))
+
+testDir=tempfile.mkdtemp(prefix="log_store_test.")
+try:
+    checkParser()
+    checkStore(testDir)
+    checkIngester(testDir)
+finally:
+    shutil.rmtree(testDir, ignore_errors=True)
+
+Utils.Print("log_store_test passed")
+exit(0)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+from MongoClient import MongoClient
+from MongoClient import MongoError
+import MongoClient as mongo
+
+import decimal
+import socket
+import struct
+import threading
+
+###############################################################
+# mongo_client_test
+#  Checks the BSON codec and the OP_MSG exchange of MongoClient against a socket stand in for mongod, without mongod.
+###############################################################
+
+def check(condition, msg):
+    if not condition:
+        Utils.errorExit(msg)
+
+def checkBson():
+    Utils.Print("Checking BSON encoding and decoding")
+    # the example document of bsonspec.org
+    helloWorld=b"\x16\x00\x00\x00\x02hello\x00\x06\x00\x00\x00world\x00\x00"
+    check(mongo.encodeDocument({"hello": "world"}) == helloWorld, "{hello: world} encoded to %s" % (mongo.encodeDocument({"hello": "world"})))
+    check(mongo.decodeDocument(helloWorld) == ({"hello": "world"}, len(helloWorld)), "{hello: world} did not decode")
+
+    # low 8 bytes then high 8 bytes, little endian, as the Decimal128 tests of the BSON specification give them
+    for text, encoded in (("1", "01000000000000000000000000004030"), ("-0.1", "01000000000000000000000000003eb0"),
+                          ("1E+6111", "0100000000000000000000000000fe5f"), ("NaN", "0000000000000000000000000000007c"),
+                          ("Infinity", "00000000000000000000000000000078"), ("-Infinity", "000000000000000000000000000000f8"),
+                          ("9999999999999999999999999999999999", "ffffffff638e8d37c087adbe09ed4130")):
+        value=decimal.Decimal(text)
+        check(mongo.encodeDecimal128(value).hex() == encoded, "Decimal128 %s encoded to %s, expected %s" % (text, mongo.encodeDecimal128(value).hex(), encoded))
+        check(str(mongo.decodeDecimal128(bytes.fromhex(encoded))) == text, "Decimal128 %s decoded to %s" % (encoded, mongo.decodeDecimal128(bytes.fromhex(encoded))))
+    try:
+        mongo.encodeDecimal128(decimal.Decimal("1" * 35))
+        Utils.errorExit("a 35 digit decimal was encoded as Decimal128")
+    except MongoError:
+        pass
+
+    doc={"string": "text é", "int32": -5, "int64": mongo.Int64(7), "bigint": 2**40, "double": 1.5, "true": True,
+         "null": None, "oid": mongo.ObjectId("5b0e7e0a1c9d440000a1b2c3"), "date": mongo.IsoDate(1527811200123),
+         "timestamp": mongo.Timestamp(1527811200, 3), "decimal": decimal.Decimal("-12345.6789"), "binary": b"\x00\x01\xff",
+         "document": {"nested": [1, "two", {"three": 3.0}]}, "array": []}
+    (decoded, end)=mongo.decodeDocument(mongo.encodeDocument(doc))
+    check(decoded == doc, "document did not round trip: %s" % (decoded))
+    check(end == len(mongo.encodeDocument(doc)), "decoding stopped at %d" % (end))
+    for name, value in doc.items():
+        # an int beyond int32 goes out as int64 and comes back typed as one
+        expected=mongo.Int64 if name == "bigint" else type(value)
+        check(type(decoded[name]) is expected, "%s decoded as %s, expected %s" % (name, type(decoded[name]).__name__, expected.__name__))
+    check(decoded["date"].millis == 1527811200123 and str(decoded["date"]) == "2018-06-01T00:00:00.123Z", "date decoded to %s" % (decoded["date"]))
+    check(mongo.extendedJsonValue(decoded["decimal"]) == {"$numberDecimal": "-12345.6789"}, "decimal extended JSON is %s" % (mongo.extendedJsonValue(decoded["decimal"])))
+
+###########################################################################################
+class MongodStandIn(object):
+    """Answers OP_MSG commands on a local socket: ping, a find that needs a getMore, a failing command and replies
+    with a wrong responseTo or opCode."""
+
+    def __init__(self):
+        self.listener=socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+        self.port=self.listener.getsockname()[1]
+        self.connections=0
+        self.commands=[]
+        threading.Thread(target=self.__accept, daemon=True).start()
+
+    def __accept(self):
+        while True:
+            try:
+                (conn, _)=self.listener.accept()
+            except OSError:
+                return
+            self.connections+=1
+            threading.Thread(target=self.__serve, args=(conn,), daemon=True).start()
+
+    def __serve(self, conn):
+        try:
+            with conn:
+                self.__answer(conn)
+        except OSError:
+            # the client closes connections whose reply it rejected
+            pass
+
+    def __answer(self, conn):
+        while True:
+            header=conn.recv(16, socket.MSG_WAITALL)
+            if len(header) < 16:
+                return
+            (length, requestId, _, opCode)=struct.unpack("<iiii", header)
+            body=conn.recv(length - 16, socket.MSG_WAITALL)
+            (cmd, _)=mongo.decodeDocument(body, 5)
+            self.commands.append(cmd)
+            name=next(iter(cmd))
+            (reply, responseTo, replyOpCode)=({"ok": 1.0}, requestId, opCode)
+            if name == "find":
+                reply={"cursor": {"firstBatch": [{"n": 1}, {"n": 2}], "id": mongo.Int64(42), "ns": "test." + cmd["find"]}, "ok": 1.0}
+            elif name == "getMore":
+                reply={"cursor": {"nextBatch": [{"n": 3}], "id": mongo.Int64(0), "ns": "test." + cmd["collection"]}, "ok": 1.0}
+            elif name == "fail":
+                reply={"ok": 0.0, "errmsg": "no such command: 'fail'", "code": 59}
+            elif name == "wrongResponseTo":
+                responseTo=requestId + 1
+            elif name == "wrongOpCode":
+                replyOpCode=1
+            payload=struct.pack("<I", 0) + b"\x00" + mongo.encodeDocument(reply)
+            conn.sendall(struct.pack("<iiii", 16 + len(payload), 1, responseTo, replyOpCode) + payload)
+
+    def close(self):
+        self.listener.close()
+
+def checkOpMsg():
+    Utils.Print("Checking OP_MSG commands against a mongod stand in")
+    standIn=MongodStandIn()
+    client=MongoClient("127.0.0.1", standIn.port, "test")
+    try:
+        check(client.command({"ping": 1})["ok"] == 1.0, "ping failed")
+        check(standIn.commands[-1] == {"ping": 1, "$db": "test"}, "mongod received %s" % (standIn.commands[-1]))
+        docs=client.find("blocks", {"block_num": 5}, sort={"block_num": 1})
+        check(docs == [{"n": 1}, {"n": 2}, {"n": 3}], "find returned %s" % (docs))
+        check(standIn.commands[-1] == {"getMore": 42, "collection": "blocks", "$db": "test"}, "getMore sent as %s" % (standIn.commands[-1]))
+        check(standIn.connections == 1 and len(client.idle) == 1, "%d connections opened, %d idle" % (standIn.connections, len(client.idle)))
+
+        try:
+            client.command({"fail": 1})
+            Utils.errorExit("a failed command did not raise")
+        except MongoError as ex:
+            check(ex.code == 59, "failed command raised code %s" % (ex.code))
+        check(len(client.idle) == 1, "the connection was not kept after a failed command")
+
+        for name in ("wrongResponseTo", "wrongOpCode"):
+            try:
+                client.command({name: 1})
+                Utils.errorExit("a reply with %s was accepted" % (name))
+            except MongoError as ex:
+                check(ex.code is None, "%s raised code %s" % (name, ex.code))
+            check(len(client.idle) == 0, "the connection was pooled after a reply with %s" % (name))
+            check(client.command({"ping": 1})["ok"] == 1.0, "ping after %s failed" % (name))
+        check(standIn.connections == 3, "%d connections opened, expected 3" % (standIn.connections))
+    finally:
+        client.close()
+        standIn.close()
+
+    unused=socket.socket()
+    unused.bind(("127.0.0.1", 0))
+    port=unused.getsockname()[1]
+    unused.close()
+    try:
+        MongoClient("127.0.0.1", port, "test", timeout=5).command({"ping": 1})
+        Utils.errorExit("a command against a closed port did not raise")
+    except MongoError:
+        pass
+
+checkBson()
+checkOpMsg()
+
+Utils.Print("mongo_client_test passed")
+exit(0)
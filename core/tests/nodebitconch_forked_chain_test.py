@@ -8,6 +8,7 @@ from WalletMgr import WalletMgr
 from Node import BlockType
 from Node import Node
 from TestHelper import TestHelper
+from ForkTracker import ForkTracker
 
 import decimal
 import math
@@ -23,87 +24,46 @@ Print=Utils.Print
 
 from core_symbol import CORE_SYMBOL
 
-def analyzeBPs(bps0, bps1, expectDivergence):
-    start=0
-    index=None
-    length=len(bps0)
-    firstDivergence=None
+def analyzeBPs(forkTracker, start, end, expectDivergence):
+    """Compare what prodNodes 0 and 1 reported for blocks start..end (exclusive end) in forkTracker and return the first divergent block num."""
+    (firstDivergence, reconverged)=forkTracker.compare(0, 1, start, end)
     errorInDivergence=False
-    analysysPass=0
-    bpsStr=None
-    bpsStr0=None
-    bpsStr1=None
-    while start < length:
-        analysysPass+=1
-        bpsStr=None
-        for i in range(start,length):
-            bp0=bps0[i]
-            bp1=bps1[i]
-            if bpsStr is None:
-                bpsStr=""
-            else:
-                bpsStr+=", "
-            blockNum0=bp0["blockNum"]
-            prod0=bp0["prod"]
-            blockNum1=bp1["blockNum"]
-            prod1=bp1["prod"]
-            numDiff=True if blockNum0!=blockNum1 else False
-            prodDiff=True if prod0!=prod1 else False
-            if numDiff or prodDiff:
-                index=i
-                if firstDivergence is None:
-                    firstDivergence=min(blockNum0, blockNum1)
-                if not expectDivergence:
-                    errorInDivergence=True
-                break
-            bpsStr+=str(blockNum0)+"->"+prod0
-
-        if index is None:
-            if expectDivergence:
-                errorInDivergence=True
-                break
+    if firstDivergence is None:
+        if not expectDivergence:
             return None
-
-        bpsStr0=None
-        bpsStr2=None
-        start=length
-        for i in range(index,length):
-            if bpsStr0 is None:
-                bpsStr0=""
-                bpsStr1=""
-            else:
-                bpsStr0+=", "
-                bpsStr1+=", "
-            bp0=bps0[i]
-            bp1=bps1[i]
-            blockNum0=bp0["blockNum"]
-            prod0=bp0["prod"]
-            blockNum1=bp1["blockNum"]
-            prod1=bp1["prod"]
-            numDiff="*" if blockNum0!=blockNum1 else ""
-            prodDiff="*" if prod0!=prod1 else ""
-            if not numDiff and not prodDiff:
-                start=i
-                index=None
-                if expectDivergence:
-                    errorInDivergence=True
-                break
-            bpsStr0+=str(blockNum0)+numDiff+"->"+prod0+prodDiff
-            bpsStr1+=str(blockNum1)+numDiff+"->"+prod1+prodDiff
-        if errorInDivergence:
-            break
+        errorInDivergence=True
+    elif not expectDivergence or reconverged is not None:
+        errorInDivergence=True
 
     if errorInDivergence:
         msg="Failed analyzing block producers - "
         if expectDivergence:
-            msg+="nodes do not indicate different block producers for the same blocks, but they are expected to diverge at some point."
+            if firstDivergence is None:
+                msg+="nodes do not indicate different block producers for the same blocks, but they are expected to diverge at some point."
+            else:
+                msg+="nodes diverged at block %d, but report the same block again at block %d." % (firstDivergence, reconverged)
         else:
             msg+="did not expect nodes to indicate different block producers for the same blocks."
-        msg+="\n  Matching Blocks= %s \n  Diverging branch node0= %s \n  Diverging branch node1= %s" % (bpsStr,bpsStr0,bpsStr1)
+        msg+="\n  node0= %s \n  node1= %s" % (forkTracker.describe(0, start, end, other=1), forkTracker.describe(1, start, end, other=0))
         Utils.errorExit(msg)
 
     return firstDivergence
 
+def trackBlock(forkTracker, prodNodes, blockNum):
+    """Feed the blocks the producing nodes reported for blockNum (kept in their producer timelines) to forkTracker."""
+    for i in range(0, len(prodNodes)):
+        entry=prodNodes[i].producerTimeline.entries.get(blockNum)
+        if entry is not None:
+            forkTracker.addBlock(i, blockNum, entry.id, entry.previous, entry.producer)
+
+def splitRangeTimeout(node, start, end, inRowCountPerProducer):
+    """Seconds to wait for node to reach block end while it is cut off from the other producing node, so only its own
+    producers add blocks: each round of maxActiveProducers*inRowCountPerProducer half second slots adds
+    len(node.producers)*inRowCountPerProducer blocks. One extra round covers where in the schedule the wait starts."""
+    blocksPerRound=min(len(node.producers), maxActiveProducers)*inRowCountPerProducer
+    rounds=math.ceil((end - start + 1) / max(1, blocksPerRound)) + 1
+    return Utils.systemWaitTimeout + rounds*maxActiveProducers*inRowCountPerProducer/2
+
 def getMinHeadAndLib(prodNodes):
     info0=prodNodes[0].getInfo(exitOnError=True)
     info1=prodNodes[1].getInfo(exitOnError=True)
@@ -308,10 +268,7 @@ try:
     # will search full cycle after the current block, since we don't know how many blocks were produced since retrieving
     # block number and issuing kill command
     postKillBlockNum=prodNodes[1].getBlockNum()
-    blockProducers0=[]
-    blockProducers1=[]
-    libs0=[]
-    libs1=[]
+    forkTracker=ForkTracker()
     lastBlockNum=max([preKillBlockNum,postKillBlockNum])+2*maxActiveProducers*inRowCountPerProducer
     actualLastBlockNum=None
     prodChanged=False
@@ -325,12 +282,12 @@ try:
         #avoiding getting LIB until my current block passes the head from the last time I checked
         if blockNum>headBlockNum:
             (headBlockNum, libNumAroundDivergence)=getMinHeadAndLib(prodNodes)
+            forkTracker.prune(libNumAroundDivergence)
 
         # track the block number and producer from each producing node
         blockProducer0=prodNodes[0].getBlockProducerByNum(blockNum)
         blockProducer1=prodNodes[1].getBlockProducerByNum(blockNum)
-        blockProducers0.append({"blockNum":blockNum, "prod":blockProducer0})
-        blockProducers1.append({"blockNum":blockNum, "prod":blockProducer1})
+        trackBlock(forkTracker, prodNodes, blockNum)
 
         #in the case that the preKillBlockNum was also produced by killAtProducer, ensure that we have
         #at least one producer transition before checking for killAtProducer
@@ -368,12 +325,10 @@ try:
 
     Print("Analyzing the producers leading up to the block after killing the non-producing node, expecting divergence at %d" % (blockNum))
 
-    firstDivergence=analyzeBPs(blockProducers0, blockProducers1, expectDivergence=True)
+    firstDivergence=analyzeBPs(forkTracker, preKillBlockNum, blockNum+1, expectDivergence=True)
     # Nodes should not have diverged till the last block
     if firstDivergence!=blockNum:
         Utils.errorExit("Expected to diverge at %s, but diverged at %s." % (firstDivergence, blockNum))
-    blockProducers0=[]
-    blockProducers1=[]
 
     for prodNode in prodNodes:
         info=prodNode.getInfo()
@@ -384,20 +339,17 @@ try:
 
     Print("Tracking the blocks from the divergence till there are 10*12 blocks on one chain and 10*12+1 on the other, from block %d to %d" % (killBlockNum, lastBlockNum))
 
-    for blockNum in range(killBlockNum,lastBlockNum):
-        blockProducer0=prodNodes[0].getBlockProducerByNum(blockNum)
-        blockProducer1=prodNodes[1].getBlockProducerByNum(blockNum)
-        blockProducers0.append({"blockNum":blockNum, "prod":blockProducer0})
-        blockProducers1.append({"blockNum":blockNum, "prod":blockProducer1})
+    forkTracker.addBlocks(0, prodNodes[0].getBlockRange(killBlockNum, lastBlockNum-1,
+                          timeout=splitRangeTimeout(prodNodes[0], killBlockNum, lastBlockNum-1, inRowCountPerProducer)))
+    forkTracker.addBlocks(1, prodNodes[1].getBlockRange(killBlockNum, lastBlockNum-1,
+                          timeout=splitRangeTimeout(prodNodes[1], killBlockNum, lastBlockNum-1, inRowCountPerProducer)))
 
 
     Print("Analyzing the producers from the divergence to the lastBlockNum and verify they stay diverged, expecting divergence at block %d" % (killBlockNum))
 
-    firstDivergence=analyzeBPs(blockProducers0, blockProducers1, expectDivergence=True)
+    firstDivergence=analyzeBPs(forkTracker, killBlockNum, lastBlockNum, expectDivergence=True)
     if firstDivergence!=killBlockNum:
         Utils.errorExit("Expected to diverge at %s, but diverged at %s." % (firstDivergence, killBlockNum))
-    blockProducers0=[]
-    blockProducers1=[]
 
     for prodNode in prodNodes:
         info=prodNode.getInfo()
@@ -424,6 +376,7 @@ try:
         checkMatchBlock=killBlockNum if not checkHead else prodNodes[0].getBlockNum()
         blockProducer0=prodNodes[0].getBlockProducerByNum(checkMatchBlock)
         blockProducer1=prodNodes[1].getBlockProducerByNum(checkMatchBlock)
+        trackBlock(forkTracker, prodNodes, checkMatchBlock)
         match=blockProducer0==blockProducer1
         if match:
             if checkHead:
@@ -444,28 +397,21 @@ try:
 
     Print("Identifying the producers from the saved LIB to the current highest head, from block %d to %d" % (libNumAroundDivergence, endBlockNum))
 
-    for blockNum in range(libNumAroundDivergence,endBlockNum):
-        blockProducer0=prodNodes[0].getBlockProducerByNum(blockNum)
-        blockProducer1=prodNodes[1].getBlockProducerByNum(blockNum)
-        blockProducers0.append({"blockNum":blockNum, "prod":blockProducer0})
-        blockProducers1.append({"blockNum":blockNum, "prod":blockProducer1})
+    forkTracker.addBlocks(0, prodNodes[0].getBlockRange(libNumAroundDivergence, endBlockNum-1,
+                          timeout=splitRangeTimeout(prodNodes[0], libNumAroundDivergence, endBlockNum-1, inRowCountPerProducer)))
+    forkTracker.addBlocks(1, prodNodes[1].getBlockRange(libNumAroundDivergence, endBlockNum-1,
+                          timeout=splitRangeTimeout(prodNodes[1], libNumAroundDivergence, endBlockNum-1, inRowCountPerProducer)))
 
 
     Print("Analyzing the producers from the saved LIB to the current highest head and verify they match now")
 
-    analyzeBPs(blockProducers0, blockProducers1, expectDivergence=False)
+    analyzeBPs(forkTracker, libNumAroundDivergence, endBlockNum, expectDivergence=False)
 
-    resolvedKillBlockProducer=None
-    for prod in blockProducers0:
-        if prod["blockNum"]==killBlockNum:
-            resolvedKillBlockProducer = prod["prod"]
+    resolvedKillBlockProducer=forkTracker.producer(0, killBlockNum)
     if resolvedKillBlockProducer is None:
-        Utils.errorExit("Did not find find block %s (the original divergent block) in blockProducers0, test setup is wrong.  blockProducers0: %s" % (killBlockNum, ", ".join(blockProducers)))
+        Utils.errorExit("Did not find find block %s (the original divergent block) in the blocks reported by node0, test setup is wrong.  node0: %s" % (killBlockNum, forkTracker.describe(0, libNumAroundDivergence, endBlockNum)))
     Print("Fork resolved and determined producer %s for block %s" % (resolvedKillBlockProducer, killBlockNum))
 
-    blockProducers0=[]
-    blockProducers1=[]
-
     testSuccessful=True
 finally:
     TestHelper.shutdown(cluster, walletMgr, testSuccessful=testSuccessful, killBitconchInstances=killBitconchInstances, killWallet=killWallet, keepLogs=keepLogs, cleanRun=killAll, dumpErrorDetails=dumpErrorDetails)
@@ -17,14 +17,14 @@ import re
 # --dump-error-details <Upon error print etc/bitconchio/node_*/config.ini and var/lib/node_*/stderr.log to stdout>
 # --keep-logs <Don't delete var/lib/node_* folders upon test completion>
 ###############################################################
-def isValidBlockProducer(prodsActive, blockNum, node):
-    blockProducer=node.getBlockProducerByNum(blockNum)
+def isValidBlockProducer(prodsActive, blockNum, timeline):
+    blockProducer=timeline.producer(blockNum, refresh=False)
     if blockProducer not in prodsActive:
         return False
     return prodsActive[blockProducer]
 
-def validBlockProducer(prodsActive, prodsSeen, blockNum, node):
-    blockProducer=node.getBlockProducerByNum(blockNum)
+def validBlockProducer(prodsActive, prodsSeen, blockNum, timeline):
+    blockProducer=timeline.producer(blockNum, refresh=False)
     if blockProducer not in prodsActive:
         Utils.cmdError("unexpected block producer %s at blockNum=%s" % (blockProducer,blockNum))
         Utils.errorExit("Failed because of invalid block producer")
@@ -61,13 +61,23 @@ def verifyProductionRounds(trans, node, prodsActive, rounds):
 
     temp=Utils.Debug
     Utils.Debug=False
+    prodsSize = len(prodsActive)
+    # retrieve the blocks needed to line up with a production round and verify the rounds in one sweep,
+    # anything past that is fetched on demand by the timelines. The swept blocks are read as retrieved (refresh=False)
+    # instead of being refetched one by one while they are still reversible
+    sweepEnd=blockNum + (rounds + 1) * prodsSize * 12
+    node.getBlockRange(blockNum, sweepEnd)
+    node1.getBlockRange(blockNum, sweepEnd)
+    timeline=node.producerTimeline
+    timeline1=node1.producerTimeline
+
     Utils.Print("FIND VALID BLOCK PRODUCER")
-    blockProducer=node.getBlockProducerByNum(blockNum)
+    blockProducer=timeline.producer(blockNum, refresh=False)
     lastBlockProducer=blockProducer
     adjust=False
-    while not isValidBlockProducer(prodsActive, blockNum, node):
+    while not isValidBlockProducer(prodsActive, blockNum, timeline):
         adjust=True
-        blockProducer=node.getBlockProducerByNum(blockNum)
+        blockProducer=timeline.producer(blockNum, refresh=False)
         if lastBlockProducer!=blockProducer:
             Utils.Print("blockProducer=%s for blockNum=%s is for node=%s" % (blockProducer, blockNum, ProducerToNode.map[blockProducer]))
         lastBlockProducer=blockProducer
@@ -98,7 +108,7 @@ def verifyProductionRounds(trans, node, prodsActive, rounds):
                     Utils.Print("saw=%s, blockProducer=%s, blockNum=%s" % (saw,blockProducer,blockNum))
                 lastBlockProducer=blockProducer
                 saw=1
-        blockProducer=node.getBlockProducerByNum(blockNum)
+        blockProducer=timeline.producer(blockNum, refresh=False)
         blockNum+=1
 
     if adjust:
@@ -110,20 +120,19 @@ def verifyProductionRounds(trans, node, prodsActive, rounds):
     reportFirstMissedBlock=False
     Utils.Print("Verify %s complete rounds of all producers producing" % (rounds))
 
-    prodsSize = len(prodsActive)
     for i in range(0, rounds):
         prodsSeen={}
         lastBlockProducer=None
         for j in range(0, prodsSize):
             # each new set of 12 blocks should have a different blockProducer 
-            if lastBlockProducer is not None and lastBlockProducer==node.getBlockProducerByNum(blockNum):
+            if lastBlockProducer is not None and lastBlockProducer==timeline.producer(blockNum, refresh=False):
                 Utils.cmdError("expected blockNum %s to be produced by any of the valid producers except %s" % (blockNum, lastBlockProducer))
                 Utils.errorExit("Failed because of incorrect block producer order")
 
             # make sure that the next set of 12 blocks all have the same blockProducer
-            lastBlockProducer=node.getBlockProducerByNum(blockNum)
+            lastBlockProducer=timeline.producer(blockNum, refresh=False)
             for k in range(0, 12):
-                blockProducer = validBlockProducer(prodsActive, prodsSeen, blockNum, node1)
+                blockProducer = validBlockProducer(prodsActive, prodsSeen, blockNum, timeline1)
                 if lastBlockProducer!=blockProducer:
                     if not reportFirstMissedBlock:
                         printStr=""
@@ -131,7 +140,7 @@ def verifyProductionRounds(trans, node, prodsActive, rounds):
                         for l in range(0,36):
                             printStr+="%s" % (newBlockNum)
                             printStr+=":"
-                            newBlockProducer=node.getBlockProducerByNum(newBlockNum)
+                            newBlockProducer=timeline.producer(newBlockNum, refresh=False)
                             printStr+="%s" % (newBlockProducer)
                             printStr+="  "
                             newBlockNum+=1
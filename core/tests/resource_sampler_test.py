@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+from testUtils import Utils
+from ResourceSampler import RingBuffer
+from ResourceSampler import ResourceSampler
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+###############################################################
+# resource_sampler_test
+#  Checks the ring buffer, the /proc sampling and the summaries of ResourceSampler against processes of its own,
+#  without a running chain.
+###############################################################
+
+def check(condition, msg):
+    if not condition:
+        Utils.errorExit(msg)
+
+class FakeNode(object):
+    def __init__(self, pid):
+        self.pid=pid
+
+def checkRingBuffer():
+    Utils.Print("Checking the ring buffer")
+    buffer=RingBuffer(("a", "b"), 4)
+    check(len(buffer) == 0 and buffer.column("a") == [], "a new buffer holds %s" % (buffer.column("a")))
+    for i in range(3):
+        buffer.append((i, 10*i))
+    check(len(buffer) == 3 and buffer.column("b") == [0, 10, 20], "a partly filled buffer holds %s" % (buffer.column("b")))
+    for i in range(3, 7):
+        buffer.append((i, 10*i))
+    check(len(buffer) == 4 and buffer.column("a") == [3, 4, 5, 6], "a wrapped buffer holds %s" % (buffer.column("a")))
+
+def checkSampleNode():
+    Utils.Print("Checking the sampling of a process")
+    (cpuSeconds, rss, rssShmem, readBytes, writeBytes, stateBytes)=ResourceSampler.sampleNode(0, os.getpid())
+    check(cpuSeconds >= 0, "own cpu time sampled as %s" % (cpuSeconds))
+    check(rss > 0 and rss % 1024 == 0 and rssShmem >= 0, "own RSS sampled as %s, shared %s" % (rss, rssShmem))
+    # /proc/<pid>/io is not readable everywhere, but then both counters are missing
+    check((readBytes >= 0) == (writeBytes >= 0), "io sampled as read %s write %s" % (readBytes, writeBytes))
+    check(stateBytes == -1, "a missing state file sampled as %s" % (stateBytes))
+
+    with open(Utils.getNodeDataDir(0, os.path.join("state", "shared_memory.bin")), "wb") as f:
+        f.write(b"\x01" * 8192)
+        # sparse beyond what was written
+        f.truncate(1024*1024)
+    stateBytes=ResourceSampler.sampleNode(0, None)[-1]
+    check(8192 <= stateBytes < 1024*1024, "a sparse state file sampled as %d bytes allocated" % (stateBytes))
+
+    process=subprocess.Popen(["sleep", "60"])
+    process.kill()
+    process.wait()
+    check(ResourceSampler.sampleNode(1, process.pid) == (-1,)*6, "an exited process sampled as %s" % (ResourceSampler.sampleNode(1, process.pid),))
+
+def checkSummary(testDir):
+    Utils.Print("Checking the samples and summaries")
+    nodes=[(0, FakeNode(os.getpid())), (1, FakeNode(None))]
+    heads={0: 100, 1: None}
+    sampler=ResourceSampler(lambda: nodes, lambda ext: heads[ext], capacity=3)
+    for _ in range(5):
+        sampler.sample()
+        heads[0]+=2
+
+    series=sampler.series(0)
+    check(len(series["time"]) == 3 and series["headBlockNum"] == [104, 106, 108], "sampled head blocks %s" % (series["headBlockNum"]))
+    check(sampler.series(2) is None and sampler.summary(2) is None, "an unsampled node has a series")
+    summary=sampler.summary(0)
+    check(summary["samples"] == 3 and summary["blocks"] == 4, "summary of samples and blocks is %s" % (summary))
+    check(summary["cpuSeconds"] >= 0 and summary["cpuSecondsPerBlock"] == summary["cpuSeconds"] / 4, "cpu summary is %s" % (summary))
+    check(summary["peakRssBytes"] == max(series["rssBytes"]), "peak RSS is %s of %s" % (summary["peakRssBytes"], series["rssBytes"]))
+    check(summary["peakStateBytes"] >= 8192, "state file of node 0 summarized as %s" % (summary["peakStateBytes"]))
+
+    summary=sampler.summary(1)
+    check(summary["blocks"] is None and summary["cpuSeconds"] is None and summary["cpuSecondsPerBlock"] is None,
+          "a node without pid or head block summarized as %s" % (summary))
+    check(summary["peakRssBytes"] == -1 and summary["peakStateBytes"] == -1, "unreadable values of node 1 summarized as %s" % (summary))
+
+    fileName=os.path.join(testDir, "resources.json")
+    sampler.writeReport(fileName)
+    with open(fileName, "r") as f:
+        report=json.load(f)
+    check(sorted(report.keys()) == ["0", "1"], "report covers nodes %s" % (sorted(report.keys())))
+    check(report["0"]["series"]["headBlockNum"] == [104, 106, 108] and report["0"]["summary"]["blocks"] == 4, "report of node 0 is %s" % (report["0"]))
+    sampler.printSummary()
+
+    sampler=ResourceSampler(lambda: nodes, interval=0.05)
+    sampler.start()
+    sampler.start()
+    time.sleep(0.3)
+    sampler.stop()
+    samples=len(sampler.series(0)["time"])
+    check(samples >= 2, "the sampler thread took %d samples" % (samples))
+    sampler.stop()
+
+testDir=tempfile.mkdtemp(prefix="resource_sampler_test.")
+Utils.DataDir=testDir
+try:
+    for ext in (0, 1):
+        os.makedirs(Utils.getNodeDataDir(ext, "state"))
+    checkRingBuffer()
+    checkSampleNode()
+    checkSummary(testDir)
+finally:
+    shutil.rmtree(testDir, ignore_errors=True)
+
+Utils.Print("resource_sampler_test passed")
+exit(0)
@@ -6,14 +6,85 @@ import os
 import platform
 from collections import deque
 from collections import namedtuple
-import inspect
 import json
 import shlex
 import socket
+import sys
 from sys import stdout
 from sys import exit
 import traceback
 
+###########################################################################################
+class Log:
+    """Output of the test harness. A call below the active Level returns before looking at its arguments, so keep
+    expensive formatting out of the call, or behind "if Log.enabled(level)". Lines are indented by call depth, found by
+    following the caller's frame links rather than materializing the stack with its source context. Configured with
+    BITCONCH_TEST_LOG_LEVEL (debug, info, warning, error), BITCONCH_TEST_LOG_FORMAT (text or json, one object per line
+    with timestamp, level, depth, source file and line) and BITCONCH_TEST_LOG_TIMESTAMPS (prefix text lines with the time)."""
+    DEBUG=10
+    INFO=20
+    WARNING=30
+    ERROR=40
+    LevelNames={DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+
+    Level={name: level for level, name in LevelNames.items()}.get(os.environ.get("BITCONCH_TEST_LOG_LEVEL", "info").lower(), INFO)
+    Json=os.environ.get("BITCONCH_TEST_LOG_FORMAT", "text").lower() == "json"
+    Timestamps=bool(os.environ.get("BITCONCH_TEST_LOG_TIMESTAMPS"))
+
+    @staticmethod
+    def enabled(level):
+        return level >= Log.Level or (level == Log.DEBUG and Utils.Debug)
+
+    @staticmethod
+    def debug(*args, **kwargs):
+        if Log.DEBUG >= Log.Level or Utils.Debug:
+            Log.write(Log.DEBUG, args, kwargs)
+
+    @staticmethod
+    def info(*args, **kwargs):
+        if Log.INFO >= Log.Level:
+            Log.write(Log.INFO, args, kwargs)
+
+    @staticmethod
+    def warning(*args, **kwargs):
+        if Log.WARNING >= Log.Level:
+            Log.write(Log.WARNING, args, kwargs)
+
+    @staticmethod
+    def error(*args, **kwargs):
+        if Log.ERROR >= Log.Level:
+            Log.write(Log.ERROR, args, kwargs)
+
+    @staticmethod
+    def write(level, args, kwargs):
+        """Writes args like print(*args, **kwargs). Only called through a single level function (debug, info, ...
+        or Utils.Print), whose caller is the frame the depth and source location are taken from."""
+        caller=sys._getframe(2)
+        depth=-1
+        frame=caller
+        while frame is not None:
+            depth+=1
+            frame=frame.f_back
+
+        if not Log.Json:
+            if Log.Timestamps:
+                stdout.write(Log.__timestamp(time.time()) + " ")
+            stdout.write(' '*depth)
+            print(*args, **kwargs)
+            return
+
+        out=kwargs.get("file") or stdout
+        entry={"ts": Log.__timestamp(time.time()), "level": Log.LevelNames[level], "depth": depth,
+               "file": os.path.basename(caller.f_code.co_filename), "line": caller.f_lineno,
+               "msg": kwargs.get("sep", " ").join(str(arg) for arg in args)}
+        out.write(json.dumps(entry) + "\n")
+        if kwargs.get("flush"):
+            out.flush()
+
+    @staticmethod
+    def __timestamp(now):
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)) + ".%03d" % (int(now*1000) % 1000)
+
 ###########################################################################################
 class Utils:
     Debug=False
@@ -41,10 +112,17 @@ class Utils:
 
     @staticmethod
     def Print(*args, **kwargs):
-        stackDepth=len(inspect.stack())-2
-        s=' '*stackDepth
-        stdout.write(s)
-        print(*args, **kwargs)
+        """Logs at Log.INFO, or at Log.ERROR/Log.WARNING for messages starting with "ERROR"/"WARNING"."""
+        level=Log.INFO
+        if Log.Level > Log.INFO or Log.Json:
+            first=str(args[0]).lstrip() if args else ""
+            if first.startswith("ERROR"):
+                level=Log.ERROR
+            elif first.startswith("WARNING"):
+                level=Log.WARNING
+            if level < Log.Level:
+                return
+        Log.write(level, args, kwargs)
 
     SyncStrategy=namedtuple("ChainSyncStrategy", "name id arg")
 
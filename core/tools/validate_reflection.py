@@ -2,9 +2,17 @@
 
 import argparse
 from collections import OrderedDict
+import concurrent.futures
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
 import re
 import os
+import subprocess
 import sys
+import time
 import traceback
 
 ###############################################################
@@ -30,6 +38,8 @@ import traceback
 import atexit
 import tempfile
 
+debug_file = None
+
 @atexit.register
 def close_debug_file():
     if debug_file != None:
@@ -39,14 +49,22 @@ def close_debug_file():
 parser = argparse.ArgumentParser(add_help=False)
 parser.add_argument('-?', action='help', default=argparse.SUPPRESS,
                          help=argparse._('show this help message and exit'))
-parser.add_argument('-d', '--debug', help="generate debug output into a temporary directory", action='store_true')
+parser.add_argument('-d', '--debug', help="generate debug output into a temporary directory, -dd also traces the file contents and patterns being matched", action='count', default=0)
 parser.add_argument('-r', '--recurse', help="recurse through an entire directory (if directory provided for \"file\"", action='store_true')
 parser.add_argument('-x', '--extension', type=str, help="extensions array to allow for directory and recursive search.  Defaults to \".hpp\" and \".cpp\".", action='append')
 parser.add_argument('-e', '--exit-on-error', help="Exit immediately when a validation error is discovered.  Default is to run validation on all files and directories provided.", action='store_true')
+parser.add_argument('-j', '--jobs', type=int, default=1, help="number of files validated in parallel, 0 for one per core.  Output is still reported in file order.  Default is 1.")
+parser.add_argument('--cache', type=str, default=os.path.join(os.path.expanduser("~"), ".cache", "bitconch", "validate_reflection.json"), help="file recording the result of every validated file by content hash, files that haven't changed since are not validated again.  Defaults to \"~/.cache/bitconch/validate_reflection.json\".")
+parser.add_argument('--no-cache', help="neither read nor write the result cache", action='store_true')
+parser.add_argument('--changed-since', type=str, metavar='GIT_REF', help="only validate files that differ from GIT_REF (or are untracked), without reading any of the others")
+parser.add_argument('-t', '--timing', help="report the time spent stripping comments, reading scopes, reading reflections and comparing them for every file, and the totals.  Files are always validated, the result cache isn't used.", action='store_true')
 parser.add_argument('files', metavar='file', nargs='+', type=str, help="File containing nodes info in JSON format.")
 args = parser.parse_args()
 
 recurse = args.recurse
+jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+if args.debug and jobs > 1:
+    parser.error("--debug writes a single debug file so it can't be combined with --jobs")
 if args.debug:
     temp_dir = tempfile.mkdtemp()
     print("temporary files writen to %s" % (temp_dir))
@@ -68,9 +86,51 @@ swap_str = "@swap"
 fc_reflect_str = "FC_REFLECT"
 fc_reflect_possible_enum_or_derived_ext = "(?:_ENUM|_DERIVED)?"
 
-def debug(debug_str):
+# debug levels, -d writes the DEBUG messages and -dd also the TRACE messages, which dump file contents and regex patterns
+DEBUG = 1
+TRACE = 2
+debug_level = args.debug
+
+def tracing(level = DEBUG):
+    """Whether messages of level are written, checked before building a message that is expensive to build."""
+    return debug_file is not None and debug_level >= level
+
+def debug(debug_str, *format_args):
+    """Writes a DEBUG message, the % formatting of debug_str with format_args only happens if it is written."""
     if debug_file is not None:
-        debug_file.write(debug_str + "\n")
+        debug_file.write((debug_str % format_args if format_args else debug_str) + "\n")
+
+class Scanner:
+    """Position based regex searches over the content of one file.
+
+    The scopes and the reflections are read front to back, so the last match of each pattern is kept and handed
+    out again as long as it is still the first match in the requested range, instead of searching the rest of
+    the file again (or copying it with a slice) for every scope, field and FC_REFLECT macro.
+    """
+    def __init__(self, content):
+        self.content = content
+        self.last = {}
+
+    def search(self, pattern, pos, endpos = None):
+        length = len(self.content)
+        if endpos is None:
+            endpos = length
+        elif endpos < 0:
+            # same meaning as the end of a slice, which find_possible_end's -1 used to be passed to
+            endpos = max(endpos + length, 0)
+        last = self.last.get(pattern)
+        if last is not None:
+            last_pos, last_endpos, match = last
+            # a match (or no match) in a range is still the first one in any range inside it that contains it,
+            # the patterns searched here don't look behind their start or past their end
+            if last_pos <= pos and endpos <= last_endpos:
+                if match is None:
+                    return None
+                if match.start() >= pos and match.end() <= endpos:
+                    return match
+        match = pattern.search(self.content, pos, endpos)
+        self.last[pattern] = (pos, endpos, match)
+        return match
 
 class EmptyScope:
     multi_word_type_pattern = r'(?:(?:un)?signed\s+)?(?:short\s+|(?:long\s+){1,2}?)?'
@@ -81,7 +141,9 @@ class EmptyScope:
     strip_extra_pattern = re.compile(r'\n\s*\*\s*')
     invalid_chars_pattern = re.compile(r'([^\w\s,])')
     multi_line_comment_ignore_swap_pattern = re.compile(r'(\w+)(?:\s*,\s*)?')
-    handle_braces_initialization_swap_pattern = re.compile(r'(?:{|;)\s*([^{};=]*?)\s*{([^{};]*)}(?=\s*;)', re.MULTILINE | re.DOTALL)
+    # the lookahead only lets a "{" or ";" through if a match follows it, otherwise the whitespace left by stripped comments
+    # is split every possible way between the \s* and the preamble before giving up
+    handle_braces_initialization_swap_pattern = re.compile(r'(?:{|;)(?=[^{};=]*{[^{};]*}\s*;)\s*([^{};=]*?)\s*{([^{};]*)}(?=\s*;)', re.MULTILINE | re.DOTALL)
     # pattern to handle fields initialized with {}
     possible_end_skip_initialization = re.compile(r'{[^;}]*}\s*;', re.MULTILINE | re.DOTALL)
     namespace_str = "namespace"
@@ -95,12 +157,13 @@ class EmptyScope:
     def __init__(self, name, start, content, parent_scope):
         pname = parent_scope.name if parent_scope is not None else ""
         self.indent = parent_scope.indent + " > " if parent_scope is not None else " > "
-        debug("%sEmptyScope.__init__ %s %d - Parent %s" % (self.indent, name, start, pname))
+        debug("%sEmptyScope.__init__ %s %d - Parent %s", self.indent, name, start, pname)
         self.name = name
         self.content = content
         self.start = start
         self.current = start + 1
         self.parent_scope = parent_scope
+        self.scanner = parent_scope.scanner if parent_scope is not None else Scanner(content)
         self.end = len(content) - 1 if start == 0 else None
         self.children = OrderedDict()
         self.fields = []
@@ -108,7 +171,7 @@ class EmptyScope:
         self.inherit = None
 
     def read(self):
-        debug("%sEmptyScope(%s).read - %s starting at %s" % (self.indent, self.__class__.__name__, self.name, self.current))
+        debug("%sEmptyScope(%s).read - %s starting at %s", self.indent, self.__class__.__name__, self.name, self.current)
         end = len(self.content) - 1
         while self.current < end:
             next_scope = self.next_scope()
@@ -118,17 +181,17 @@ class EmptyScope:
 
         if self.end is None:
             self.end = self.content.find(EmptyScope.end_char, self.current, len(self.content))
-            debug("%sEmptyScope(%s).read - %s find end current: %s, end: %s" % (self.indent, self.__class__.__name__, self.name, self.current, self.end))
-            pdesc = str(self.parent_scope) if self.parent_scope is not None else "<no parent scope>"
-            assert self.end != -1, "Could not find \"%s\" in \"%s\" - parent scope - %s" % (EmptyScope.end_char, self.content[self.current:], pdesc)
-        debug("%sEmptyScope(%s).read - %s - Done at %s" % (self.indent, self.__class__.__name__, self.name, self.end))
+            debug("%sEmptyScope(%s).read - %s find end current: %s, end: %s", self.indent, self.__class__.__name__, self.name, self.current, self.end)
+            # the message (and the description of the whole parent scope in it) is only built if the assert fails
+            assert self.end != -1, "Could not find \"%s\" in \"%s\" - parent scope - %s" % (EmptyScope.end_char, self.content[self.current:], str(self.parent_scope) if self.parent_scope is not None else "<no parent scope>")
+        debug("%sEmptyScope(%s).read - %s - Done at %s", self.indent, self.__class__.__name__, self.name, self.end)
 
     def add(self, child):
-        debug("%sEmptyScope.add %s (%s) to %s (%s) - DROP" % (self.indent, child.name, child.__class__.__name__, self.name, self.__class__.__name__))
+        debug("%sEmptyScope.add %s (%s) to %s (%s) - DROP", self.indent, child.name, child.__class__.__name__, self.name, self.__class__.__name__)
         pass
 
     def find_scope_start(self, content, start, end, find_str):
-        debug("%sEmptyScope.find_scope_start" % (self.indent))
+        debug("%sEmptyScope.find_scope_start", self.indent)
         loc = content.find(find_str, start, end)
         if loc == -1:
             return loc
@@ -137,28 +200,28 @@ class EmptyScope:
 
     def find_possible_end(self):
         possible = self.content.find(EmptyScope.end_char, self.current)
-        possible_skip_init = EmptyScope.possible_end_skip_initialization.search(self.content[self.current:])
+        possible_skip_init = self.scanner.search(EmptyScope.possible_end_skip_initialization, self.current)
         if possible_skip_init:
             all = possible_skip_init.group(0)
-            all_start = self.content.find(all, self.current)
-            all_end = all_start + len(all)
-            debug("%sEmptyScope.find_possible_end found possible at %s checking skip from %d to %d, all={\n%s\n}" % (self.indent, possible, all_start, all_end, all))
+            all_start = possible_skip_init.start()
+            all_end = possible_skip_init.end()
+            debug("%sEmptyScope.find_possible_end found possible at %s checking skip from %d to %d, all={\n%s\n}", self.indent, possible, all_start, all_end, all)
             if possible > all_start and possible < all_end:
                 possible = self.content.find(EmptyScope.end_char, all_end + 1)
-        debug("%sEmptyScope.find_possible_end current=%s  possible end=%s" % (self.indent, self.current, possible))
+        debug("%sEmptyScope.find_possible_end current=%s  possible end=%s", self.indent, self.current, possible)
         return possible
 
     def next_scope(self, end = None):
         if end is None:
             end = self.find_possible_end()
-        debug("%sEmptyScope.next_scope current=%s  end=%s" % (self.indent, self.current, end))
-        match = EmptyScope.any_scope_pattern.search(self.content[self.current:end])
+        debug("%sEmptyScope.next_scope current=%s  end=%s", self.indent, self.current, end)
+        match = self.scanner.search(EmptyScope.any_scope_pattern, self.current, end)
         if match:
             start = self.find_scope_start(self.content, self.current, end, EmptyScope.start_char)
             new_scope = EmptyScope(None, start, self.content, self)
             new_scope.read()
             self.current = new_scope.end + 1
-            debug("%sEmptyScope.next_scope return EmptyScope current: %s, scope end: %s" % (self.indent, self.current, new_scope.end))
+            debug("%sEmptyScope.next_scope return EmptyScope current: %s, scope end: %s", self.indent, self.current, new_scope.end)
             return new_scope
 
         return None
@@ -171,30 +234,31 @@ class EmptyScope:
             loc += len(scope_separator)
             child_scoped_name = scoped_name[loc:]
             if child_name in self.children:
-                debug("%sfind_class traverse child_name: %s, child_scoped_name: %s" % (self.indent, child_name, child_scoped_name))
+                debug("%sfind_class traverse child_name: %s, child_scoped_name: %s", self.indent, child_name, child_scoped_name)
                 return self.children[child_name].find_class(child_scoped_name)
             elif self.inherit is not None and scoped_name in self.inherit.children:
-                debug("%sfind_class found scoped_name: %s in inherited: %s" % (self.indent, scoped_name, self.inherit.name))
+                debug("%sfind_class found scoped_name: %s in inherited: %s", self.indent, scoped_name, self.inherit.name)
                 return self.inherit.children[scoped_name].find_class(child_scoped_name)
         else:
-            if scoped_name not in self.children:
+            if scoped_name not in self.children and tracing():
                 inherit_children = ",".join(self.inherit.children) if self.inherit is not None else "no inheritance"
                 inherit_using = ",".join(self.inherit.usings) if self.inherit is not None else "no inheritance"
                 inherit = self.inherit.name if self.inherit is not None else None
-                debug("%sfind_class %s not in children, using: %s, inherit: %s - children: %s, using: %s" % (self.indent, scoped_name, ",".join(self.usings), inherit, inherit_children, inherit_using))
+                debug("%sfind_class %s not in children, using: %s, inherit: %s - children: %s, using: %s", self.indent, scoped_name, ",".join(self.usings), inherit, inherit_children, inherit_using)
 
             if scoped_name in self.children:
-                debug("%sfind_class found scoped_name: %s" % (self.indent, scoped_name))
+                debug("%sfind_class found scoped_name: %s", self.indent, scoped_name)
                 return self.children[scoped_name]
             elif scoped_name in self.usings:
                 using = self.usings[scoped_name]
-                debug("%sfind_class found scoped_name: %s, using: %s" % (self.indent, scoped_name, using))
+                debug("%sfind_class found scoped_name: %s, using: %s", self.indent, scoped_name, using)
                 return self.find_class(using)
             elif self.inherit is not None and scoped_name in self.inherit.children:
-                debug("%sfind_class found scoped_name: %s in inherited: %s" % (self.indent, scoped_name, self.inherit.name))
+                debug("%sfind_class found scoped_name: %s in inherited: %s", self.indent, scoped_name, self.inherit.name)
                 return self.inherit.children[scoped_name]
             else:
-                debug("%sfind_class could not find scoped_name: %s, children: %s" % (self.indent, scoped_name, ",".join(self.children)))
+                if tracing():
+                    debug("%sfind_class could not find scoped_name: %s, children: %s", self.indent, scoped_name, ",".join(self.children))
                 return None
 
     def __str__(self):
@@ -219,7 +283,7 @@ class EmptyScope:
 
 def create_scope(type, name, inherit, start, content, parent_scope):
     indent = parent_scope.indent + " > " if parent_scope is not None else " > "
-    debug("%screate_scope" % (indent))
+    debug("%screate_scope", indent)
     if type == EmptyScope.namespace_str:
         return Namespace(name, inherit, start, content, parent_scope)
     elif type == EmptyScope.class_str or type == EmptyScope.struct_str:
@@ -239,7 +303,7 @@ class ClassStruct(EmptyScope):
 
     def __init__(self, name, inherit, start, content, parent_scope, is_enum):
         EmptyScope.__init__(self, name, start, content, parent_scope)
-        debug("%sClassStruct.__init__ %s %d" % (self.indent, name, start))
+        debug("%sClassStruct.__init__ %s %d", self.indent, name, start)
         self.classes = OrderedDict()
         self.pattern = ClassStruct.class_pattern
         self.is_enum = is_enum
@@ -256,10 +320,11 @@ class ClassStruct(EmptyScope):
             while self.inherit is None and next is not None:
                 self.inherit = next.find_class(inherit)
                 next = next.parent_scope
-            debug("%sChecking for object, ignore_id: %s, inherit: %s, name: %s" % (self.indent, self.ignore_id, inherit, name))
+            debug("%sChecking for object, ignore_id: %s, inherit: %s, name: %s", self.indent, self.ignore_id, inherit, name)
 
     def add(self, child):
-        debug("%sClassStruct.add %s (%s) to %s (%s) - (existing children: %s)" % (self.indent, child.name, child.__class__.__name__, self.name, self.__class__.__name__, ", ".join(self.children)))
+        if tracing():
+            debug("%sClassStruct.add %s (%s) to %s (%s) - (existing children: %s)", self.indent, child.name, child.__class__.__name__, self.name, self.__class__.__name__, ", ".join(self.children))
         if isinstance(child, ClassStruct):
             if child.name not in self.children:
                 self.classes[child.name] = child
@@ -268,88 +333,94 @@ class ClassStruct(EmptyScope):
     def add_fields(self, start, end):
         loc = start - 1 if start > 0 else 0
         while loc < end:
-            debug("%sClassStruct.add_fields -{\n%s\n}" % (self.indent, self.content[loc:end + 1]))
+            if tracing(TRACE):
+                debug("%sClassStruct.add_fields -{\n%s\n}", self.indent, self.content[loc:end + 1])
             if self.is_enum:
                 loc = self.add_enum_field(loc, end)
             else:
-                debug("%sClassStruct.add_fields - add_field")
+                debug("%sClassStruct.add_fields - add_field", self.indent)
                 loc = self.add_field(loc, end)
-        debug("%sClassStruct.add_fields done" % (self.indent))
+        debug("%sClassStruct.add_fields done", self.indent)
 
     def add_field(self, loc, end):
-        debug("%sClassStruct.add_field - %s to %s (%s)" % (self.indent, loc, end + 1, len(self.content)))
-        match = ClassStruct.field_pattern.search(self.content[loc:end + 1])
+        debug("%sClassStruct.add_field - %s to %s (%s)", self.indent, loc, end + 1, len(self.content))
+        match = self.scanner.search(ClassStruct.field_pattern, loc, end + 1)
         if match is None:
             return end
         field = match.group(2)
         self.fields.append(field)
         all = match.group(0)
-        loc = self.content.find(all, loc) + len(all)
-        debug("%sClassStruct.add_field - %s (%d) - loc: %s, pattern: %s, matched: \"%s\"" % (self.indent, field, len(self.fields), loc, ClassStruct.field_pattern.pattern, all))
+        loc = match.end()
+        debug("%sClassStruct.add_field - %s (%d) - loc: %s", self.indent, field, len(self.fields), loc)
+        if tracing(TRACE):
+            debug("%sClassStruct.add_field - pattern: %s, matched: \"%s\"", self.indent, ClassStruct.field_pattern.pattern, all)
         return loc
 
     def add_enum_field(self, loc, end):
-        match = ClassStruct.enum_field_pattern.search(self.content[loc:end + 1])
+        match = self.scanner.search(ClassStruct.enum_field_pattern, loc, end + 1)
         if match is None:
             return end
         field = match.group(1)
         self.fields.append(field)
-        all = match.group(0)
-        loc = self.content.find(all, loc) + len(all) - 1    # back up one to not match ','
-        debug("%sClassStruct.add_enum_field - %s (%d) - %s" % (self.indent, field, len(self.fields), ClassStruct.enum_field_pattern.pattern))
+        loc = match.end() - 1    # back up one to not match ','
+        debug("%sClassStruct.add_enum_field - %s (%d)", self.indent, field, len(self.fields))
+        if tracing(TRACE):
+            debug("%sClassStruct.add_enum_field - %s", self.indent, ClassStruct.enum_field_pattern.pattern)
         return loc
 
     def add_usings(self, start, end):
         loc = start
         while loc < end:
-            debug("%sClassStruct.add_usings -{\n%s\n}" % (self.indent, self.content[loc:end + 1]))
-            match = ClassStruct.using_pattern.search(self.content[loc:end])
+            if tracing(TRACE):
+                debug("%sClassStruct.add_usings -{\n%s\n}", self.indent, self.content[loc:end + 1])
+            match = self.scanner.search(ClassStruct.using_pattern, loc, end)
             if match is None:
                 break
             using = match.group(1)
             class_struct = match.group(2)
             self.usings[using] = class_struct
-            all = match.group(0)
-            loc = self.content.find(all, loc) + len(all)
-            debug("%sClassStruct.add_usings - %s (%d)" % (self.indent, using, len(self.usings)))
-        debug("%sClassStruct.add_usings done" % (self.indent))
+            loc = match.end()
+            debug("%sClassStruct.add_usings - %s (%d)", self.indent, using, len(self.usings))
+        debug("%sClassStruct.add_usings done", self.indent)
 
     def next_scope(self, end = None):
         new_scope = None
         if end is None:
             end = self.find_possible_end()
-        debug("%sClassStruct.next_scope current=%s end=%s on %s\n\npossible scope={\n\"%s\"\n\n\npattern=%s" % (self.indent, self.current, end, self.name, self.content[self.current:end], self.pattern.pattern))
-        match = self.pattern.search(self.content[self.current:end])
+        debug("%sClassStruct.next_scope current=%s end=%s on %s", self.indent, self.current, end, self.name)
+        if tracing(TRACE):
+            debug("%sClassStruct.next_scope possible scope={\n\"%s\"\n\n\npattern=%s", self.indent, self.content[self.current:end], self.pattern.pattern)
+        match = self.scanner.search(self.pattern, self.current, end)
         start = -1
         search_str = None
         type = None
         name = None
         inherit = None
         if match:
-            debug("%sClassStruct.next_scope match on %s" % (self.indent, self.name))
+            debug("%sClassStruct.next_scope match on %s", self.indent, self.name)
             search_str = match.group(0)
             type = match.group(1)
             name = match.group(2)
             if len(match.groups()) >= 3:
                 inherit = match.group(4)
-            debug("%sClassStruct.next_scope match for %s - type: %s, name: %s" % (self.indent, self.name, type, name))
+            debug("%sClassStruct.next_scope match for %s - type: %s, name: %s", self.indent, self.name, type, name)
 
-            start = self.find_scope_start(self.content, self.current, end, search_str)
-            debug("%sClassStruct.next_scope all: %s, type: %s, name: %s, start: %s, inherit: %s" % (self.indent, search_str, type, name, start, inherit))
+            start = match.end() - len(EmptyScope.start_char)
+            debug("%sClassStruct.next_scope all: %s, type: %s, name: %s, start: %s, inherit: %s", self.indent, search_str, type, name, start, inherit)
 
         generic_scope_start = self.find_scope_start(self.content, self.current, end, EmptyScope.start_char)
         if start == -1 and generic_scope_start == -1:
-            debug("%sClassStruct.next_scope end=%s no scopes add_fields and exit" % (self.indent, end))
+            debug("%sClassStruct.next_scope end=%s no scopes add_fields and exit", self.indent, end)
             self.add_fields(self.current, end)
             return None
 
-        debug("%sClassStruct.next_scope found \"%s\" - \"%s\" - \"%s\" current=%s, start=%s, end=%s, pattern=%s " % (self.indent, search_str, type, name, self.current, start, end, self.pattern.pattern))
+        debug("%sClassStruct.next_scope found \"%s\" - \"%s\" - \"%s\" current=%s, start=%s, end=%s", self.indent, search_str, type, name, self.current, start, end)
         # determine if there is a non-namespace/non-class/non-struct scope before a namespace/class/struct scope
         if start != -1 and (generic_scope_start == -1 or start <= generic_scope_start):
-            debug("%sClassStruct.next_scope found %s at %d" % (self.indent, type, start))
+            debug("%sClassStruct.next_scope found %s at %d", self.indent, type, start)
             new_scope = create_scope(type, name, inherit, start, self.content, self)
         else:
-            debug("%sClassStruct.next_scope found EmptyScope (%s) at %d, next scope at %s" % (self.indent, type, generic_scope_start, start))
+            debug("%sClassStruct.next_scope found EmptyScope (%s) at %d, next scope at %s", self.indent, type, generic_scope_start, start)
             new_scope = EmptyScope("", generic_scope_start, self.content, self)
 
         self.add_fields(self.current, new_scope.start)
@@ -365,12 +436,12 @@ class Namespace(ClassStruct):
     def __init__(self, name, inherit, start, content, parent_scope):
         assert inherit is None, "namespace %s should not inherit from %s" % (name, inherit)
         ClassStruct.__init__(self, name, None, start, content, parent_scope, is_enum = False)
-        debug("%sNamespace.__init__ %s %d" % (self.indent, name, start))
+        debug("%sNamespace.__init__ %s %d", self.indent, name, start)
         self.namespaces = {}
         self.pattern = Namespace.namespace_class_pattern
 
     def add(self, child):
-        debug("%sNamespace.add %s (%s) to %s (%s)" % (self.indent, child.name, child.__class__.__name__, self.name, self.__class__.__name__))
+        debug("%sNamespace.add %s (%s) to %s (%s)", self.indent, child.name, child.__class__.__name__, self.name, self.__class__.__name__)
         if isinstance(child, ClassStruct):
             ClassStruct.add(self, child)
             return
@@ -392,6 +463,7 @@ class Reflections:
         self.content = content
         self.current = 0
         self.end = len(content)
+        self.scanner = Scanner(content)
         self.classes = OrderedDict()
         self.with_2_comments = re.compile(r'(//\s*(%s|%s)\s+([^/\n]*?)\s*\n\s*//\s*(%s|%s)\s+([^/]*?)\s*\n\s*(%s%s\s*\(\s*(\w[^\s<]*))(?:\s*<[^>]*>)?\s*,)' % (ignore_str, swap_str, ignore_str, swap_str, fc_reflect_str, fc_reflect_possible_enum_or_derived_ext), re.MULTILINE | re.DOTALL)
         self.with_comment = re.compile(r'(//\s*(%s|%s)\s+([^/]*?)\s*\n\s*(%s%s\s*\(\s*(\w[^\s<]*))(?:\s*<[^>]*>)?\s*,)' % (ignore_str, swap_str, fc_reflect_str, fc_reflect_possible_enum_or_derived_ext), re.MULTILINE | re.DOTALL)
@@ -401,19 +473,21 @@ class Reflections:
         self.ignore_swap_pattern = re.compile(r'\b([\w\d]+)\b', re.MULTILINE | re.DOTALL)
 
     def read(self):
-        debug("REMOVE reflect_pattern: \"%s\"" % (self.reflect_pattern.pattern))
+        if tracing(TRACE):
+            debug("reflect_pattern: \"%s\"", self.reflect_pattern.pattern)
         while self.current < self.end:
-            match_2_comments = self.with_2_comments.search(self.content[self.current:])
-            match_comment = self.with_comment.search(self.content[self.current:])
-            match_reflect = self.reflect_pattern.search(self.content[self.current:])
+            match_2_comments = self.scanner.search(self.with_2_comments, self.current)
+            match_comment = self.scanner.search(self.with_comment, self.current)
+            match_reflect = self.scanner.search(self.reflect_pattern, self.current)
             match_loc = None
             if match_2_comments or match_comment:
-                loc1 = self.content.find(match_2_comments.group(1), self.current) if match_2_comments else self.end 
-                loc2 = self.content.find(match_comment.group(1), self.current) if match_comment else self.end
-                debug("loc1=%s and loc2=%s" % (loc1, loc2))
-                group1 = match_2_comments.group(1) if match_2_comments else "<EMPTY>"
-                group2 = match_comment.group(1) if match_comment else "<EMPTY>"
-                debug("\n  *****       group1={\n%s\n}\n\n\n  *****       group2={\n%s\n}\n\n\n" % (group1, group2))
+                loc1 = match_2_comments.start(1) if match_2_comments else self.end
+                loc2 = match_comment.start(1) if match_comment else self.end
+                debug("loc1=%s and loc2=%s", loc1, loc2)
+                if tracing(TRACE):
+                    group1 = match_2_comments.group(1) if match_2_comments else "<EMPTY>"
+                    group2 = match_comment.group(1) if match_comment else "<EMPTY>"
+                    debug("\n  *****       group1={\n%s\n}\n\n\n  *****       group2={\n%s\n}\n\n\n", group1, group2)
                 if loc2 < loc1:
                     debug("loc2 earlier")
                     match_2_comments = None
@@ -422,7 +496,7 @@ class Reflections:
                     match_loc = loc1
             if match_reflect and match_loc is not None:
                 debug("match_reflect and one of the other matches")
-                loc1 = self.content.find(match_reflect.group(1), self.current)
+                loc1 = match_reflect.start(1)
                 if loc1 < match_loc:
                     debug("choose the other matches")
                     match_comment = None
@@ -433,10 +507,11 @@ class Reflections:
 
             if match_2_comments:
                 debug("match_2_comments")
-                debug("Groups {")
-                for g in match_2_comments.groups():
-                    debug("  %s" % g)
-                debug("}")
+                if tracing(TRACE):
+                    debug("Groups {")
+                    for g in match_2_comments.groups():
+                        debug("  %s", g)
+                    debug("}")
                 assert len(match_2_comments.groups()) == 7, "match_2_comments wrong size due to regex pattern change"
                 (ignore_or_swap1, 
                  next_reflect_ignore_swap1,
@@ -448,10 +523,11 @@ class Reflections:
                 self.add_ignore_swaps(next_reflect_class, next_reflect_ignore_swap2, ignore_or_swap2)
             elif match_comment:
                 debug("match_comment")
-                debug("Groups {")
-                for g in match_comment.groups():
-                    debug("  %s" % g)
-                debug("}")
+                if tracing(TRACE):
+                    debug("Groups {")
+                    for g in match_comment.groups():
+                        debug("  %s", g)
+                    debug("}")
                 assert len(match_comment.groups()) == 5, "match_comment too short due to regex pattern change"
                 # not using array indices here because for some reason the type of match_2_comments and match_comment are different
                 (ignore_or_swap,
@@ -462,10 +538,11 @@ class Reflections:
 
             if match_reflect:
                 debug("match_reflect")
-                debug("Groups {")
-                for g in match_reflect.groups():
-                    debug("  %s" % g)
-                debug("}")
+                if tracing(TRACE):
+                    debug("Groups {")
+                    for g in match_reflect.groups():
+                        debug("  %s", g)
+                    debug("}")
                 assert len(match_reflect.groups()) == 5, "match_reflect too short due to regex pattern change"
                 (next_reflect,
                  next_reflect_class,
@@ -475,12 +552,13 @@ class Reflections:
                 derived_match = self.reflect_derived_pattern.search(next_reflect_potential_derived)
                 if derived_match:
                     derived = derived_match.group(1)
-                    debug("derived class: %s has its own reflection (%s)" % (derived, ",".join(self.classes)))
+                    if tracing():
+                        debug("derived class: %s has its own reflection (%s)", derived, ",".join(self.classes))
                     # if the derived class has its own reflection, then don't add the derived class
                     if derived in self.classes:
-                        debug("derived class: %s has its own reflection, don't add" % (derived))
+                        debug("derived class: %s has its own reflection, don't add", derived)
                         derived = None
-                self.add_fields(next_reflect, next_reflect_class, next_reflect_fields, derived)
+                self.add_fields(match_reflect.end(2), next_reflect, next_reflect_class, next_reflect_fields, derived)
             else:
                 debug("search for next reflect done")
                 self.current = self.end
@@ -488,14 +566,13 @@ class Reflections:
 
     def find_or_add(self, reflect_class):
         if reflect_class not in self.classes:
-            debug("find_or_add added \"%s\"" % (reflect_class))
+            debug("find_or_add added \"%s\"", reflect_class)
             self.classes[reflect_class] = Reflection(reflect_class)
         return self.classes[reflect_class]
 
-    def add_fields(self, next_reflect, next_reflect_class, next_reflect_fields, derived):
-        old = self.current
-        self.current = self.content.find(next_reflect, self.current) + len(next_reflect)
-        debug("all={\n\n%s\n\nclass=\n\n%s\n\nfields=\n\n%s\n\n" % (next_reflect, next_reflect_class, next_reflect_fields))
+    def add_fields(self, next_reflect_end, next_reflect, next_reflect_class, next_reflect_fields, derived):
+        self.current = next_reflect_end
+        debug("all={\n\n%s\n\nclass=\n\n%s\n\nfields=\n\n%s\n\n", next_reflect, next_reflect_class, next_reflect_fields)
         fields = re.findall(self.field_pattern, next_reflect_fields)
         for field in fields:
             self.add_field(next_reflect_class, field)
@@ -505,58 +582,50 @@ class Reflections:
             for field in struct_class.fields:
                 self.add_field(next_reflect_class, field)
         reflect_class = self.find_or_add(next_reflect_class)
-        debug("add_fields %s done, fields count=%s, ignored count=%s, swapped count=%s" % (next_reflect_class, len(reflect_class.fields), len(reflect_class.ignored), len(reflect_class.swapped)))
+        debug("add_fields %s done, fields count=%s, ignored count=%s, swapped count=%s", next_reflect_class, len(reflect_class.fields), len(reflect_class.ignored), len(reflect_class.swapped))
 
     def add_ignore_swaps(self, next_reflect_class, next_reflect_ignores_swaps, ignore_or_swap):
-        debug("class=\n\n%s\n\n%s=\n\n%s\n\n" % (next_reflect_class, ignore_or_swap, next_reflect_ignores_swaps))
-        end = len(next_reflect_ignores_swaps)
-        current = 0
-        while current < end:
-            ignore_swap_match = self.ignore_swap_pattern.search(next_reflect_ignores_swaps[current:])
-            if ignore_swap_match:
-                ignore_swap = ignore_swap_match.group(1)
-                reflect_class = self.find_or_add(next_reflect_class)
-                if (ignore_or_swap == ignore_str):
-                    assert ignore_swap not in reflect_class.ignored, "Reflection for %s repeats %s \"%s\"" % (next_reflect_class, ignore_or_swap, ignore_str)
-                    assert ignore_swap not in reflect_class.swapped, "Reflection for %s references field \"%s\" in %s  and %s " % (next_reflect_class, ignore_swap, ignore_str, swap_str)
-                    reflect_class.ignored.append(ignore_swap)
-                else:
-                    assert ignore_swap not in reflect_class.swapped, "Reflection for %s repeats %s \"%s\"" % (next_reflect_class, ignore_or_swap)
-                    assert ignore_swap not in reflect_class.ignored, "Reflection for %s references field \"%s\" in %s  and %s " % (next_reflect_class, ignore_swap, swap_str, ignore_str)
-                    reflect_class.swapped.append(ignore_swap)
-                debug("ignore or swap %s --> %s, ignored count=%s, swapped count=%s" % (next_reflect_class, ignore_swap, len(reflect_class.ignored), len(reflect_class.swapped)))
-                current = next_reflect_ignores_swaps.find(ignore_swap_match.group(0), current) + len(ignore_swap_match.group(0))
+        debug("class=\n\n%s\n\n%s=\n\n%s\n\n", next_reflect_class, ignore_or_swap, next_reflect_ignores_swaps)
+        for ignore_swap_match in self.ignore_swap_pattern.finditer(next_reflect_ignores_swaps):
+            ignore_swap = ignore_swap_match.group(1)
+            reflect_class = self.find_or_add(next_reflect_class)
+            if (ignore_or_swap == ignore_str):
+                assert ignore_swap not in reflect_class.ignored, "Reflection for %s repeats %s \"%s\"" % (next_reflect_class, ignore_or_swap, ignore_str)
+                assert ignore_swap not in reflect_class.swapped, "Reflection for %s references field \"%s\" in %s  and %s " % (next_reflect_class, ignore_swap, ignore_str, swap_str)
+                reflect_class.ignored.append(ignore_swap)
             else:
-                break
-        
+                assert ignore_swap not in reflect_class.swapped, "Reflection for %s repeats %s \"%s\"" % (next_reflect_class, ignore_or_swap)
+                assert ignore_swap not in reflect_class.ignored, "Reflection for %s references field \"%s\" in %s  and %s " % (next_reflect_class, ignore_swap, swap_str, ignore_str)
+                reflect_class.swapped.append(ignore_swap)
+            debug("ignore or swap %s --> %s, ignored count=%s, swapped count=%s", next_reflect_class, ignore_swap, len(reflect_class.ignored), len(reflect_class.swapped))
 
     def add_field(self, reflect_class_name, field):
         reflect_class = self.find_or_add(reflect_class_name)
         assert field not in reflect_class.fields, "Reflection for %s repeats field \"%s\"" % (reflect_class_name, field)
         reflect_class.fields.append(field)
-        debug("add_field %s --> %s" % (reflect_class_name, field))
+        debug("add_field %s --> %s", reflect_class_name, field)
 
 def replace_multi_line_comment(match):
     all=match.group(1)
     all=EmptyScope.strip_extra_pattern.sub("", all)
-    debug("multiline found=%s" % (all))
+    debug("multiline found=%s", all)
     match=EmptyScope.ignore_swap_pattern.search(all)
     if match:
         ignore_or_swap = match.group(1) 
         all = match.group(2)
-        debug("multiline %s now=%s" % (ignore_or_swap, all))
+        debug("multiline %s now=%s", ignore_or_swap, all)
         invalid_chars=EmptyScope.invalid_chars_pattern.search(all)
         if invalid_chars:
             for ic in invalid_chars.groups():
-                debug("invalid_char=%s" % (ic))
-            debug("WARNING: looks like \"%s\" is intending to %s, but there are invalid characters - \"%s\"" % (all, ignore_or_swap, ",".join(invalid_chars.groups())))
+                debug("invalid_char=%s", ic)
+            debug("WARNING: looks like \"%s\" is intending to %s, but there are invalid characters - \"%s\"", all, ignore_or_swap, ",".join(invalid_chars.groups()))
             return ""
         groups=re.findall(EmptyScope.multi_line_comment_ignore_swap_pattern, all)
         if groups is None:
             return ""
         rtn_str="// %s " % (ignore_or_swap)
         rtn_str+=', '.join([group for group in groups if group is not None])
-        debug("multiline rtn_str=%s" % (rtn_str))
+        debug("multiline rtn_str=%s", rtn_str)
         return rtn_str
     
     debug("multiline no match")
@@ -564,7 +633,7 @@ def replace_multi_line_comment(match):
 
 def replace_line_comment(match):
     all=match.group(0)
-    debug("singleline found=%s" % (all))
+    debug("singleline found=%s", all)
     if EmptyScope.single_comment_ignore_swap_pattern.match(all):
         return all
     else:
@@ -578,35 +647,57 @@ def replace_braces_initialization(match):
     match = ClassStruct.class_pattern.search(all)
     if match is None:
         repl = all.replace("{%s}" % (init_data), " = {%s}" % (init_data), 1)
-        debug("replace_braces_initialization replacing \"%s\" with \"%s\"." % (all, repl))
+        debug("replace_braces_initialization replacing \"%s\" with \"%s\".", all, repl)
         return repl
-    debug("replace_braces_initialization matched \"%s\" so no replace." % (match.group(1)))
+    debug("replace_braces_initialization matched \"%s\" so no replace.", match.group(1))
     return all
 
-def validate_file(file):
+class PhaseTimer:
+    """Time spent in each phase of validating a file, for --timing."""
+    def __init__(self):
+        self.times = OrderedDict()
+        self.phase = None
+        self.started = None
+
+    def start(self, phase):
+        self.stop()
+        self.phase = phase
+        self.started = time.perf_counter()
+
+    def stop(self):
+        if self.phase is not None:
+            self.times[self.phase] = self.times.get(self.phase, 0.0) + time.perf_counter() - self.started
+            self.phase = None
+
+def validate_file(file, timer):
+    timer.start("comments")
     f = open(file, "r", encoding="utf-8")
     contents = "\n" + f.read()   # lazy fix for complex regex
     f.close()
     print("analyze %s" % (file))
-    debug("analyze %s" % (file))
+    debug("analyze %s", file)
     contents = EmptyScope.multi_line_comment_pattern.sub(replace_multi_line_comment, contents)
     contents = EmptyScope.single_comment_pattern.sub(replace_line_comment, contents)
     contents = EmptyScope.handle_braces_initialization_swap_pattern.sub(replace_braces_initialization, contents)
     found = re.search(fc_reflect_str, contents)
     if found is None:
-        return
+        return []
     print("validate %s" % (file))
-    debug("validate %s" % (file))
+    debug("validate %s", file)
+    timer.start("scopes")
     global_namespace=Namespace("", None, 0, contents, None)
     global_namespace.read()
+    timer.stop()
     if args.debug:
         _, filename = os.path.split(file)
         with open(os.path.join(temp_dir, filename + ".struct"), "w") as f:
             f.write("global_namespace=%s" % (global_namespace))
         with open(os.path.join(temp_dir, filename + ".stripped"), "w") as f:
             f.write(contents)
+    timer.start("reflections")
     reflections=Reflections(contents)
     reflections.read()
+    timer.start("comparison")
     for reflection_name in reflections.classes:
         reflection = reflections.classes[reflection_name]
         class_struct = global_namespace.find_class(reflection_name)
@@ -619,15 +710,15 @@ def validate_file(file):
                     # this is a chainbase::object, don't need to worry about id_type definition
                     continue
         class_struct_num_fields = len(class_struct.fields) if class_struct is not None else None 
-        debug("reflection_name=%s, class field count=%s, reflection field count=%s, ingore count=%s, swap count=%s" % (reflection_name, class_struct_num_fields, len(reflection.fields), len(reflection.ignored), len(reflection.swapped)))
+        debug("reflection_name=%s, class field count=%s, reflection field count=%s, ingore count=%s, swap count=%s", reflection_name, class_struct_num_fields, len(reflection.fields), len(reflection.ignored), len(reflection.swapped))
         assert isinstance(class_struct, ClassStruct), "could not find a %s/%s/%s for %s" % (EmptyScope.class_str, EmptyScope.struct_str, EmptyScope.enum_str, reflection_name)
         if class_struct.ignore_id:
             id_field = "id"
             if id_field not in reflection.ignored and id_field not in reflection.fields:
-                debug("Object ignore_id Adding id to ignored for %s" % (reflection_name))
+                debug("Object ignore_id Adding id to ignored for %s", reflection_name)
                 reflection.ignored.append(id_field)
         else:
-            debug("Object ignore_id NOT adding id to ignored for %s" % (reflection_name))
+            debug("Object ignore_id NOT adding id to ignored for %s", reflection_name)
         rf_index = 0
         rf_len = len(reflection.fields)
 
@@ -641,9 +732,9 @@ def validate_file(file):
             field = class_struct.fields[f_index]
             reflect_field = reflection.fields[rf_index] if rf_index < rf_len else None
             processed.append(field)
-            debug("\nfield=%s reflect_field=%s" % (field, reflect_field))
+            debug("\nfield=%s reflect_field=%s", field, reflect_field)
             if field in reflection.swapped:
-                debug("field \"%s\" swapped (back)" % (field))
+                debug("field \"%s\" swapped (back)", field)
                 reflection.swapped.remove(field)
                 back_swapped.append(field)
                 assert field in reflection.fields, "Reflection for %s indicates swapping %s but swapped position is not indicated in the reflection fields. Should it be ignored?" % (reflection_name, field)
@@ -651,7 +742,7 @@ def validate_file(file):
                 f_index += 1
                 continue
             if reflect_field in reflection.swapped:
-                debug("field \"%s\" swapped (fwd)" % (field))
+                debug("field \"%s\" swapped (fwd)", field)
                 reflection.swapped.remove(reflect_field)
                 fwd_swapped.append(reflect_field)
                 assert reflect_field in reflection.fields, "Reflection for %s indicates swapping field %s but it doesn't exist in that class/struct so it should be removed" % (reflection_name, reflect_field)
@@ -659,13 +750,14 @@ def validate_file(file):
                 continue
             assert reflect_field not in ignored, "Reflection for %s should not indicate %s for %s; it should indicate %s - %s" % (reflection_name, ignore_str, reflect_field, swap_str, ",".join(ignored))
             if field in reflection.ignored:
-                debug("ignoring: %s" % (field))
+                debug("ignoring: %s", field)
                 reflection.ignored.remove(field)
                 ignored.append(field)
                 assert reflect_field != field, "Reflection for %s should not indicate ignoring %s since it is in the correct order" % (reflection_name, field)
                 f_index += 1
                 continue
-            debug("ignored=%s, swapped=%s" % (",".join(reflection.ignored),",".join(reflection.swapped)))
+            if tracing():
+                debug("ignored=%s, swapped=%s", ",".join(reflection.ignored), ",".join(reflection.swapped))
             if reflect_field is not None and reflect_field in back_swapped:
                 back_swapped.remove(reflect_field)
                 rf_index += 1
@@ -676,12 +768,13 @@ def validate_file(file):
                 assert reflect_field == field, "Reflection for %s should have field %s instead of %s or else it should indicate if the field should be ignored (%s) or swapped (%s)" %(reflection_name, field, reflect_field, ignore_str, swap_str)
                 f_index += 1
                 rf_index += 1
-            debug("rf_index=%s, rf_len=%s, f_index=%s, f_len=%s" % (rf_index, rf_len, f_index, f_len))
+            debug("rf_index=%s, rf_len=%s, f_index=%s, f_len=%s", rf_index, rf_len, f_index, f_len)
 
         assert len(reflection.ignored) == 0, "Reflection for %s has erroneous ignores - \"%s\"" % (reflection_name, ",".join(reflection.ignored))
         unused_reflect_fields = []
         while rf_index < rf_len:
-            debug("rf_index=%s, rf_len=%s fields=%s" % (rf_index, rf_len, ",".join(reflection.fields)))
+            if tracing():
+                debug("rf_index=%s, rf_len=%s fields=%s", rf_index, rf_len, ",".join(reflection.fields))
             reflect_field = reflection.fields[rf_index]
             if reflect_field in back_swapped:
                 back_swapped.remove(reflect_field)
@@ -693,41 +786,29 @@ def validate_file(file):
         assert len(back_swapped) == 0, "Reflection for %s indicated swapped fields that were never provided - \"%s\"" % (reflection_name, ",".join(back_swapped))
         assert len(fwd_swapped) == 0, "Reflection for %s indicated and provided swapped fields that are not in the class - \"%s\"" % (reflection_name, ",".join(fwd_swapped))
 
+    timer.stop()
     print("%s passed" % (file))
+    return list(reflections.classes)
 
-success = True
+def reflection_line(file, reflection_name):
+    """Line of the FC_REFLECT macro for reflection_name in file, or None."""
+    with open(file, "r", encoding="utf-8") as f:
+        contents = f.read()
+    match = re.search(r'%s%s\s*\(\s*%s(?![\w:])' % (fc_reflect_str, fc_reflect_possible_enum_or_derived_ext, re.escape(reflection_name)), contents)
+    return contents.count("\n", 0, match.start()) + 1 if match else None
 
-def walk(current_dir):
-    result = True
-    print("Searching for files: %s" % (current_dir))
-    for root, dirs, filenames in os.walk(current_dir):
-        for filename in filenames:
-            _, extension = os.path.splitext(filename)
-            if extension not in extensions:
-                continue
-            try:
-                validate_file(os.path.join(root, filename))
-            except AssertionError:
-                _, info, tb = sys.exc_info()
-                traceback.print_tb(tb) # Fixed format
-                tb_info = traceback.extract_tb(tb)
-                filename, line, func, text = tb_info[-1]
-
-                print("An error occurred in %s:%s: %s" % (filename, line, info), file=sys.stderr)
-                if args.exit_on_error:
-                    exit(1)
-                result = False
-
-        if not recurse:
-            break
-    return result
-
-for file in args.files:
-    if os.path.isdir(file):
-        success &= walk(file)
-    elif os.path.isfile(file):
+def validate(file):
+    """Validates file, returns (stdout, stderr, failure, reflections, times) where failure is None or (file, line, message),
+    line being the line of the FC_REFLECT macro that failed validation (None if the failure is not about a single
+    reflection), reflections are the names of the validated reflections and times the seconds spent in each phase."""
+    out = io.StringIO()
+    err = io.StringIO()
+    failure = None
+    reflections = []
+    timer = PhaseTimer()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
         try:
-            validate_file(file)
+            reflections = validate_file(file, timer)
         except AssertionError:
             _, info, tb = sys.exc_info()
             traceback.print_tb(tb) # Fixed format
@@ -735,14 +816,210 @@ for file in args.files:
             filename, line, func, text = tb_info[-1]
 
             print("An error occurred in %s:%s: %s" % (filename, line, info), file=sys.stderr)
-            if args.exit_on_error:
+            reflection_name = None
+            for frame, _ in traceback.walk_tb(tb):
+                if frame.f_code is validate_file.__code__:
+                    reflection_name = frame.f_locals.get("reflection_name")
+            failure = (file, reflection_line(file, reflection_name) if reflection_name is not None else None, str(info))
+        # a failed phase still counts up to the failure
+        timer.stop()
+        if args.timing:
+            print("timing %s: %s" % (file, format_times(timer.times)))
+    return out.getvalue(), err.getvalue(), failure, reflections, timer.times
+
+def format_times(times):
+    phases = ", ".join("%s %.1fms" % (phase, seconds * 1000) for phase, seconds in times.items())
+    return "%s, total %.1fms" % (phases, sum(times.values()) * 1000)
+
+# the results of a file are only reused by the same version of this script
+with open(os.path.abspath(__file__), "rb") as f:
+    tool_version = hashlib.sha256(f.read()).hexdigest()
+
+def load_cache(path):
+    try:
+        with open(path, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != tool_version:
+        return {}
+    return cache.get("files", {})
+
+def save_cache(path, files):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp_path, "w") as f:
+        json.dump({"version": tool_version, "files": files}, f)
+    os.replace(temp_path, path)
+
+def file_hash(file):
+    with open(file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def changed_files(git_ref, directory):
+    """Absolute paths of the files in directory's git work tree that differ from git_ref, including untracked ones."""
+    top = subprocess.check_output(["git", "-C", directory, "rev-parse", "--show-toplevel"], universal_newlines=True).strip()
+    changed = subprocess.check_output(["git", "-C", top, "diff", "--name-only", "-z", git_ref, "--"], universal_newlines=True)
+    untracked = subprocess.check_output(["git", "-C", top, "ls-files", "--others", "--exclude-standard", "-z"], universal_newlines=True)
+    return set(os.path.join(top, name) for name in (changed + untracked).split("\0") if name)
+
+# --timing is about the validation itself so it doesn't replay recorded results
+use_cache = not args.no_cache and not args.timing
+cache = load_cache(args.cache) if use_cache else {}
+hashes = {}
+cached = 0
+unchanged = 0
+changed = None
+
+failures = []
+validated = 0
+
+def cached_result(file):
+    """The result recorded for file if its contents are the same as when it was validated, otherwise None."""
+    if not use_cache:
+        return None
+    hashes[file] = file_hash(file)
+    entry = cache.get(os.path.abspath(file))
+    if entry is None or entry["name"] != file or entry["hash"] != hashes[file]:
+        return None
+    failure = tuple(entry["failure"]) if entry["failure"] is not None else None
+    return entry["stdout"], entry["stderr"], failure, entry["reflections"], None
+
+phase_totals = OrderedDict()
+file_totals = []
+
+def report(file, result):
+    global validated
+    out, err, failure, reflections, times = result
+    if times is not None:
+        for phase, seconds in times.items():
+            phase_totals[phase] = phase_totals.get(phase, 0.0) + seconds
+        file_totals.append((sum(times.values()), file))
+    if file in hashes:
+        cache[os.path.abspath(file)] = { "name": file, "hash": hashes[file], "stdout": out, "stderr": err, "failure": failure, "reflections": reflections }
+    sys.stdout.write(out)
+    sys.stdout.flush()
+    sys.stderr.write(err)
+    sys.stderr.flush()
+    validated += 1
+    if failure is not None:
+        failures.append(failure)
+
+def print_summary():
+    if len(failures) == 0:
+        return
+    print("%d of %d files failed validation:" % (len(failures), validated), file=sys.stderr)
+    for file, line, message in failures:
+        location = "%s:%s" % (file, line) if line is not None else file
+        print("  %s: %s" % (location, message.splitlines()[0] if message else ""), file=sys.stderr)
+
+def validate_files(files, executor):
+    """Validates files, in parallel if executor is not None, reporting the results in the order of files.
+    Files that haven't changed are skipped (--changed-since) or report their cached result.
+    With --exit-on-error, exits once any file has failed, after reporting the files before it."""
+    global cached, unchanged
+    if changed is not None:
+        count = len(files)
+        files = [file for file in files if os.path.abspath(file) in changed]
+        unchanged += count - len(files)
+    if executor is None:
+        for file in files:
+            result = cached_result(file)
+            if result is not None:
+                cached += 1
+            else:
+                result = validate(file)
+            report(file, result)
+            if args.exit_on_error and len(failures) > 0:
+                print_summary()
                 exit(1)
+        return
+
+    futures = []
+    for file in files:
+        result = cached_result(file)
+        if result is not None:
+            cached += 1
+            future = concurrent.futures.Future()
+            future.set_result(result)
+        else:
+            future = executor.submit(validate, file)
+        futures.append(future)
+    reported = 0
+    pending = set(futures)
+    while reported < len(futures):
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        if args.exit_on_error and any(future.result()[2] is not None for future in done):
+            # don't start any more files and only wait for the ones already being validated
+            for future in pending:
+                future.cancel()
+            concurrent.futures.wait(pending)
+            for index in range(reported, len(futures)):
+                if futures[index].cancelled():
+                    continue
+                report(files[index], futures[index].result())
+                if len(failures) > 0:
+                    break
+            print_summary()
+            exit(1)
+        while reported < len(futures) and futures[reported].done():
+            report(files[reported], futures[reported].result())
+            reported += 1
+
+def find_files(current_dir):
+    print("Searching for files: %s" % (current_dir))
+    files = []
+    for root, dirs, filenames in os.walk(current_dir):
+        for filename in filenames:
+            _, extension = os.path.splitext(filename)
+            if extension in extensions:
+                files.append(os.path.join(root, filename))
+
+        if not recurse:
+            break
+    return files
+
+success = True
+executor = None
+if jobs > 1:
+    # the workers are forked so they share the parsed arguments instead of importing this script again
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("fork"))
+
+if args.changed_since is not None:
+    changed = set()
+    for file in args.files:
+        if os.path.exists(file):
+            changed |= changed_files(args.changed_since, file if os.path.isdir(file) else os.path.dirname(file) or ".")
+
+try:
+    for file in args.files:
+        if os.path.isdir(file):
+            validate_files(find_files(file), executor)
+        elif os.path.isfile(file):
+            validate_files([file], executor)
+        else:
+            print("ERROR \"%s\" is neither a directory nor a file" % file)
             success = False
-    else:
-        print("ERROR \"%s\" is neither a directory nor a file" % file)
-        success = False
+finally:
+    # also keeps the results of the files validated before --exit-on-error stopped
+    if use_cache:
+        save_cache(args.cache, cache)
+
+if executor is not None:
+    executor.shutdown()
+if unchanged > 0:
+    print("%d files unchanged since %s were not validated" % (unchanged, args.changed_since))
+if cached > 0:
+    print("%d of %d files unchanged since they were last validated, reported their recorded results" % (cached, validated))
+if args.timing and len(file_totals) > 0:
+    print("timing all %d files: %s" % (len(file_totals), format_times(phase_totals)))
+    for seconds, file in sorted(file_totals, reverse=True)[:5]:
+        print("  %.1fms %s" % (seconds * 1000, file))
+print_summary()
 
-if success:
+if success and len(failures) == 0:
     exit(0)
 else:
     exit(1)
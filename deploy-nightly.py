@@ -7,9 +7,12 @@ import stat
 import shutil
 import os, re, argparse, sys,crypt
 import getpass
+import time
 import click
 from subprocess import Popen, check_call, PIPE, check_output, CalledProcessError
 from shutil import copy2, copytree, rmtree
+from deploylib import (BuildProfile, build_targets, built_release_dir, copy_if_changed, describe_install, install_tree, print_build_report,
+                       cargo_supports_timings, cargo_timings, run_logged, shared_cargo_env, target_dir)
 from colorama import init
 init()
 from colorama import Fore, Back, Style
@@ -99,7 +102,7 @@ def update_submodules():
  
 
 
-def build(rust_version,cargoFeatures,release=False):
+def build(rust_version,cargoFeatures,release=False, jobs=None, parallel=None):
     target_list = execute_shell("rustup target list", silent=True).decode()
     m = re.search(r"(.*?)\s*\(default\)", target_list)
     
@@ -137,43 +140,43 @@ def build(rust_version,cargoFeatures,release=False):
     }
 
     if release:
-        for target in target_list:
-            prnt_run(f"Build rust source for {target}")
-
-            if target != default_target:
-                execute_shell(["rustup", "target", "add", target],
-                   shell=False,
-                   silent=True,
-                   #cwd="vendor/rustelo-rust")
-                   cwd="buffett2")
-
-            profile = "--release" if release else ''
-            execute_shell(f"cargo build --all --target {target} {profile}",
-               #cwd="vendor/rustelo-rust",
-               cwd="buffett2",
-               env={
-                   "CC": f"{prefix[target]}gcc",
-                   "CARGO_TARGET_X86_64_UNKNOWN_LINUX_MUSL_LINKER": f"{prefix[target]}gcc",
-                   "CARGO_TARGET_X86_64_PC_WINDOWS_GNU_LINKER": f"{prefix[target]}gcc",
-               })
-
-            if target.endswith("-apple-darwin"):
-                execute_shell(f"strip -Sx {artifact[target]}",
-                   cwd=f"vendor/rustelo-rust/soros/target/{target}/release", silent=True)
-
-            else:
-                execute_shell(f"{prefix[target]}strip --strip-unneeded -d -x {artifact[target]}",
-                   #cwd=f"vendor/rustelo-rust/target/{target}/release")
-                   cwd=f"vendor/rustelo-rust/soros/target/{target}/release")
-
-            #copy2(f"vendor/rustelo-rust/target/{target}/release/{artifact[target]}", f"libs/{target}/")
-            copy2(f"vendor/rustelo-rust/soros/target/{target}/release/soros-fullnode", f"libs/{target}/buffett-fullnode")
-            #copy2(f"vendor/rustelo-rust/soros/target/{target}/release/soros-fullnode-config", f"libs/{target}/buffett-fullnode-config")
-            copy2(f"vendor/rustelo-rust/soros/target/{target}/release/soros-drone", f"libs/{target}/buffett-drone")
-            copy2(f"vendor/rustelo-rust/soros/target/{target}/release/soros-bench-tps", f"libs/{target}/buffett-bench-tps")
-            copy2(f"vendor/rustelo-rust/soros/target/{target}/release/soros-ledger-tool", f"libs/{target}/buffett-ledger-tool")
-            copy2(f"vendor/rustelo-rust/soros/target/{target}/release/soros-genesis", f"libs/{target}/buffett-genesis")
-            copy2(f"vendor/rustelo-rust/soros/target/{target}/release/soros-keygen", f"libs/{target}/buffett-keygen")
+        # binary in the soros release dir -> name in libs/<target>
+        binaries = {
+            "soros-fullnode": "buffett-fullnode",
+            "soros-drone": "buffett-drone",
+            "soros-bench-tps": "buffett-bench-tps",
+            "soros-ledger-tool": "buffett-ledger-tool",
+            "soros-genesis": "buffett-genesis",
+            "soros-keygen": "buffett-keygen"
+        }
+
+        def copy_binaries(target, target_release_dir):
+            with profile.phase("copy", target):
+                os.makedirs(f"libs/{target}/", exist_ok=True)
+                for built, name in binaries.items():
+                    copy_if_changed(f"{target_release_dir}/{built}", f"libs/{target}/{name}")
+
+        def collect(target, target_release_dir):
+            # strip and copy the binaries of a built target, runs in that target's build thread.
+            # The soros binaries are collected from the soros build, not from the buffett2 build
+            soros_release_dir = built_release_dir(target, "vendor/rustelo-rust/soros", list(binaries))
+            with profile.phase("strip", target):
+                if target.endswith("-apple-darwin"):
+                    run_logged(f"strip -Sx {artifact[target]}", target, cwd=soros_release_dir)
+                elif run_logged(f"{prefix[target]}strip --strip-unneeded -d -x {artifact[target]}",
+                                target, cwd=soros_release_dir) != 0:
+                    raise RuntimeError(f"strip {artifact[target]} failed")
+            copy_binaries(target, soros_release_dir)
+
+        prnt_run(f"Build rust source in buffett2 for {', '.join(target_list)}")
+        with profile.phase("build"):
+            results = build_targets(target_list, "buffett2", prefix, default_target,
+                                    jobs=jobs, parallel=parallel, after_build=collect, profile=profile)
+        print_build_report(results)
+        if not any(result.target == default_target and result.status in ("built", "cached") for result in results):
+            prnt_error(f"{default_target} was not built, nothing to deploy")
+            return
+        target = default_target
 
     else:
         target = default_target
@@ -181,7 +184,11 @@ def build(rust_version,cargoFeatures,release=False):
         # For development; build only the _default_ target
         prnt_run(f"Build the rust+c code in soros for {target}")
 
-        execute_shell(f"cargo build --all --release --features=erasure", cwd="vendor/rustelo-rust/soros")
+        timings = " --timings" if cargo_supports_timings("vendor/rustelo-rust/soros") else ""
+        cargo_start = time.time()
+        with profile.phase("cargo build", target):
+            execute_shell(f"cargo build --all --release --features=erasure{timings}", cwd="vendor/rustelo-rust/soros", env=shared_cargo_env(target))
+        profile.add_crate_timings(target, cargo_timings(target_dir(target), since=cargo_start))
         
         # Copy _default_ lib over
         
@@ -206,16 +213,19 @@ def build(rust_version,cargoFeatures,release=False):
             "wallet"
         ]
 
-        for crate in BIN_CRATES:
-            # execute_shell(f"set -x && cargo  install --force --path '{crate}' --root '{pwd}/libs/{target}/'  --features='erasure'", cwd="vendor/rustelo-rust/soros")
-            execute_shell(f"set -x && cargo  install --force --path '{crate}' --root '{pwd}/libs/{target}/'  --features='erasure'", cwd="vendor/rustelo-rust/soros")
+        with profile.phase("cargo install", target):
+            for crate in BIN_CRATES:
+                # execute_shell(f"set -x && cargo  install --force --path '{crate}' --root '{pwd}/libs/{target}/'  --features='erasure'", cwd="vendor/rustelo-rust/soros")
+                execute_shell(f"set -x && cargo  install --force --path '{crate}' --root '{pwd}/libs/{target}/'  --features='erasure'", cwd="vendor/rustelo-rust/soros", env=shared_cargo_env(target))
 
         # copy dependencies into deps folder
         # execute_shell(f"set -x && cp *.so {pwd}/libs/{target}/bin/deps",cwd="vendor/rustelo-rust/soros/target/release")
-        execute_shell(f"set -x && cp libsoros*.so {pwd}/libs/{target}/bin/deps",cwd="vendor/rustelo-rust/soros/target/release/deps")
+        with profile.phase("copy", target):
+            execute_shell(f"set -x && cp libsoros*.so {pwd}/libs/{target}/bin/deps",cwd=f"{target_dir(target)}/release/deps")
 
 
-    deploy_bin(target)
+    with profile.phase("install"):
+        deploy_bin(target)
 
 
 
@@ -241,13 +251,9 @@ def createUser(name,username, password):
 
 def deploy_bin(target):
     # installation location /usr/bin/bitconch
-    # remove previous installed version
-    if os.path.exists("/usr/bin/bitconch"):
-        prnt_run("Remove previous installed version")
-        rmtree("/usr/bin/bitconch",onerror=rmtree_onerror)
-        prnt_run("Copy the compiled binaries to /usr/bin/bitconch")
-    # cp the binary into the folder 
-    copytree(f"libs/{target}/", "/usr/bin/bitconch")
+    # only the binaries that changed since the previous install are replaced
+    prnt_run("Install the compiled binaries to /usr/bin/bitconch")
+    prnt_run(describe_install("/usr/bin/bitconch", install_tree(f"libs/{target}/", "/usr/bin/bitconch")))
     
     # seth PATH variable 
     prnt_run(f"Set PATH to include soros executables ")
@@ -280,13 +286,10 @@ def deploy_bin(target):
     # cp the service files into service folder
     execute_shell("cp soros.service.template/*  /etc/systemd/system")
 
-    if os.path.exists("/bitconch/soros"):
-        prnt_run("Remove previous installed version")
-        rmtree("/bitconch/soros",onerror=rmtree_onerror)
-        prnt_run("Copy the soros scripts to /bitconch/soros")
+    prnt_run("Install the soros scripts to /bitconch/soros")
     # create the working directory data directory
-    copytree(f"soros.scripts/demo", "/bitconch/soros/demo")
-    copytree(f"soros.scripts/scripts", "/bitconch/soros/scripts")
+    prnt_run(describe_install("/bitconch/soros/demo", install_tree(f"soros.scripts/demo", "/bitconch/soros/demo")))
+    prnt_run(describe_install("/bitconch/soros/scripts", install_tree(f"soros.scripts/scripts", "/bitconch/soros/scripts")))
 
    
 parser = argparse.ArgumentParser()
@@ -294,11 +297,21 @@ parser.add_argument(
     "-R", "--release", help="build in release mode", action="store_true")
 parser.add_argument(
     "-C", "--commit", help="commit include/ and libs/", action="store_true")
+parser.add_argument(
+    "-j", "--jobs", type=int, help="total cargo jobs of a release build, shared by the targets (default: cpu count)")
+parser.add_argument(
+    "--parallel-targets", type=int, help="targets built at the same time in release mode (default: all)")
 
 argv = parser.parse_args(sys.argv[1:])
-
-update_submodules()
-build("1.35","erasure",release=argv.release)
+profile = BuildProfile("nightly")
+
+with profile.phase("submodule update"):
+    update_submodules()
+build("1.35","erasure",release=argv.release, jobs=argv.jobs, parallel=argv.parallel_targets)
+report_path, regressions = profile.write()
+prnt_run(f"Build profile written to {report_path}: " + ", ".join(profile.summary(crates=5)))
+for regression in regressions:
+    prnt_warn(f"Slower than the previous {profile.flavor} build: {regression}")
 prnt_run("Update PATH")
 # execute_shell(f"source ~/.profile")
 prnt_run("Please run /usr/bin/bitconch/soros/demo/setup.sh")
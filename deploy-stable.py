@@ -12,6 +12,7 @@ import getpass
 import click
 from subprocess import Popen, check_call, PIPE, check_output, CalledProcessError
 from shutil import copy2, copytree, rmtree
+from deploylib import BuildProfile, build_targets, copy_if_changed, describe_install, install_tree, print_build_report, run_logged
 from colorama import init
 init()
 from colorama import Fore, Back, Style
@@ -101,7 +102,7 @@ def update_submodules():
  
 
 
-def build(release=False):
+def build(release=False, jobs=None, parallel=None):
     target_list = execute_shell("rustup target list", silent=True).decode()
     m = re.search(r"(.*?)\s*\(default\)", target_list)
 
@@ -135,68 +136,59 @@ def build(release=False):
         "x86_64-apple-darwin": "librustelo.dylib"
     }
 
+    # binary in the cargo release dir -> name in libs/<target>
+    binaries = {
+        "buffett-fullnode": "buffett-fullnode",
+        "buffett-fullnode-config": "buffett-fullnode-config",
+        "buffett-tokenbot": "buffett-drone",
+        "buffett-benchbot": "buffett-bench-tps",
+        "buffett-ledgerbot": "buffett-ledger-tool",
+        "buffett-genesis": "buffett-genesis",
+        "buffett-keybot": "buffett-keygen"
+    }
+
+    def copy_binaries(target, target_release_dir):
+        with profile.phase("copy", target):
+            os.makedirs(f"libs/{target}/", exist_ok=True)
+            for built, name in binaries.items():
+                copy_if_changed(f"{target_release_dir}/{built}", f"libs/{target}/{name}")
+
     if release:
-        for target in target_list:
-            prnt_run(f"Build rust source for {target}")
-
-            if target != default_target:
-                execute_shell(["rustup", "target", "add", target],
-                   shell=False,
-                   silent=True,
-                   #cwd="vendor/rustelo-rust")
-                   cwd="buffett2")
-
-            profile = "--release" if release else ''
-            execute_shell(f"cargo build --all --target {target} {profile}",
-               #cwd="vendor/rustelo-rust",
-               cwd="buffett2",
-               env={
-                   "CC": f"{prefix[target]}gcc",
-                   "CARGO_TARGET_X86_64_UNKNOWN_LINUX_MUSL_LINKER": f"{prefix[target]}gcc",
-                   "CARGO_TARGET_X86_64_PC_WINDOWS_GNU_LINKER": f"{prefix[target]}gcc",
-               })
-
-            if target.endswith("-apple-darwin"):
-                               execute_shell(f"strip -Sx {artifact[target]}",
-                   cwd=f"buffett2/target/{target}/release", silent=True)
-
-            else:
-                execute_shell(f"{prefix[target]}strip --strip-unneeded -d -x {artifact[target]}",
-                   #cwd=f"vendor/rustelo-rust/target/{target}/release")
-                   cwd=f"buffett2/target/{target}/release")
-
-            #copy2(f"vendor/rustelo-rust/target/{target}/release/{artifact[target]}", f"libs/{target}/")
-            copy2(f"buffett2/target/{target}/release/buffett-fullnode", f"libs/{target}/buffett-fullnode")
-            copy2(f"buffett2/target/{target}/release/buffett-fullnode-config", f"libs/{target}/buffett-fullnode-config")
-            copy2(f"buffett2/target/{target}/release/buffett-tokenbot", f"libs/{target}/buffett-drone")
-            copy2(f"buffett2/target/{target}/release/buffett-benchbot", f"libs/{target}/buffett-bench-tps")
-            copy2(f"buffett2/target/{target}/release/buffett-ledgerbot", f"libs/{target}/buffett-ledger-tool")
-            copy2(f"buffett2/target/{target}/release/buffett-genesis", f"libs/{target}/buffett-genesis")
-            copy2(f"buffett2/target/{target}/release/buffett-keybot", f"libs/{target}/buffett-keygen")
+        def collect(target, target_release_dir):
+            # strip and copy the binaries of a built target, runs in that target's build thread
+            with profile.phase("strip", target):
+                if target.endswith("-apple-darwin"):
+                    run_logged(f"strip -Sx {artifact[target]}", target, cwd=target_release_dir)
+                elif run_logged(f"{prefix[target]}strip --strip-unneeded -d -x {artifact[target]}",
+                                target, cwd=target_release_dir) != 0:
+                    raise RuntimeError(f"strip {artifact[target]} failed")
+            copy_binaries(target, target_release_dir)
+
+        prnt_run(f"Build rust source in buffett2 for {', '.join(target_list)}")
+        with profile.phase("build"):
+            results = build_targets(target_list, "buffett2", prefix, default_target, jobs=jobs, parallel=parallel,
+                                    after_build=collect, outputs=list(binaries), profile=profile)
+        print_build_report(results)
+        if not any(result.target == default_target and result.status in ("built", "cached") for result in results):
+            prnt_error(f"{default_target} was not built, nothing to deploy")
+            return
+        target = default_target
 
     else:
         target = default_target
 
         # For development; build only the _default_ target
         prnt_run(f"build the rust+c code in buffett_stable for {target}")
-        execute_shell(f"cargo build  --all --release --target {target}", cwd="buffett_stable")
-        # execute_shell(f"cargo build  --target {target}", cwd="vendor/rustelo-rust")
+        with profile.phase("build"):
+            results = build_targets([target], "buffett_stable", prefix, default_target, jobs=jobs,
+                                    after_build=copy_binaries, outputs=list(binaries), profile=profile)
+        print_build_report(results)
+        if results[0].status not in ("built", "cached"):
+            prnt_error(f"{target} was not built, nothing to deploy")
+            return
 
-        # Copy _default_ lib over
-        prnt_run(f"check the lib folder, if not , create one ")
-        if not os.path.exists(f"libs/{target}/"):
-            os.makedirs(f"libs/{target}/")
-        prnt_run(f"copy the generated artifact file")
-        # copy2(f"vendor/rustelo-rust/target/{target}/debug/{artifact[target]}", f"libs/{target}/")
-        copy2(f"buffett_stable/target/{target}/release/buffett-fullnode", f"libs/{target}/buffett-fullnode")
-        copy2(f"buffett_stable/target/{target}/release/buffett-fullnode-config", f"libs/{target}/buffett-fullnode-config")
-        copy2(f"buffett_stable/target/{target}/release/buffett-tokenbot", f"libs/{target}/buffett-drone")
-        copy2(f"buffett_stable/target/{target}/release/buffett-benchbot", f"libs/{target}/buffett-bench-tps")
-        copy2(f"buffett_stable/target/{target}/release/buffett-ledgerbot", f"libs/{target}/buffett-ledger-tool")
-        copy2(f"buffett_stable/target/{target}/release/buffett-genesis", f"libs/{target}/buffett-genesis")
-        copy2(f"buffett_stable/target/{target}/release/buffett-keybot", f"libs/{target}/buffett-keygen")
-
-    deploy_bin(target)
+    with profile.phase("install"):
+        deploy_bin(target)
 
 
 
@@ -222,13 +214,9 @@ def createUser(name,username, password):
 
 def deploy_bin(target):
     # installation location /usr/bin/bitconch
-    # remove previous installed version
-    if os.path.exists("/usr/bin/bitconch"):
-        prnt_run("Remove previous installed version")
-        rmtree("/usr/bin/bitconch",onerror=rmtree_onerror)
-        prnt_run("Copy the compiled binaries to /usr/bin/bitconch")
-    # cp the binary into the folder 
-    copytree(f"libs/{target}/", "/usr/bin/bitconch")
+    # only the binaries that changed since the previous install are replaced
+    prnt_run("Install the compiled binaries to /usr/bin/bitconch")
+    prnt_run(describe_install("/usr/bin/bitconch", install_tree(f"libs/{target}/", "/usr/bin/bitconch")))
     
     # seth PATH variable 
     prnt_run(f"Set PATH to include buffett executables ")
@@ -261,8 +249,8 @@ def deploy_bin(target):
     execute_shell("cp service.template/*  /etc/systemd/system")
 
     # create the working directory data directory
-    copytree(f"buffett.scripts/demo", "/usr/bin/bitconch/buffett/demo")
-    copytree(f"buffett.scripts/scripts", "/usr/bin/bitconch/buffett/scripts")
+    prnt_run(describe_install("/usr/bin/bitconch/buffett/demo", install_tree(f"buffett.scripts/demo", "/usr/bin/bitconch/buffett/demo")))
+    prnt_run(describe_install("/usr/bin/bitconch/buffett/scripts", install_tree(f"buffett.scripts/scripts", "/usr/bin/bitconch/buffett/scripts")))
 
    
 parser = argparse.ArgumentParser()
@@ -270,11 +258,20 @@ parser.add_argument(
     "-R", "--release", help="build in release mode", action="store_true")
 parser.add_argument(
     "-C", "--commit", help="commit include/ and libs/", action="store_true")
+parser.add_argument(
+    "-j", "--jobs", type=int, help="total cargo jobs of a release build, shared by the targets (default: cpu count)")
+parser.add_argument(
+    "--parallel-targets", type=int, help="targets built at the same time in release mode (default: all)")
 
 argv = parser.parse_args(sys.argv[1:])
+profile = BuildProfile("stable")
 
 #update_submodules()
-build(release=argv.release)
+build(release=argv.release, jobs=argv.jobs, parallel=argv.parallel_targets)
+report_path, regressions = profile.write()
+prnt_run(f"Build profile written to {report_path}: " + ", ".join(profile.summary(crates=5)))
+for regression in regressions:
+    prnt_warn(f"Slower than the previous {profile.flavor} build: {regression}")
 prnt_run("Please run the following command to reload the profile: ")
 prnt_run("source ~/.profile")
 prnt_run("Please run /usr/bin/bitconch/buffett/demo/setup.sh")
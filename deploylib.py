@@ -0,0 +1,653 @@
+"""
+Build helpers shared by deploy-stable.py, deploy-nightly.py and deploy-morgan.py
+"""
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import stat
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+_print_lock = threading.Lock()
+
+
+def log_line(prefix, line):
+    """
+    Print one line of output, prefixed, without interleaving with other build threads
+    """
+    with _print_lock:
+        sys.stdout.write(f"[{prefix}] {line}\n")
+        sys.stdout.flush()
+
+
+def run_logged(command, prefix, cwd=None, env=None, shell=True):
+    """
+    Run a command, streaming its stdout and stderr line by line with a prefix.
+    Returns the exit code.
+    """
+    if env is not None:
+        env = dict(**os.environ, **env)
+    p = subprocess.Popen(command, shell=shell, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT, universal_newlines=True, errors="replace")
+    for line in p.stdout:
+        log_line(prefix, line.rstrip("\n"))
+    return p.wait()
+
+
+class TargetBuild:
+    """
+    Outcome of building one target: status is one of built, cached (restored from the artifact store), skipped or failed
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.status = "pending"
+        self.reason = ""
+        self.seconds = 0.0
+
+    def __repr__(self):
+        return f"TargetBuild({self.target}, {self.status}, {self.seconds:.1f}s)"
+
+
+def host_os():
+    return platform.system().lower()
+
+
+def unbuildable_reason(target, prefix, default_target):
+    """
+    Why this host can not cross compile target, or None if it looks like it can
+    """
+    if target == default_target:
+        return None
+    if target.endswith("-apple-darwin"):
+        if host_os() != "darwin" and not os.environ.get("CARGO_TARGET_X86_64_APPLE_DARWIN_LINKER"):
+            return "no macOS cross linker (set CARGO_TARGET_X86_64_APPLE_DARWIN_LINKER)"
+        return None
+    if shutil.which(f"{prefix}gcc") is None:
+        return f"cross compiler {prefix}gcc not found"
+    return None
+
+
+BUILD_CACHE = os.environ.get("BITCONCH_BUILD_CACHE", os.path.expanduser("~/.cache/bitconch/cargo"))
+
+
+def target_dir(target):
+    """
+    Cargo target dir of a target, shared by every crate and flavor built on this box so the dependency
+    crates they have in common are compiled once. Each target has its own, so concurrent target builds
+    do not wait on each other's build directory lock.
+    """
+    return os.path.join(BUILD_CACHE, "target", target)
+
+
+def release_dir(target):
+    return os.path.join(target_dir(target), target, "release")
+
+
+def built_release_dir(target, crate_dir, names):
+    """
+    Release dir holding the binaries names of crate_dir built for target: the shared release dir the
+    deploy scripts build into, or the crate's own target dir of a build made without CARGO_TARGET_DIR.
+    When both have them the newer build wins; raises RuntimeError when neither has all of them.
+    """
+    candidates = [release_dir(target), os.path.join(crate_dir, "target", target, "release")]
+    complete = [d for d in candidates if all(os.path.isfile(os.path.join(d, name)) for name in names)]
+    if not complete:
+        raise RuntimeError(f"{', '.join(names)} of {crate_dir} not built for {target} in {' or '.join(candidates)}")
+    return max(complete, key=lambda d: max(os.path.getmtime(os.path.join(d, name)) for name in names))
+
+
+def shared_cargo_env(target):
+    """
+    Environment for cargo builds of target that share the compilation cache: the shared target dir,
+    and sccache as the rustc wrapper when it is installed (unless a wrapper is configured already)
+    """
+    env = {"CARGO_TARGET_DIR": target_dir(target)}
+    if "RUSTC_WRAPPER" not in os.environ and shutil.which("sccache"):
+        env["RUSTC_WRAPPER"] = "sccache"
+    return env
+
+
+def _git(args, cwd):
+    return subprocess.run(["git"] + args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          check=True).stdout
+
+
+def _hash_git_tree(h, tree_dir):
+    """
+    Add the git tree id of tree_dir plus any uncommitted changes and untracked files in it to h
+    """
+    prefix = _git(["rev-parse", "--show-prefix"], tree_dir).decode().strip()
+    h.update(_git(["rev-parse", f"HEAD:{prefix}"], tree_dir))
+    h.update(_git(["diff", "HEAD", "--binary", "--", "."], tree_dir))
+    for name in _git(["ls-files", "--others", "--exclude-standard", "-z", "--", "."], tree_dir).split(b"\0"):
+        if name:
+            h.update(name + b"\0" + file_digest(os.path.join(tree_dir, name.decode())).encode())
+
+
+def _is_within(path, root):
+    path, root = os.path.realpath(path), os.path.realpath(root)
+    return path == root or path.startswith(root + os.sep)
+
+
+def source_tree_hash(crate_dir):
+    """
+    Hash of the sources a build of crate_dir depends on: its git tree (as by _hash_git_tree), the
+    workspace's Cargo.lock, which is git ignored, and the trees of path dependencies outside crate_dir,
+    as listed by cargo metadata. None when any of them can not be hashed, e.g. outside a git work tree.
+    """
+    try:
+        h = hashlib.sha256()
+        _hash_git_tree(h, crate_dir)
+        metadata = json.loads(subprocess.run(["cargo", "metadata", "--format-version", "1"], cwd=crate_dir,
+                                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout)
+        lock = os.path.join(metadata["workspace_root"], "Cargo.lock")
+        h.update(b"Cargo.lock\0" + (file_digest(lock).encode() if os.path.exists(lock) else b"-"))
+        local_dirs = {os.path.dirname(package["manifest_path"]) for package in metadata["packages"]
+                      if package["source"] is None}
+        for package_dir in sorted(local_dirs):
+            if not _is_within(package_dir, crate_dir):
+                h.update(package_dir.encode() + b"\0")
+                _hash_git_tree(h, package_dir)
+    except (OSError, ValueError, KeyError, subprocess.CalledProcessError):
+        return None
+    return h.hexdigest()
+
+
+def build_key(crate_dir, target, features="", profile="release"):
+    """
+    Artifact store key of a build: (source tree hash, target, features, profile, rustc version). None if unknown
+    """
+    tree = source_tree_hash(crate_dir)
+    if tree is None:
+        return None
+    try:
+        rustc = subprocess.run(["rustc", "-V"], cwd=crate_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    key = {"tree": tree, "target": target, "features": features, "profile": profile, "rustc": rustc}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _build_one(result, crate_dir, cargo_args, prefix, default_target, jobs, after_build, outputs, features, store,
+               profile):
+    target = result.target
+    start = time.time()
+    try:
+        key = build_key(crate_dir, target, features) if outputs and store is not None else None
+        if key is not None and store.restore_build(key, release_dir(target)):
+            log_line(target, f"restored {', '.join(outputs)} from the artifact store")
+            if after_build is not None:
+                after_build(target, release_dir(target))
+            result.status = "cached"
+            return result
+
+        profile = profile or BuildProfile(None)
+        if target != default_target:
+            with profile.phase("rustup target add", target):
+                code = run_logged(["rustup", "target", "add", target], target, cwd=crate_dir, shell=False)
+            if code != 0:
+                result.status, result.reason = "skipped", "rustup target add failed"
+                return result
+
+        if features:
+            cargo_args = f"{cargo_args} --features={features}"
+        if cargo_supports_timings(crate_dir):
+            cargo_args = f"{cargo_args} --timings"
+        log_line(target, f"cargo build {cargo_args} with {jobs} jobs")
+        cargo_start = time.time()
+        with profile.phase("cargo build", target):
+            code = run_logged(f"cargo build {cargo_args} --target {target} -j {jobs}", target, cwd=crate_dir, env=dict(
+                shared_cargo_env(target), **{
+                    "CC": f"{prefix[target]}gcc",
+                    "CARGO_TARGET_X86_64_UNKNOWN_LINUX_MUSL_LINKER": f"{prefix[target]}gcc",
+                    "CARGO_TARGET_X86_64_PC_WINDOWS_GNU_LINKER": f"{prefix[target]}gcc",
+                }))
+        profile.add_crate_timings(target, cargo_timings(target_dir(target), since=cargo_start))
+        if code != 0:
+            result.status, result.reason = "failed", f"cargo build exited with {code}"
+            return result
+
+        if key is not None:
+            try:
+                if store.record_build(key, release_dir(target), outputs):
+                    log_line(target, "stored the build in the artifact store")
+                else:
+                    log_line(target, "not storing the build, not all outputs were found")
+            except OSError as e:
+                log_line(target, f"not storing the build, the artifact store is not writable: {e}")
+        if after_build is not None:
+            after_build(target, release_dir(target))
+        result.status = "built"
+    except Exception as e:
+        result.status, result.reason = "failed", str(e)
+    finally:
+        result.seconds = time.time() - start
+    return result
+
+
+def build_targets(targets, crate_dir, prefix, default_target, cargo_args="--all --release",
+                  jobs=None, parallel=None, after_build=None, outputs=None, features="", store=None, profile=None):
+    """
+    Build the crate in crate_dir for all targets concurrently, each in its own shared target dir.
+
+    jobs is the total number of cargo jobs (default: cpu count), shared evenly by the at most
+    parallel (default: all) targets building at a time. Targets this host can not build are
+    skipped and a failing target does not stop the others. after_build(target, release_dir)
+    runs once a target is built, e.g. to strip and collect the binaries; raising fails the target.
+
+    When outputs (file names in the release dir) are given, builds are kept in the artifact store
+    under their build_key, and a target already built from the same sources, features and toolchain
+    is restored from there instead of being built again.
+    A BuildProfile, if given, gets the rustup and cargo durations and the per crate timings of every target.
+    Returns a list of TargetBuild, in the order of targets.
+    """
+    if outputs and store is None:
+        store = ArtifactStore()
+    results = [TargetBuild(target) for target in targets]
+    buildable = []
+    for result in results:
+        reason = unbuildable_reason(result.target, prefix[result.target], default_target)
+        if reason is None:
+            buildable.append(result)
+        else:
+            result.status, result.reason = "skipped", reason
+            log_line(result.target, f"skipped: {reason}")
+    if not buildable:
+        return results
+
+    jobs = jobs or os.cpu_count() or 1
+    parallel = max(1, min(parallel or len(buildable), len(buildable)))
+    per_target_jobs = max(1, jobs // parallel)
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        for result in buildable:
+            pool.submit(_build_one, result, crate_dir, cargo_args, prefix, default_target, per_target_jobs, after_build,
+                        outputs, features, store, profile)
+    return results
+
+
+def print_build_report(results):
+    """
+    Print a per target summary of a build_targets run
+    """
+    with _print_lock:
+        print(f"{'target':<28} {'status':<8} {'seconds':>8}  reason")
+        for result in results:
+            print(f"{result.target:<28} {result.status:<8} {result.seconds:>8.1f}  {result.reason}")
+        sys.stdout.flush()
+
+
+ARTIFACT_STORE = os.environ.get("BITCONCH_ARTIFACT_STORE", "/var/cache/bitconch/artifacts")
+MANIFEST_NAME = ".deploy-manifest.json"
+
+InstallResult = namedtuple("InstallResult", "changed unchanged removed")
+
+
+def file_digest(path):
+    """
+    sha256 hex digest of a file's content
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _replace_with_copy(src, dest, mode=None):
+    """
+    Copy src over dest through a temporary file in dest's directory and a rename,
+    so dest is always either the old or the new file
+    """
+    tmp = os.path.join(os.path.dirname(dest) or ".", f".{os.path.basename(dest)}.deploy-{os.getpid()}")
+    try:
+        shutil.copy2(src, tmp)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def copy_if_changed(src, dest):
+    """
+    copy2 src to dest unless dest already has the same content. Returns whether dest changed
+    """
+    if os.path.isfile(dest) and os.path.getsize(dest) == os.path.getsize(src) and file_digest(dest) == file_digest(src):
+        return False
+    _replace_with_copy(src, dest)
+    return True
+
+
+class ArtifactStore:
+    """
+    Content addressed local store: every file is kept once, read only, under objects/<sha256>.
+    Installed files are hardlinks to the store objects where the filesystem allows it.
+    """
+
+    def __init__(self, root=ARTIFACT_STORE):
+        self.root = root
+
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest[2:])
+
+    def add(self, path, digest, mode):
+        """
+        Store a file with the given digest and mode (write bits are dropped). Returns the object path
+        """
+        obj = self.object_path(digest)
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            _replace_with_copy(path, obj, mode & ~0o222)
+        return obj
+
+    def _build_path(self, key):
+        return os.path.join(self.root, "builds", f"{key}.json")
+
+    def record_build(self, key, directory, names):
+        """
+        Store the named files of directory as the build with this key. Returns False if a file is missing
+        """
+        paths = {name: os.path.join(directory, name) for name in names}
+        if not all(os.path.isfile(path) for path in paths.values()):
+            return False
+        files = {}
+        for name, path in paths.items():
+            digest = file_digest(path)
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+            self.add(path, digest, mode)
+            files[name] = {"sha256": digest, "mode": mode}
+        os.makedirs(os.path.dirname(self._build_path(key)), exist_ok=True)
+        tmp = f"{self._build_path(key)}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump({"files": files, "time": time.time()}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self._build_path(key))
+        return True
+
+    def restore_build(self, key, directory):
+        """
+        Put the files of the build with this key into directory. Returns False if the store does not have it
+        """
+        try:
+            with open(self._build_path(key)) as f:
+                files = json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            return False
+        if not all(os.path.isfile(self.object_path(entry["sha256"])) for entry in files.values()):
+            return False
+        os.makedirs(directory, exist_ok=True)
+        for name, entry in files.items():
+            dest = os.path.join(directory, name)
+            if not (os.path.isfile(dest) and file_digest(dest) == entry["sha256"]):
+                _replace_with_copy(self.object_path(entry["sha256"]), dest, entry["mode"])
+        return True
+
+    def prune(self, max_age_days=30):
+        """
+        Remove objects nothing links to any more (link count 1) that were last changed over max_age_days ago
+        """
+        cutoff = time.time() - max_age_days * 24 * 3600
+        removed = 0
+        for root, _, files in os.walk(os.path.join(self.root, "objects")):
+            for name in files:
+                path = os.path.join(root, name)
+                st = os.lstat(path)
+                if st.st_nlink == 1 and st.st_ctime < cutoff:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+
+def _link_or_copy(obj, dest, mode):
+    """
+    Atomically make dest a hardlink to the store object, or a copy of it if linking is not possible
+    (another filesystem, or the object has a different mode)
+    """
+    if stat.S_IMODE(os.stat(obj).st_mode) == mode:
+        tmp = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.deploy-{os.getpid()}")
+        try:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            os.link(obj, tmp)
+            os.replace(tmp, dest)
+            return
+        except OSError:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+    _replace_with_copy(obj, dest, mode)
+
+
+def _load_manifest(dest_dir):
+    try:
+        with open(os.path.join(dest_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(dest_dir, manifest):
+    path = os.path.join(dest_dir, MANIFEST_NAME)
+    tmp = f"{path}.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def install_tree(src_dir, dest_dir, store=None):
+    """
+    Install the files under src_dir into dest_dir, replacing only the files whose content changed.
+
+    dest_dir keeps a manifest (MANIFEST_NAME) of the files installed there with their sha256, and
+    files in the previous manifest that are gone from src_dir are removed. Other files in dest_dir
+    are left alone. Every file is replaced by a rename, and the manifest is written last, so an
+    interrupted install leaves complete old or new files and is simply redone by the next run.
+    Returns an InstallResult of relative paths.
+    """
+    store = store if store is not None else ArtifactStore()
+    try:
+        os.makedirs(store.root, exist_ok=True)
+    except OSError:
+        store = None
+    old = _load_manifest(dest_dir)
+    new = {}
+    changed, unchanged, removed = [], [], []
+    for root, dirs, files in os.walk(src_dir):
+        dirs.sort()
+        for name in sorted(files):
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, src_dir)
+            dest = os.path.join(dest_dir, rel)
+            digest = file_digest(src)
+            mode = stat.S_IMODE(os.stat(src).st_mode) & ~0o222
+            entry = old.get(rel)
+            try:
+                current = os.stat(dest)
+            except OSError:
+                current = None
+
+            if current is not None and entry is not None and entry["sha256"] == digest \
+                    and entry["size"] == current.st_size and entry["mtime_ns"] == current.st_mtime_ns:
+                unchanged.append(rel)
+            elif current is not None and entry is None and current.st_size == os.path.getsize(src) \
+                    and file_digest(dest) == digest:
+                # installed before there was a manifest
+                unchanged.append(rel)
+            else:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                if store is not None:
+                    _link_or_copy(store.add(src, digest, mode), dest, mode)
+                else:
+                    _replace_with_copy(src, dest, mode)
+                changed.append(rel)
+                current = os.stat(dest)
+            new[rel] = {"sha256": digest, "size": current.st_size, "mtime_ns": current.st_mtime_ns}
+
+    for rel in sorted(set(old) - set(new)):
+        dest = os.path.join(dest_dir, rel)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        removed.append(rel)
+        # drop directories left empty, up to dest_dir
+        parent = os.path.dirname(dest)
+        while os.path.abspath(parent) != os.path.abspath(dest_dir) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+    os.makedirs(dest_dir, exist_ok=True)
+    _write_manifest(dest_dir, new)
+    return InstallResult(changed, unchanged, removed)
+
+
+def describe_install(dest_dir, result):
+    return (f"{dest_dir}: {len(result.changed)} files replaced, {len(result.unchanged)} unchanged, "
+            f"{len(result.removed)} removed")
+
+
+BUILD_REPORTS = os.environ.get("BITCONCH_BUILD_REPORTS", os.path.expanduser("~/.cache/bitconch/build-reports"))
+
+_timings_support = {}
+
+
+def cargo_supports_timings(crate_dir):
+    """
+    Whether the cargo of crate_dir's toolchain has --timings (stable since cargo 1.60)
+    """
+    key = os.path.abspath(crate_dir)
+    if key not in _timings_support:
+        try:
+            help_text = subprocess.run(["cargo", "build", "--help"], cwd=crate_dir, stdout=subprocess.PIPE,
+                                       stderr=subprocess.DEVNULL).stdout.decode(errors="replace")
+        except OSError:
+            help_text = ""
+        _timings_support[key] = "--timings" in help_text
+    return _timings_support[key]
+
+
+def cargo_timings(cargo_target_dir, since=0):
+    """
+    Per crate compile times from the cargo-timing.html that cargo build --timings wrote into the target dir,
+    if it was written after since. Returns a list of {name, version, mode, seconds, rmeta_seconds}, slowest first.
+    """
+    path = os.path.join(cargo_target_dir, "cargo-timings", "cargo-timing.html")
+    try:
+        if os.path.getmtime(path) < since:
+            return []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            m = re.search(r"const UNIT_DATA = (\[.*?\]);\n", f.read(), re.S)
+        units = json.loads(m.group(1)) if m else []
+    except (OSError, ValueError):
+        return []
+    timings = [{"name": u.get("name"), "version": u.get("version"), "mode": u.get("mode"),
+                "seconds": u.get("duration", 0.0), "rmeta_seconds": u.get("rmeta_time")} for u in units]
+    return sorted(timings, key=lambda t: t["seconds"], reverse=True)
+
+
+class BuildProfile:
+    """
+    Durations of the phases of a deploy (submodule update, build, strip, copy, install, ...), per target where
+    it applies, plus per crate compile timings. write() saves them as a JSON report and compares them with
+    the previous report of the same flavor.
+    """
+
+    def __init__(self, flavor, report_dir=BUILD_REPORTS):
+        self.flavor = flavor
+        self.report_dir = report_dir
+        self.start = time.time()
+        self.phases = {}
+        self.crates = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name, target=None):
+        key = name if target is None else f"{name} [{target}]"
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[key] = self.phases.get(key, 0.0) + time.time() - start
+
+    def add_crate_timings(self, target, timings):
+        if timings:
+            with self.lock:
+                self.crates[target] = timings
+
+    def report(self):
+        with self.lock:
+            return {
+                "flavor": self.flavor,
+                "start": self.start,
+                "total_seconds": time.time() - self.start,
+                "phases": dict(self.phases),
+                "crates": {target: list(timings) for target, timings in self.crates.items()},
+            }
+
+    def _previous_report(self):
+        try:
+            names = sorted(n for n in os.listdir(self.report_dir) if n.startswith(f"{self.flavor}-") and n.endswith(".json"))
+        except OSError:
+            return None
+        for name in reversed(names):
+            try:
+                with open(os.path.join(self.report_dir, name)) as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                continue
+        return None
+
+    @staticmethod
+    def regressions(report, previous, ratio=0.2, min_seconds=5.0, crate_min_seconds=2.0):
+        """
+        Descriptions of the total, phases and crates that took at least ratio longer than in previous,
+        ignoring differences below min_seconds (crate_min_seconds for crates)
+        """
+        found = []
+
+        def check(what, now, before, floor):
+            if before is not None and now - before >= floor and now > before * (1 + ratio):
+                found.append(f"{what}: {now:.1f}s, was {before:.1f}s (+{100 * (now / before - 1) if before else 100:.0f}%)")
+
+        check("total", report["total_seconds"], previous.get("total_seconds"), min_seconds)
+        for name, seconds in sorted(report["phases"].items()):
+            check(name, seconds, previous.get("phases", {}).get(name), min_seconds)
+        for target, timings in sorted(report["crates"].items()):
+            before = {(t["name"], t["version"], t["mode"]): t["seconds"] for t in previous.get("crates", {}).get(target, [])}
+            for t in timings:
+                check(f"crate {t['name']} {t['version']} {t['mode']} [{target}]", t["seconds"],
+                      before.get((t["name"], t["version"], t["mode"])), crate_min_seconds)
+        return found
+
+    def write(self):
+        """
+        Save the report as <report_dir>/<flavor>-<time>.json. Returns (report path, regressions against the previous report)
+        """
+        report = self.report()
+        previous = self._previous_report()
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(self.report_dir, f"{self.flavor}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.start))}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1)
+        return path, (self.regressions(report, previous) if previous is not None else [])
+
+    def summary(self, crates=10):
+        """
+        Lines describing the phases and the slowest crates
+        """
+        report = self.report()
+        lines = [f"total {report['total_seconds']:.1f}s"]
+        lines += [f"{name}: {seconds:.1f}s" for name, seconds in sorted(report["phases"].items(), key=lambda p: -p[1])]
+        slowest = sorted(((t["seconds"], t["name"], target) for target, timings in report["crates"].items() for t in timings),
+                         reverse=True)[:crates]
+        lines += [f"crate {name} [{target}]: {seconds:.1f}s" for seconds, name, target in slowest]
+        return lines
@@ -1,43 +1,188 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
-import matplotlib
-matplotlib.use('Agg')
-
-import matplotlib.pyplot as plt
-import json
+import argparse
+import html
+import math
+import os
 import sys
 
-stages_to_counters = {}
-stages_to_time = {}
+import perfcounters
 
-if len(sys.argv) != 2:
-    print("USAGE: {} <input file>".format(sys.argv[0]))
-    sys.exit(1)
+labels = {'counts': 'count', 'samples': 'inc() calls', 'events': 'logged events', 'rate': 'count/s',
+          'calls': 'inc() calls/s', 'events_per_call': 'events/call', 'samples_per_event': 'calls/event'}
+
+COLORS = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf')
+LINE_STYLES = ('-', '--', ':', '-.')
+DASH_ARRAYS = ('', '6 3', '2 2', '6 2 2 2')
+
+parser = argparse.ArgumentParser(description="Plot the COUNTER records of one or more logs on shared axes")
+parser.add_argument("inputs", nargs='+', help="log files, e.g. of two builds, overlaid on the same axes")
+parser.add_argument("--series", choices=perfcounters.SERIES, default='rate',
+                    help="what to plot per counter (default: %(default)s)")
+parser.add_argument("--output", help="PDF output file, an error without matplotlib (default: perf.pdf, skipped without matplotlib)")
+parser.add_argument("--html", help="self-contained HTML output file (default: the PDF name with .html)")
+parser.add_argument("--points", type=int, default=2000,
+                    help="time buckets each series is decimated to, keeping each bucket's min and max (default: %(default)s)")
+parser.add_argument("--absolute-time", action="store_true",
+                    help="plot the logged ms timestamps instead of seconds since each log's first record")
+parser.add_argument("--no-cache", action="store_true",
+                    help="neither read nor write the parsed counter cache kept next to the log")
+args = parser.parse_args()
+
+pdf_requested = args.output is not None
+if args.output is None:
+    args.output = "perf.pdf"
+if args.html is None:
+    args.html = os.path.splitext(args.output)[0] + '.html'
+
+
+def collect(paths, kind):
+    """Returns a list of (log index, log name, stage, x, y) with x in seconds (or ms with --absolute-time)."""
+    lines = []
+    for index, (path, name) in enumerate(zip(paths, perfcounters.log_names(paths))):
+        stages = perfcounters.load(path, use_cache=not args.no_cache)
+        if not stages:
+            print("no COUNTER records in {}".format(path), file=sys.stderr)
+            continue
+        start = min(int(columns['now'][0]) for columns in stages.values())
+        for stage, columns in stages.items():
+            if kind not in ('counts', 'rate') and columns['samples'][-1] < 0:
+                # older logs without the samples and events fields
+                continue
+            time, values = perfcounters.series(columns, kind)
+            finite = perfcounters.np.isfinite(values)
+            time, values = perfcounters.decimate(time[finite], values[finite], args.points)
+            if len(time) == 0:
+                continue
+            x = time.astype(perfcounters.np.float64) if args.absolute_time else (time - start) / 1000.0
+            lines.append((index, name, stage, x, values.astype(perfcounters.np.float64)))
+    return lines
+
+
+def line_label(name, stage):
+    return stage if len(args.inputs) == 1 else "{}: {}".format(name, stage)
+
+
+def stage_colors(lines):
+    """The same stage gets the same color in every log; logs are told apart by line style."""
+    colors = {}
+    for _, _, stage, _, _ in lines:
+        colors.setdefault(stage, COLORS[len(colors) % len(COLORS)])
+    return colors
 
-with open(sys.argv[1]) as fh:
-    for line in fh.readlines():
-        if "COUNTER" in line:
-            json_part = line[line.find("{"):]
-            x = json.loads(json_part)
-            counter = x['name']
-            if not (counter in stages_to_counters):
-                stages_to_counters[counter] = []
-                stages_to_time[counter] = []
-            stages_to_counters[counter].append(x['counts'])
-            stages_to_time[counter].append(x['now'])
 
-fig, ax = plt.subplots()
+def nice_ticks(low, high, count=8):
+    if high <= low:
+        return [low]
+    raw = (high - low) / count
+    magnitude = 10 ** math.floor(math.log10(raw))
+    step = next(m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= raw)
+    first = math.ceil(low / step) * step
+    return [first + i * step for i in range(int((high - first) / step) + 1)]
 
-for stage in stages_to_counters.keys():
-    plt.plot(stages_to_time[stage], stages_to_counters[stage], label=stage)
 
-plt.xlabel('ms')
-plt.ylabel('count')
+def write_pdf(lines, xlabel):
+    """Returns False if matplotlib is not installed."""
+    try:
+        import matplotlib
+    except ImportError:
+        print("matplotlib is not installed, not writing {}".format(args.output), file=sys.stderr)
+        return False
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
 
-plt.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=3,
-           ncol=2, mode="expand", borderaxespad=0.)
+    colors = stage_colors(lines)
+    fig, ax = plt.subplots()
+    for index, name, stage, x, y in lines:
+        ax.plot(x, y, label=line_label(name, stage), color=colors[stage],
+                linestyle=LINE_STYLES[index % len(LINE_STYLES)], linewidth=0.8)
 
-plt.locator_params(axis='x', nbins=10)
-plt.grid(True)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(labels[args.series])
+    ax.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc=3, ncol=2, mode="expand", borderaxespad=0., fontsize='small')
+    ax.locator_params(axis='x', nbins=10)
+    ax.grid(True)
+    fig.savefig(args.output, bbox_inches='tight')
+    plt.close(fig)
+    return True
 
-plt.savefig("perf.pdf")
+
+def write_html(lines, xlabel):
+    """A single file with an inline SVG chart and a legend whose entries toggle the lines, no external resources."""
+    width, height = 1200, 600
+    left, right, top, bottom = 80, 20, 20, 50
+    plot_w = width - left - right
+    plot_h = height - top - bottom
+
+    x_min = min(float(x[0]) for _, _, _, x, _ in lines)
+    x_max = max(float(x[-1]) for _, _, _, x, _ in lines)
+    y_min = min(0.0, min(float(y.min()) for _, _, _, _, y in lines))
+    y_max = max(float(y.max()) for _, _, _, _, y in lines)
+    x_span = (x_max - x_min) or 1.0
+    y_span = (y_max - y_min) or 1.0
+
+    def sx(value):
+        return left + (value - x_min) / x_span * plot_w
+
+    def sy(value):
+        return top + plot_h - (value - y_min) / y_span * plot_h
+
+    svg = ['<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {} {}" width="100%">'.format(width, height)]
+    for tick in nice_ticks(x_min, x_max):
+        svg.append('<line class="grid" x1="{0:.1f}" x2="{0:.1f}" y1="{1}" y2="{2}"/>'.format(sx(tick), top, top + plot_h))
+        svg.append('<text x="{:.1f}" y="{}" text-anchor="middle">{:g}</text>'.format(sx(tick), top + plot_h + 18, tick))
+    for tick in nice_ticks(y_min, y_max):
+        svg.append('<line class="grid" x1="{0}" x2="{1}" y1="{2:.1f}" y2="{2:.1f}"/>'.format(left, left + plot_w, sy(tick)))
+        svg.append('<text x="{}" y="{:.1f}" text-anchor="end">{:,.6g}</text>'.format(left - 6, sy(tick) + 4, tick))
+    svg.append('<rect class="frame" x="{}" y="{}" width="{}" height="{}"/>'.format(left, top, plot_w, plot_h))
+    svg.append('<text x="{}" y="{}" text-anchor="middle">{}</text>'.format(left + plot_w / 2, height - 8, html.escape(xlabel)))
+    svg.append('<text transform="translate(16 {}) rotate(-90)" text-anchor="middle">{}</text>'.format(
+        top + plot_h / 2, html.escape(labels[args.series])))
+
+    colors = stage_colors(lines)
+    legend = []
+    for number, (index, name, stage, x, y) in enumerate(lines):
+        label = html.escape(line_label(name, stage))
+        points = ' '.join('{:.1f},{:.1f}'.format(px, py) for px, py in zip(sx(x).tolist(), sy(y).tolist()))
+        dash = DASH_ARRAYS[index % len(DASH_ARRAYS)]
+        svg.append('<polyline id="l{}" stroke="{}"{} points="{}"><title>{}</title></polyline>'.format(
+            number, colors[stage], ' stroke-dasharray="{}"'.format(dash) if dash else '', points, label))
+        legend.append('<label><input type="checkbox" checked data-line="l{}"><span style="color:{}">&#9632;</span> {}</label>'.format(
+            number, colors[stage], label))
+    svg.append('</svg>')
+
+    title = "{} of {}".format(labels[args.series], ', '.join(perfcounters.log_names(args.inputs)))
+    with open(args.html, 'w') as fh:
+        fh.write("""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; font-size: 13px; margin: 1em; }}
+svg text {{ font-size: 12px; fill: #333; }}
+polyline {{ fill: none; stroke-width: 1; }}
+.grid {{ stroke: #ddd; stroke-width: 1; }}
+.frame {{ fill: none; stroke: #888; }}
+#legend label {{ display: inline-block; margin-right: 1.5em; white-space: nowrap; }}
+</style></head>
+<body>
+<h3>{title}</h3>
+<div id="legend">{legend}</div>
+{svg}
+<script>
+document.querySelectorAll('#legend input').forEach(function (box) {{
+    box.addEventListener('change', function () {{
+        document.getElementById(box.dataset.line).style.display = box.checked ? '' : 'none';
+    }});
+}});
+</script>
+</body></html>
+""".format(title=html.escape(title), legend='\n'.join(legend), svg='\n'.join(svg)))
+
+
+lines = collect(args.inputs, args.series)
+if not lines:
+    sys.exit("nothing to plot")
+
+xlabel = 'ms' if args.absolute_time else 's since the first record'
+write_html(lines, xlabel)
+if not write_pdf(lines, xlabel) and pdf_requested:
+    sys.exit(1)
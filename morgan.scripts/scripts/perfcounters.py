@@ -0,0 +1,750 @@
+"""Shared COUNTER log parsing and statistics for perf-stats.py and perf-plot.py.
+
+Counters are logged by metrics/src/counter.rs as
+    COUNTER:{"name": "x", "counts": N, "samples": S,  "now": MS, "events": E}
+where counts is the cumulative count, samples the number of inc() calls, now the
+wall clock in ms and events the size of the inc() that triggered the log line.
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+import numpy as np
+
+COUNTER_RE = re.compile(
+    rb'COUNTER:\s*\{"name":\s*"([^"]*)",\s*"counts":\s*(\d+)(?:,\s*"samples":\s*(\d+))?'
+    rb',\s*"now":\s*(\d+)(?:,\s*"events":\s*(\d+))?')
+
+FIELDS = ('now', 'counts', 'samples', 'events')
+
+SERIES = ('counts', 'samples', 'events', 'rate', 'calls', 'events_per_call', 'samples_per_event')
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def chunk_ranges(mm, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields (start, end) offsets covering mm in roughly chunk_size pieces that end on a newline."""
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = min(start + chunk_size, size)
+        if end < size:
+            newline = mm.find(b'\n', end)
+            end = size if newline == -1 else newline + 1
+        yield start, end
+        start = end
+
+
+def parse_chunk(buf):
+    """Returns {name: {field: int64 array}} for the COUNTER records in buf, in log order.
+    Fields missing from older log formats are -1."""
+    records = COUNTER_RE.findall(buf)
+    if not records:
+        return {}
+    table = np.array(records)
+    if table.dtype.itemsize < 2:
+        table = table.astype('S2')
+    table[table == b''] = b'-1'
+    names = table[:, 0]
+    columns = {'counts': table[:, 1].astype(np.int64), 'samples': table[:, 2].astype(np.int64),
+               'now': table[:, 3].astype(np.int64), 'events': table[:, 4].astype(np.int64)}
+    unique_names, inverse = np.unique(names, return_inverse=True)
+    parsed = {}
+    for index, name in enumerate(unique_names):
+        mask = inverse == index
+        parsed[name.decode('utf-8', 'replace')] = {field: columns[field][mask] for field in FIELDS}
+    return parsed
+
+
+def scan(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields parse_chunk() results for consecutive chunks of the log at path, memory mapping it."""
+    with open(path, 'rb') as fh:
+        try:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return
+        with mm:
+            for start, end in chunk_ranges(mm, chunk_size):
+                yield parse_chunk(mm[start:end])
+
+
+CACHE_SUFFIX = '.counters'
+CACHE_MAGIC = b'PERFCNT1'
+
+
+def cache_path(path):
+    return path + CACHE_SUFFIX
+
+
+def _log_key(path):
+    st = os.stat(path)
+    return {'log_size': st.st_size, 'log_mtime_ns': st.st_mtime_ns}
+
+
+def open_cache(path):
+    """Returns the blocks ({name: {field: array}} like scan() yields) of the cache next to the log at path,
+    with the arrays memory mapped, or None if there is no cache or it does not match the log's size and mtime.
+
+    The cache starts with CACHE_MAGIC, followed by blocks of little endian int64 arrays (one per FIELDS entry)
+    and ends with a json index, the index length as a little endian uint64 and CACHE_MAGIC again."""
+    try:
+        with open(cache_path(path), 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    blocks = None
+    try:
+        blocks = _cache_blocks(mm, path)
+    finally:
+        # the returned arrays keep using the mapping, a rejected cache is unmapped right away
+        if blocks is None:
+            mm.close()
+    return blocks
+
+
+def _cache_blocks(mm, path):
+    tail = len(CACHE_MAGIC) + 8
+    if len(mm) < len(CACHE_MAGIC) + tail or mm[:len(CACHE_MAGIC)] != CACHE_MAGIC or mm[-len(CACHE_MAGIC):] != CACHE_MAGIC:
+        return None
+    index_len, = struct.unpack('<Q', mm[-tail:-len(CACHE_MAGIC)])
+    try:
+        index = json.loads(mm[-tail - index_len:-tail].decode('utf-8'))
+        if index.get('fields') != list(FIELDS) or any(index.get(k) != v for k, v in _log_key(path).items()):
+            return None
+        blocks = []
+        for block in index['blocks']:
+            columns = {}
+            for name, (offset, count) in block.items():
+                columns[name] = {field: np.frombuffer(mm, dtype='<i8', count=count, offset=offset + i * 8 * count)
+                                 for i, field in enumerate(FIELDS)}
+            blocks.append(columns)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return blocks
+
+
+class CacheWriter:
+    """Writes the blocks of a cache (see open_cache) while the log is being parsed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.key = _log_key(path)
+        self.tmp = '{}.{}.tmp'.format(cache_path(path), os.getpid())
+        self.fh = open(self.tmp, 'wb')
+        self.fh.write(CACHE_MAGIC)
+        self.blocks = []
+
+    def add(self, columns):
+        block = {}
+        for name, fields in columns.items():
+            offset = self.fh.tell()
+            for field in FIELDS:
+                self.fh.write(np.ascontiguousarray(fields[field], dtype='<i8').tobytes())
+            block[name] = (offset, len(fields['now']))
+        self.blocks.append(block)
+
+    def commit(self):
+        index = dict(self.key, fields=list(FIELDS), blocks=self.blocks)
+        encoded = json.dumps(index).encode('utf-8')
+        self.fh.write(encoded)
+        self.fh.write(struct.pack('<Q', len(encoded)))
+        self.fh.write(CACHE_MAGIC)
+        self.fh.close()
+        # the log may have grown while it was parsed, only keep a cache that matches what was read
+        if _log_key(self.path) == self.key:
+            os.replace(self.tmp, cache_path(self.path))
+        else:
+            os.remove(self.tmp)
+
+    def abort(self):
+        self.fh.close()
+        os.remove(self.tmp)
+
+
+def scan_cached(path, chunk_size=DEFAULT_CHUNK_SIZE, use_cache=True):
+    """Like scan(), but reads the columnar cache next to the log when it is up to date,
+    and otherwise writes it while parsing so later runs can skip the text parse."""
+    if not use_cache:
+        yield from scan(path, chunk_size)
+        return
+    blocks = open_cache(path)
+    if blocks is not None:
+        yield from blocks
+        return
+    try:
+        writer = CacheWriter(path)
+    except OSError as err:
+        print("not caching parsed counters: {}".format(err), file=sys.stderr)
+        yield from scan(path, chunk_size)
+        return
+    try:
+        for chunk in scan(path, chunk_size):
+            writer.add(chunk)
+            yield chunk
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
+
+
+class RateAnchor:
+    """Turns a counter's records into intervals, carrying state across chunks.
+
+    Intervals are taken between anchors: the first record of every new highest `now`.
+    Records logged within the same millisecond are folded into the next interval
+    instead of being dropped, so no counts are lost."""
+
+    def __init__(self):
+        self.now = None
+        self.counts = None
+        self.samples = None
+
+    def intervals(self, now, counts, samples):
+        """Returns (end timestamps, interval ms, count deltas, sample deltas) for the intervals completed by these records."""
+        previous = np.int64(-1) if self.now is None else np.int64(self.now)
+        running_max = np.maximum.accumulate(np.concatenate(([previous], now)))
+        is_anchor = now > running_max[:-1]
+        anchor_now = now[is_anchor]
+        anchor_counts = counts[is_anchor]
+        anchor_samples = samples[is_anchor]
+        if len(anchor_now) == 0:
+            empty = np.empty(0)
+            return empty, empty, empty, empty
+        if self.now is not None:
+            anchor_now = np.concatenate(([self.now], anchor_now))
+            anchor_counts = np.concatenate(([self.counts], anchor_counts))
+            anchor_samples = np.concatenate(([self.samples], anchor_samples))
+        self.now = int(anchor_now[-1])
+        self.counts = int(anchor_counts[-1])
+        self.samples = int(anchor_samples[-1])
+        return (anchor_now[1:], np.diff(anchor_now).astype(np.float64), np.diff(anchor_counts).astype(np.float64),
+                np.diff(anchor_samples).astype(np.float64))
+
+
+class Distribution:
+    """Streaming distribution of float samples in bounded memory.
+
+    Count, mean, stddev, min and max are exact. Percentiles are exact while at most
+    exact_limit samples were seen, and come from a log-spaced histogram (about 1.2%
+    relative resolution) after that. Values <= 0 share a single bucket."""
+
+    EDGES = np.logspace(-3, 12, 15 * 200 + 1)
+
+    def __init__(self, exact_limit=100 * 1000):
+        self.exact_limit = exact_limit
+        self.exact = []
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.min_ts = None
+        self.max_ts = None
+        self.nonpositive = 0
+        self.histogram = np.zeros(len(self.EDGES) + 1, dtype=np.int64)
+
+    def add(self, values, timestamps=None):
+        if len(values) == 0:
+            return
+        n = len(values)
+        mean = float(np.mean(values))
+        m2 = float(np.sum((values - mean) ** 2))
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+
+        low = int(np.argmin(values))
+        high = int(np.argmax(values))
+        if self.min is None or values[low] < self.min:
+            self.min = float(values[low])
+            self.min_ts = None if timestamps is None else int(timestamps[low])
+        if self.max is None or values[high] > self.max:
+            self.max = float(values[high])
+            self.max_ts = None if timestamps is None else int(timestamps[high])
+
+        positive = values[values > 0]
+        self.nonpositive += n - len(positive)
+        self.histogram += np.bincount(np.searchsorted(self.EDGES, positive), minlength=len(self.histogram))
+        if self.exact is not None:
+            self.exact.append(np.asarray(values, dtype=np.float64))
+            if self.n > self.exact_limit:
+                self.exact = None
+
+    def stddev(self):
+        return (self.m2 / self.n) ** 0.5 if self.n > 0 else 0.0
+
+    def percentiles(self, qs):
+        """Returns the values at the given fractions (0..1) of the distribution."""
+        if self.n == 0:
+            return [0.0 for _ in qs]
+        if self.exact is not None:
+            return [float(v) for v in np.quantile(np.concatenate(self.exact), qs)]
+        cumulative = np.cumsum(self.histogram)
+        cumulative[0] += self.nonpositive
+        results = []
+        for q in qs:
+            rank = q * (self.n - 1) + 1
+            bucket = int(np.searchsorted(cumulative, rank))
+            if bucket == 0:
+                results.append(0.0)
+            elif bucket >= len(self.EDGES):
+                results.append(self.max)
+            else:
+                # geometric middle of the bucket, clamped to what was actually seen
+                value = (self.EDGES[bucket - 1] * self.EDGES[bucket]) ** 0.5
+                results.append(float(min(max(value, self.min), self.max)))
+        return results
+
+
+class WindowedThroughput:
+    """Count deltas bucketed into fixed time windows (keyed by now // window_ms)."""
+
+    def __init__(self, window_ms):
+        self.window_ms = window_ms
+        self.windows = {}
+
+    def add(self, end_ts, deltas):
+        if len(end_ts) == 0:
+            return
+        keys, inverse = np.unique(end_ts // self.window_ms, return_inverse=True)
+        sums = np.bincount(inverse, weights=deltas)
+        for key, value in zip(keys.tolist(), sums.tolist()):
+            self.windows[key] = self.windows.get(key, 0.0) + value
+
+    def rates(self):
+        """Returns (window start ms, per second throughput) for every window between the first and last, including empty ones."""
+        if not self.windows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        first = min(self.windows)
+        last = max(self.windows)
+        totals = np.zeros(last - first + 1)
+        for key, value in self.windows.items():
+            totals[key - first] = value
+        starts = (np.arange(first, last + 1) * self.window_ms).astype(np.int64)
+        return starts, totals * 1000.0 / self.window_ms
+
+
+class CounterStats:
+    """Everything perf-stats reports for one counter, updated chunk by chunk.
+
+    Besides the count rate, the samples (number of inc() calls) and events (size of
+    the inc() that was logged) fields give the call rate and the events per call.
+    Only every lograte-th call is logged, so the events field alone is a sample of
+    the batch sizes; events_per_call is exact from the count and sample deltas."""
+
+    def __init__(self, name, window_ms):
+        self.name = name
+        self.records = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.last_count = 0
+        self.last_samples = None
+        self.total_counts = 0.0
+        self.total_samples = 0.0
+        self.anchor = RateAnchor()
+        self.rates = Distribution()
+        self.call_rates = Distribution()
+        self.events_per_call = Distribution()
+        self.logged_events = Distribution()
+        self.log_intervals = Distribution()
+        self.throughput = WindowedThroughput(window_ms)
+
+    def has_samples(self):
+        return self.last_samples is not None
+
+    def add(self, columns):
+        now = columns['now']
+        counts = columns['counts']
+        samples = columns['samples']
+        events = columns['events']
+        self.records += len(now)
+        first = int(now.min())
+        last = int(now.max())
+        self.first_ts = first if self.first_ts is None else min(self.first_ts, first)
+        if self.last_ts is None or last >= self.last_ts:
+            self.last_ts = last
+            self.last_count = int(counts[now == last][-1])
+        end_ts, dt, dcounts, dsamples = self.anchor.intervals(now, counts, samples)
+        self.rates.add(1000.0 * dcounts / dt, end_ts)
+        self.throughput.add(end_ts, dcounts)
+
+        # older logs have neither samples nor events
+        if samples[-1] >= 0:
+            valid = dsamples > 0
+            self.call_rates.add(1000.0 * dsamples / dt, end_ts)
+            self.events_per_call.add(dcounts[valid] / dsamples[valid], end_ts[valid])
+            self.total_counts += float(dcounts.sum())
+            self.total_samples += float(dsamples.sum())
+            previous = samples[:1] if self.last_samples is None else np.array([self.last_samples])
+            steps = np.diff(np.concatenate((previous, samples)))
+            self.log_intervals.add(steps[steps > 0].astype(np.float64))
+            self.last_samples = int(samples[-1])
+        if events[-1] >= 0:
+            self.logged_events.add(events.astype(np.float64), now)
+
+    def lograte(self):
+        """The number of inc() calls between logged records, inferred from the samples field."""
+        return self.log_intervals.percentiles([0.5])[0] if self.log_intervals.n > 0 else None
+
+    def mean_events_per_call(self):
+        return self.total_counts / self.total_samples if self.total_samples > 0 else None
+
+    def adjusted_count(self):
+        """The last logged count plus the expected count of the calls made since then, which are not logged
+        until the next lograte-th call: on average (lograte - 1) / 2 calls of mean_events_per_call events."""
+        lograte = self.lograte()
+        per_call = self.mean_events_per_call()
+        if lograte is None or per_call is None:
+            return self.last_count
+        return self.last_count + (lograte - 1) / 2.0 * per_call
+
+
+def analyze(path, window_ms=1000, chunk_size=DEFAULT_CHUNK_SIZE, use_cache=True):
+    """Returns {counter name: CounterStats} for the log at path, in order of first appearance."""
+    stats = {}
+    for chunk in scan_cached(path, chunk_size, use_cache):
+        for name in sorted(chunk, key=lambda n: chunk[n]['now'][0]):
+            if name not in stats:
+                stats[name] = CounterStats(name, window_ms)
+            stats[name].add(chunk[name])
+    return stats
+
+
+def load(path, chunk_size=DEFAULT_CHUNK_SIZE, use_cache=True):
+    """Returns {counter name: {field: int64 array}} with all the COUNTER records of the log at path."""
+    pieces = {}
+    for chunk in scan_cached(path, chunk_size, use_cache):
+        for name, columns in chunk.items():
+            pieces.setdefault(name, []).append(columns)
+    return {name: {field: np.concatenate([c[field] for c in columns]) for field in FIELDS}
+            for name, columns in pieces.items()}
+
+
+def series(columns, kind):
+    """Returns (timestamps ms, values) of one SERIES kind for a counter's columns:
+    counts, samples and events are the logged fields, rate is counts per second, calls is
+    inc() calls per second, events_per_call and samples_per_event come from the count and
+    sample deltas between records."""
+    if kind in FIELDS:
+        return columns['now'], columns[kind]
+    end_ts, dt, dcounts, dsamples = RateAnchor().intervals(columns['now'], columns['counts'], columns['samples'])
+    if kind == 'rate':
+        return end_ts, 1000.0 * dcounts / dt
+    if kind == 'calls':
+        return end_ts, 1000.0 * dsamples / dt
+    if kind == 'events_per_call':
+        valid = dsamples > 0
+        return end_ts[valid], dcounts[valid] / dsamples[valid]
+    if kind == 'samples_per_event':
+        valid = dcounts > 0
+        return end_ts[valid], dsamples[valid] / dcounts[valid]
+    raise ValueError("unknown series {}".format(kind))
+
+
+def decimate(time, values, buckets=2000):
+    """Reduces a series to at most 2 * buckets points for plotting, keeping the minimum and maximum
+    of every one of buckets equal time slices so spikes and dips survive. Returns (time, values) sorted by time."""
+    if len(time) <= 2 * buckets:
+        return time, values
+    order = np.argsort(time, kind='stable')
+    time = time[order]
+    values = values[order]
+    span = max(int(time[-1] - time[0]), 1)
+    bucket = np.minimum((time - time[0]) * buckets // span, buckets - 1)
+    by_value = np.lexsort((values, bucket))
+    sorted_bucket = bucket[by_value]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_bucket[1:] != sorted_bucket[:-1])))
+    ends = np.concatenate((starts[1:], [len(by_value)])) - 1
+    keep = np.unique(np.concatenate((by_value[starts], by_value[ends])))
+    return time[keep], values[keep]
+
+
+class LogFollower:
+    """Tails a log that is still being written, like tail -F.
+
+    read() returns the complete lines appended since the previous call. A rotated log
+    (renamed and recreated, so the path points at a new inode) is read to its end
+    before switching to the new file, and a truncated log (copytruncate) is read again
+    from the start. Only an unterminated last line is carried between calls."""
+
+    def __init__(self, path, from_start=False, max_read=DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.max_read = max_read
+        self.fh = None
+        self.partial = b''
+        if self._open() and not from_start:
+            self.fh.seek(0, os.SEEK_END)
+
+    def _open(self):
+        try:
+            self.fh = open(self.path, 'rb')
+        except OSError:
+            self.fh = None
+        self.partial = b''
+        return self.fh is not None
+
+    def _rotated(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return st.st_ino != os.fstat(self.fh.fileno()).st_ino
+
+    def read(self):
+        if self.fh is None and not self._open():
+            return b''
+        if os.fstat(self.fh.fileno()).st_size < self.fh.tell():
+            self.fh.seek(0)
+            self.partial = b''
+        data = self.partial + self.fh.read(self.max_read)
+        if len(data) == len(self.partial) and self._rotated():
+            # the old file has been read to its end
+            self.fh.close()
+            lines = data + b'\n' if data else b''
+            self._open()
+            return lines
+        end = data.rfind(b'\n') + 1
+        self.partial = data[end:]
+        return data[:end]
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+
+class RollingCounter:
+    """Count and call rates of one counter over the last window_s seconds of log time, in constant memory:
+    the interval deltas are summed into a ring of one slot per second. The interval in which a count goes
+    backwards (a restarted node) is skipped instead of producing a negative rate."""
+
+    def __init__(self, name, window_s):
+        self.name = name
+        self.window_s = window_s
+        self.anchor = RateAnchor()
+        self.seconds = np.full(window_s, -1, dtype=np.int64)
+        self.counts = np.zeros(window_s)
+        self.calls = np.zeros(window_s)
+        self.first_second = None
+        self.last_ts = None
+        self.last_count = 0
+        self.last_samples = -1
+        self.records = 0
+
+    def add(self, columns):
+        now = columns['now']
+        counts = columns['counts']
+        samples = columns['samples']
+        self.records += len(now)
+        end_ts, dt, dcounts, dsamples = self.anchor.intervals(now, counts, samples)
+        valid = (dcounts >= 0) & (dsamples >= 0)
+        end_ts, dcounts, dsamples = end_ts[valid], dcounts[valid], dsamples[valid]
+        last = int(now.max())
+        if self.last_ts is None or last >= self.last_ts:
+            self.last_ts = last
+            self.last_count = int(counts[now == last][-1])
+            self.last_samples = int(samples[now == last][-1])
+        if len(end_ts) == 0:
+            return
+        keys, inverse = np.unique(end_ts // 1000, return_inverse=True)
+        count_sums = np.bincount(inverse, weights=dcounts)
+        call_sums = np.bincount(inverse, weights=dsamples)
+        if self.first_second is None:
+            self.first_second = int(keys[0])
+        for second, count, calls in zip(keys.tolist(), count_sums.tolist(), call_sums.tolist()):
+            slot = second % self.window_s
+            if self.seconds[slot] != second:
+                if self.seconds[slot] > second:
+                    # older than the window
+                    continue
+                self.seconds[slot] = second
+                self.counts[slot] = 0.0
+                self.calls[slot] = 0.0
+            self.counts[slot] += count
+            self.calls[slot] += calls
+
+    def rates(self, current_second):
+        """Returns (count/s, calls/s) over the window_s whole seconds before current_second, or None before there is any."""
+        if self.first_second is None:
+            return None
+        span = min(self.window_s, current_second - self.first_second)
+        if span <= 0:
+            return None
+        in_window = (self.seconds >= current_second - span) & (self.seconds < current_second)
+        return float(self.counts[in_window].sum()) / span, float(self.calls[in_window].sum()) / span
+
+
+class RollingRates:
+    """RollingCounter for every counter found in the text fed to add()."""
+
+    def __init__(self, window_s):
+        self.window_s = window_s
+        self.counters = {}
+        self.last_ts = None
+
+    def add(self, text):
+        chunk = parse_chunk(text)
+        for name in sorted(chunk, key=lambda n: chunk[n]['now'][0]):
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = RollingCounter(name, self.window_s)
+            counter.add(chunk[name])
+            if self.last_ts is None or counter.last_ts > self.last_ts:
+                self.last_ts = counter.last_ts
+
+    def snapshot(self):
+        """Returns [(name, count/s, calls/s, last count, last samples, last ms)] as of the newest record in the log,
+        so a stage that stopped logging while others carry on drops to 0."""
+        if self.last_ts is None:
+            return []
+        current_second = self.last_ts // 1000
+        rows = []
+        for name, counter in self.counters.items():
+            rates = counter.rates(current_second)
+            rate, calls = rates if rates is not None else (None, None)
+            rows.append((name, rate, calls, counter.last_count, counter.last_samples, counter.last_ts))
+        return rows
+
+
+UDP_STATS = (('InDatagrams', 'packets_received'), ('OutDatagrams', 'packets_sent'),
+             ('InErrors', 'receive_errors'), ('RcvbufErrors', 'rcvbuf_errors'))
+
+
+def read_udp_stats(path='/proc/net/snmp'):
+    """Returns {name: value} of the figures scripts/net-stats.sh reports, read from the kernel's Udp counters, or {} when unavailable."""
+    try:
+        with open(path) as fh:
+            rows = [line.split() for line in fh if line.startswith('Udp:')]
+    except OSError:
+        return {}
+    if len(rows) < 2:
+        return {}
+    values = dict(zip(rows[0][1:], rows[1][1:]))
+    return {name: int(values[field]) for field, name in UDP_STATS if field in values}
+
+
+def _prometheus_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(rates, udp_stats, window_s):
+    """Formats a RollingRates.snapshot() and read_udp_stats() in the Prometheus text exposition format."""
+    rows = rates.snapshot()
+    families = (
+        ('bitconch_counter_rate', 'gauge', 'Counts per second over the last {}s of the log.'.format(window_s), 1),
+        ('bitconch_counter_calls_rate', 'gauge', 'inc() calls per second over the last {}s of the log.'.format(window_s), 2),
+        ('bitconch_counter_count_total', 'counter', 'Last logged cumulative count.', 3),
+        ('bitconch_counter_samples_total', 'counter', 'Last logged number of inc() calls.', 4),
+        ('bitconch_counter_last_record_timestamp_seconds', 'gauge', 'Log time of the last record.', 5),
+    )
+    out = []
+    for metric, kind, help_text, column in families:
+        out.append('# HELP {} {}'.format(metric, help_text))
+        out.append('# TYPE {} {}'.format(metric, kind))
+        for row in rows:
+            value = row[column]
+            if value is None or (column == 4 and value < 0):
+                continue
+            if column == 5:
+                value = value / 1000.0
+            out.append('{}{{counter="{}"}} {}'.format(metric, _prometheus_label(row[0]),
+                                                      value if isinstance(value, int) else repr(float(value))))
+    for name, value in sorted(udp_stats.items()):
+        metric = 'bitconch_net_udp_{}_total'.format(name)
+        out.append('# HELP {} Udp {} from /proc/net/snmp.'.format(metric, name.replace('_', ' ')))
+        out.append('# TYPE {} counter'.format(metric))
+        out.append('{} {}'.format(metric, value))
+    return '\n'.join(out) + '\n'
+
+
+def log_names(paths):
+    """Short, unique names for the logs: the file names, or the paths if file names repeat."""
+    names = [os.path.basename(path) for path in paths]
+    if len(set(names)) < len(names):
+        return list(paths)
+    return names
+
+
+def _analyze_job(job):
+    path, window_ms, chunk_size, use_cache = job
+    return analyze(path, window_ms, chunk_size, use_cache)
+
+
+def analyze_many(paths, window_ms=1000, chunk_size=DEFAULT_CHUNK_SIZE, use_cache=True, jobs=None):
+    """analyze() of every log, parsed in a pool of jobs processes (default: one per CPU). Returns a list in the order of paths."""
+    job_list = [(path, window_ms, chunk_size, use_cache) for path in paths]
+    if len(paths) == 1 or jobs == 1:
+        return [_analyze_job(job) for job in job_list]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_analyze_job, job_list))
+
+
+def aligned_throughput(stats, window_ms):
+    """Puts the throughput of several CounterStats (with the same window_ms, possibly from different logs) on one
+    grid of windows. Logs share the wall clock `now`, so window n covers the same time in every log.
+    Returns (window start ms, 2d array of per second throughput with a row per CounterStats)."""
+    keys = [key for s in stats for key in s.throughput.windows]
+    if not keys:
+        return np.empty(0, dtype=np.int64), np.zeros((len(stats), 0))
+    first = min(keys)
+    last = max(keys)
+    table = np.zeros((len(stats), last - first + 1))
+    for row, s in enumerate(stats):
+        for key, value in s.throughput.windows.items():
+            table[row, key - first] = value
+    starts = (np.arange(first, last + 1) * window_ms).astype(np.int64)
+    return starts, table * 1000.0 / window_ms
+
+
+def stage_lag(upstream, downstream, max_lag):
+    """How many windows downstream's throughput trails upstream's: the shift in -max_lag..max_lag windows with the
+    highest correlation of the two series. Returns (lag in windows, correlation), or (None, None) if either is flat."""
+    n = len(upstream)
+    best = (None, None)
+    for lag in range(-max_lag, max_lag + 1):
+        if lag >= 0:
+            u, d = upstream[:n - lag], downstream[lag:]
+        else:
+            u, d = upstream[-lag:], downstream[:n + lag]
+        if len(u) < 3 or u.std() == 0 or d.std() == 0:
+            continue
+        corr = float(np.corrcoef(u, d)[0, 1])
+        if best[1] is None or corr > best[1]:
+            best = (lag, corr)
+    return best
+
+
+def bottlenecks(table, threshold=0.8, lags=None):
+    """Per window bottleneck of a pipeline whose stages are the rows of table, upstream first.
+
+    Every stage's throughput is taken relative to its own mean over the run, which makes stages counting
+    different units comparable. In each window the stage with the lowest ratio of its relative throughput
+    to that of the stage feeding it is the bottleneck, if that ratio is below threshold. lags (in windows,
+    see stage_lag) lines each stage up with what its upstream stage did lag windows earlier.
+    Returns (stage row per window or -1, ratio per window)."""
+    means = table.mean(axis=1, keepdims=True)
+    relative = np.divide(table, means, out=np.zeros_like(table), where=means > 0)
+    stages, windows = table.shape
+    if stages < 2:
+        return np.full(windows, -1), np.ones(windows)
+    upstream = relative[:-1].copy()
+    for row, lag in enumerate(lags or []):
+        if lag:
+            upstream[row] = np.roll(relative[row], lag)
+            # windows without a lagged upstream window compare with themselves
+            if lag > 0:
+                upstream[row, :lag] = relative[row + 1, :lag]
+            else:
+                upstream[row, lag:] = relative[row + 1, lag:]
+    ratios = np.divide(relative[1:], upstream, out=np.ones_like(upstream), where=upstream > 0)
+    worst = ratios.argmin(axis=0)
+    worst_ratio = ratios[worst, np.arange(windows)]
+    return np.where(worst_ratio < threshold, worst + 1, -1), worst_ratio